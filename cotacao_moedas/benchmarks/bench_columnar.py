@@ -0,0 +1,83 @@
+# cotacao_moedas/benchmarks/bench_columnar.py
+"""
+Benchmark da leitura de séries do banco: laço por modelo (implementação antiga de
+get_cotacoes_db_api) x caminho colunar (Cotacao.objects.columns()).
+
+    python benchmarks/bench_columnar.py --rows 100000
+
+Usa um SQLite temporário (via DATABASE_URL), então não toca no banco de desenvolvimento.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path):
+    sys.path.insert(0, str(PROJECT_DIR))
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cotacao_moedas.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def seed(rows):
+    from core.services import VatComplyService
+    start = date(1900, 1, 1)
+    VatComplyService().save_rates([
+        (start + timedelta(days=i), {'BRL': 5 + (i % 100) / 100, 'EUR': 0.9, 'JPY': 150 + (i % 10)})
+        for i in range(rows)
+    ])
+
+
+def legacy_loop(queryset):
+    formatted_data = {'dates': [], 'BRL': [], 'EUR': [], 'JPY': []}
+    for cotacao in queryset:
+        formatted_data['dates'].append(cotacao.data.strftime('%Y-%m-%d'))
+        formatted_data['BRL'].append(float(cotacao.valor_brl) if cotacao.valor_brl is not None else None)
+        formatted_data['EUR'].append(float(cotacao.valor_eur) if cotacao.valor_eur is not None else None)
+        formatted_data['JPY'].append(float(cotacao.valor_jpy) if cotacao.valor_jpy is not None else None)
+    return formatted_data
+
+
+def measure(label, func, rows, repeat):
+    best = min(_timed(func) for _ in range(repeat))
+    print(f"{label:<36} {best:8.3f}s  {rows / best:12,.0f} linhas/s")
+    return best
+
+
+def _timed(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_django(Path(tmpdir) / 'bench.sqlite3')
+        from core.columnar import HAS_NUMPY
+        from core.models import Cotacao
+        seed(args.rows)
+
+        queryset = Cotacao.objects.order_by('data')
+        print(f"{args.rows} linhas, NumPy {'disponível' if HAS_NUMPY else 'indisponível'}")
+        before = measure("antes: laço por modelo", lambda: legacy_loop(queryset.all()), args.rows, args.repeat)
+        measure("colunar: to_floats (Decimal)", lambda: queryset.all().columns(db_cast=False), args.rows, args.repeat)
+        after = measure("colunar: CAST no banco", lambda: queryset.all().columns(), args.rows, args.repeat)
+        print(f"ganho: {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
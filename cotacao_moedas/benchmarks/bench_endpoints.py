@@ -0,0 +1,310 @@
+# cotacao_moedas/benchmarks/bench_endpoints.py
+"""
+Benchmark de carga das APIs de cotações, offline: popula Cotacao (e TaxaCambio) com linhas
+sintéticas e dispara requisições concorrentes contra /api/cotacoes/db/ e /api/cotacoes/,
+esta última com a VatComply substituída pelo FakeVatComplyServer (latência configurável).
+Mede requisições/s, latência p50/p95/p99 e o pico de memória (RSS) do processo, e grava
+tudo em JSON para comparar commits.
+
+    python benchmarks/bench_endpoints.py --rows 100000 --requests 500 --concurrency 8 -o atual.json
+    python benchmarks/bench_endpoints.py --rows 100000 -o novo.json --compare atual.json
+
+Cenários (--scenarios):
+  db-range   períodos aleatórios de --window-days dias (maioria fora do cache de séries)
+  db-cached  o mesmo período repetido (servido pelo cache de séries)
+  db-stream  períodos de --stream-days dias com stream=1
+  db-lttb    períodos de --stream-days dias reduzidos com max_points=500
+  api-cold   /api/cotacoes/ em semanas ainda não salvas: cada requisição vai ao servidor falso
+  api-warm   /api/cotacoes/ nas mesmas semanas, já salvas (lidas do banco)
+
+Os dias sintéticos terminam em SEED_END e as semanas de api-* vêm logo depois, no passado,
+como numa base real em que a ingestão só acrescenta dias no fim da série. Acima de
+~735 mil linhas o período populado passa de SEED_END e os cenários api-* são ignorados.
+
+As requisições passam por toda a pilha do Django (middlewares, views, ORM), chamadas
+em processo pelo django.test.Client em um pool de threads, sem o custo de um servidor HTTP
+real. Usa um SQLite temporário (via DATABASE_URL) e um cache em diretório temporário, então
+não toca no banco de desenvolvimento. O pico de RSS é o do processo inteiro até o fim do
+cenário (inclui a carga dos dados).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = ('db-range', 'db-cached', 'db-stream', 'db-lttb', 'api-cold', 'api-warm')
+# As linhas sintéticas terminam aqui (contando para trás); as semanas de api-* vêm depois
+SEED_END = date(2015, 12, 31)
+API_START = date(2016, 1, 4) # Segunda-feira
+API_END = date(2024, 12, 27)
+SEED_BATCH_SIZE = 20_000
+
+
+def setup_django(tmpdir):
+    sys.path.insert(0, str(PROJECT_DIR))
+    os.environ['DATABASE_URL'] = f"sqlite:///{Path(tmpdir) / 'bench.sqlite3'}"
+    os.environ['CACHE_DIR'] = str(Path(tmpdir) / 'cache')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cotacao_moedas.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def seed_start(rows):
+    """
+    Primeiro dia populado: `rows` dias terminando em SEED_END, ou 01/01/0001 se não couberem.
+    """
+    available = (SEED_END - date.min).days + 1
+    return SEED_END - timedelta(days=rows - 1) if rows <= available else date.min
+
+
+def seed(start, rows):
+    """
+    Grava `rows` dias consecutivos a partir de `start` com o carregador em massa da
+    importação (o mesmo caminho de import_cotacoes), em lotes, e calcula os indicadores
+    móveis do fim do período. Retorna o tempo gasto.
+    """
+    from core.importer import BulkLoader
+    loader = BulkLoader('update')
+    started = time.perf_counter()
+    for offset in range(0, rows, SEED_BATCH_SIZE):
+        loader.load([
+            (start + timedelta(days=i), {
+                'BRL': 5 + (i % 100) / 100, 'EUR': 0.9 + (i % 7) / 100, 'JPY': 150 + (i % 10), 'GBP': 0.78,
+            })
+            for i in range(offset, min(offset + SEED_BATCH_SIZE, rows))
+        ])
+    seed_indicators()
+    return time.perf_counter() - started
+
+
+def seed_indicators():
+    """
+    Indicadores móveis da série inteira, como a migração 0008 deixa uma base existente. As
+    requisições só marcam o recálculo (IndicadorPendente); quem recalcula é o worker.
+    """
+    from core.analytics import update_indicators
+    update_indicators()
+
+
+def percentile(sorted_values, fraction):
+    """
+    Percentil por posição mais próxima de uma lista já ordenada.
+    """
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_scenario(urls, concurrency):
+    """
+    Executa as requisições de `urls` com `concurrency` threads (um Client por thread).
+    Retorna as métricas do cenário.
+    """
+    import threading
+    from django.test import Client
+
+    local = threading.local()
+
+    def request(url):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client(HTTP_HOST='localhost')
+        started = time.perf_counter()
+        response = client.get(url)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        elapsed = time.perf_counter() - started
+        return elapsed, response.status_code, size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(request, urls))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for elapsed, _, _ in results)
+    errors = sum(1 for _, status, _ in results if status != 200)
+    return {
+        'requests': len(results),
+        'errors': errors,
+        'wall_seconds': round(wall, 4),
+        'requests_per_second': round(len(results) / wall, 2) if wall else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3),
+        },
+        'mean_response_bytes': round(sum(size for _, _, size in results) / len(results)),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def db_urls(scenario, first_day, args, rng):
+    last_start = max(0, args.rows - args.window_days)
+    urls = []
+    for _ in range(args.requests):
+        if scenario == 'db-cached':
+            start, days, extra = first_day, args.window_days, ''
+        elif scenario in ('db-stream', 'db-lttb'):
+            start = first_day + timedelta(days=rng.randint(0, max(0, args.rows - args.stream_days)))
+            days, extra = args.stream_days, '&stream=1' if scenario == 'db-stream' else '&max_points=500'
+        else:
+            start = first_day + timedelta(days=rng.randint(0, last_start))
+            days, extra = args.window_days, ''
+        end = start + timedelta(days=days - 1)
+        urls.append(f'/api/cotacoes/db/?start_date={start}&end_date={end}{extra}')
+    return urls
+
+
+def api_urls(count):
+    """
+    Semanas úteis (segunda a sexta) a partir de API_START, em ordem.
+    """
+    urls = []
+    for week in range(count):
+        start = API_START + timedelta(weeks=week)
+        urls.append(f'/api/cotacoes/?start_date={start}&end_date={start + timedelta(days=4)}')
+    return urls
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path, threshold):
+    """
+    Compara com um resultado anterior. Retorna True se algum cenário piorou mais que `threshold`
+    em requisições/s ou p95.
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nComparação com {baseline_path} (commit {baseline.get('commit')}):")
+    changed = sorted(key for key, value in current['params'].items() if baseline.get('params', {}).get(key) != value)
+    if changed:
+        print(f"  atenção: parâmetros diferentes ({', '.join(changed)}), comparação aproximada")
+    regressed = False
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        rps_change = result['requests_per_second'] / before['requests_per_second'] - 1
+        p95_change = result['latency_ms']['p95'] / before['latency_ms']['p95'] - 1
+        worse = rps_change < -threshold or p95_change > threshold
+        regressed = regressed or worse
+        print(f"  {name:<10} req/s {rps_change:+7.1%}   p95 {p95_change:+7.1%}{'   REGRESSÃO' if worse else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000, help="Dias sintéticos em Cotacao (10k a 1M).")
+    parser.add_argument('--requests', type=int, default=200, help="Requisições por cenário db-*.")
+    parser.add_argument('--api-requests', type=int, default=100, help="Requisições (semanas) por cenário api-*.")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help="Latência do servidor falso da VatComply (s).")
+    parser.add_argument('--window-days', type=int, default=365, help="Tamanho dos períodos de db-range/db-cached.")
+    parser.add_argument('--stream-days', type=int, default=3650, help="Tamanho dos períodos de db-stream/db-lttb.")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Cenários separados por vírgula.")
+    parser.add_argument('--seed', type=int, default=42, help="Semente dos períodos aleatórios.")
+    parser.add_argument('-o', '--output', help="Arquivo JSON de resultado.")
+    parser.add_argument('--compare', help="JSON de uma execução anterior para comparar.")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Piora tolerada na comparação (padrão 10%%).")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"cenário(s) desconhecido(s): {', '.join(sorted(unknown))}")
+    if min(args.rows, args.requests, args.api_requests, args.concurrency) < 1:
+        parser.error("--rows, --requests, --api-requests e --concurrency devem ser maiores que zero")
+    max_weeks = (API_END - API_START).days // 7 + 1
+    if args.api_requests > max_weeks:
+        parser.error(f"--api-requests deve ser no máximo {max_weeks} (uma semana distinta por requisição)")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_django(tmpdir)
+        import django
+        from django.db import connection
+        from core.fake_vatcomply import FakeVatComplyServer
+        from core.services import VatComplyService
+
+        first_day = seed_start(args.rows)
+        seed_seconds = seed(first_day, args.rows)
+        print(f"{args.rows} linhas carregadas em {seed_seconds:.1f}s ({connection.vendor})")
+        if first_day + timedelta(days=args.rows - 1) > SEED_END and any(name.startswith('api-') for name in scenarios):
+            print("Período populado passa de SEED_END: cenários api-* ignorados.")
+            scenarios = [name for name in scenarios if not name.startswith('api-')]
+
+        result = {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'params': {
+                key: getattr(args, key)
+                for key in ('rows', 'requests', 'api_requests', 'concurrency', 'latency', 'window_days', 'stream_days', 'seed')
+            },
+            'seed_seconds': round(seed_seconds, 2),
+            'scenarios': {},
+        }
+        rng = random.Random(args.seed)
+        with FakeVatComplyServer(latency=args.latency, supports_range=False) as server:
+            VatComplyService.BASE_URL = server.rates_url
+            VatComplyService.RANGE_URL = None
+            for name in scenarios:
+                if name.startswith('db-'):
+                    urls = db_urls(name, first_day, args, rng)
+                else:
+                    urls = api_urls(args.api_requests)
+                    if name == 'api-warm' and 'api-cold' not in result['scenarios']:
+                        run_scenario(urls, args.concurrency) # Preenche o banco antes de medir
+                requests_before = server.requests
+                scenario = run_scenario(urls, args.concurrency)
+                if name.startswith('api-'):
+                    scenario['upstream_requests'] = server.requests - requests_before
+                result['scenarios'][name] = scenario
+                latency = scenario['latency_ms']
+                print(
+                    f"{name:<10} {scenario['requests_per_second']:9.1f} req/s  "
+                    f"p50 {latency['p50']:8.2f}ms  p95 {latency['p95']:8.2f}ms  p99 {latency['p99']:8.2f}ms  "
+                    f"RSS {scenario['peak_rss_mb']:7.1f}MB  erros {scenario['errors']}"
+                )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Resultado gravado em {args.output}")
+    if args.compare and compare(result, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
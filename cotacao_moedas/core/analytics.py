@@ -0,0 +1,196 @@
+# cotacao_moedas/core/analytics.py
+"""
+Indicadores de janela móvel das séries de Cotacao: média móvel simples (SMA), média móvel
+exponencial (EMA), desvio padrão móvel e retorno diário.
+
+Os indicadores são calculados com acumuladores O(1) por dia (média e soma dos quadrados dos
+desvios da janela, atualizadas pelo método de Welford), então uma série de n dias custa O(n).
+Ficam gravados em IndicadorCotacao, uma linha por (data, moeda, janela).
+
+A gravação de cotações não recalcula nada: só registra em IndicadorPendente o primeiro dia
+alterado (mark_pending). O worker de ingestão consome o marcador (process_pending) e estende
+a série a partir desse dia: o estado anterior (últimos valores da janela e a EMA do dia
+anterior) é reconstruído do banco e nada antes dele é recalculado. As linhas são gravadas
+com upsert, então recálculos simultâneos não colidem na restrição (moeda, janela, data).
+"""
+import math
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Least
+
+from .models import Cotacao, IndicadorCotacao, IndicadorPendente
+
+BULK_BATCH_SIZE = 500
+PENDING_ID = 1
+
+
+def get_windows():
+    """
+    Janelas (em dias com cotação) mantidas em IndicadorCotacao (settings.COTACOES_ANALYTICS_WINDOWS).
+    """
+    return sorted(set(getattr(settings, 'COTACOES_ANALYTICS_WINDOWS', (5, 21))))
+
+
+class RollingIndicators:
+    """
+    Acumulador de uma janela móvel: push(valor) devolve os indicadores do dia em O(1).
+    `history` são os valores anteriores (do mais antigo para o mais recente) e `ema` a EMA
+    do último deles, para continuar uma série já calculada.
+    """
+
+    def __init__(self, window, history=(), ema=None):
+        self.window = window
+        self.alpha = 2.0 / (window + 1)
+        self.values = deque(maxlen=window)
+        self.mean = 0.0
+        self.m2 = 0.0 # Soma dos quadrados dos desvios em relação à média da janela
+        self.ema = ema
+        self.last = None
+        for value in history:
+            self._append(value)
+
+    def _append(self, value):
+        if len(self.values) == self.window:
+            # Janela cheia: troca o valor mais antigo pelo novo sem subtrair somas grandes
+            oldest = self.values[0]
+            self.values.append(value)
+            mean = self.mean + (value - oldest) / self.window
+            self.m2 += (value - oldest) * (value - mean + oldest - self.mean)
+            self.mean = mean
+        else:
+            self.values.append(value)
+            delta = value - self.mean
+            self.mean += delta / len(self.values)
+            self.m2 += delta * (value - self.mean)
+        self.last = value
+
+    def push(self, value):
+        previous = self.last
+        self._append(value)
+        self.ema = value if self.ema is None else self.alpha * value + (1 - self.alpha) * self.ema
+
+        count = len(self.values)
+        full = count == self.window
+        std = None
+        if full and count > 1:
+            std = math.sqrt(max(self.m2 / (count - 1), 0.0)) # max: erro de arredondamento não pode dar raiz de negativo
+        return {
+            'sma': self.mean if full else None,
+            'ema': self.ema,
+            'std': std,
+            'return': value / previous - 1 if previous else None,
+        }
+
+
+def rolling_indicators(values, window):
+    """
+    Indicadores de uma série inteira em O(n). Retorna uma lista de dicionários alinhada com `values`.
+    """
+    rolling = RollingIndicators(window)
+    return [rolling.push(value) for value in values]
+
+
+def mark_pending(from_date):
+    """
+    Registra que os indicadores precisam ser recalculados a partir de `from_date`. Barato
+    (um insert ignorado se já houver marcador e um UPDATE): chamado na transação de cada gravação.
+    """
+    IndicadorPendente.objects.bulk_create(
+        [IndicadorPendente(pk=PENDING_ID, desde=from_date)], ignore_conflicts=True,
+    )
+    IndicadorPendente.objects.filter(pk=PENDING_ID).update(
+        desde=Least('desde', Value(from_date)), versao=F('versao') + 1,
+    )
+
+
+def pending_from():
+    """
+    Primeiro dia com indicadores desatualizados, ou None se não há recálculo pendente.
+    """
+    return IndicadorPendente.objects.filter(pk=PENDING_ID).values_list('desde', flat=True).first()
+
+
+def process_pending():
+    """
+    Recalcula os indicadores a partir do marcador pendente e o apaga. Se outra gravação
+    marcou o registro durante o recálculo (`versao` mudou), ele fica para a próxima chamada.
+    Retorna o número de linhas gravadas, ou None se não havia pendência.
+    """
+    pending = IndicadorPendente.objects.filter(pk=PENDING_ID).values_list('desde', 'versao').first()
+    if pending is None:
+        return None
+    from_date, version = pending
+    count = update_indicators(from_date)
+    IndicadorPendente.objects.filter(pk=PENDING_ID, versao=version).delete()
+    return count
+
+
+def update_indicators(from_date=None, windows=None):
+    """
+    Recalcula os indicadores de todas as moedas a partir de `from_date` (inclusive) até o
+    fim da série e grava em IndicadorCotacao. Sem from_date (ou se ainda não houver
+    indicadores antes dele) a série é calculada desde o início.
+    Retorna o número de linhas gravadas.
+    """
+    windows = windows or get_windows()
+    if not windows:
+        return 0
+    count = 0
+    with transaction.atomic():
+        for currency, field in Cotacao.CURRENCY_FIELDS.items():
+            objs = _currency_indicators(currency, field, from_date, windows)
+            IndicadorCotacao.objects.bulk_create(
+                objs,
+                batch_size=BULK_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['moeda', 'janela', 'data'],
+                update_fields=['sma', 'ema', 'desvio_padrao', 'retorno'],
+            )
+            count += len(objs)
+    return count
+
+
+def _currency_indicators(currency, field, from_date, windows):
+    present = Cotacao.objects.filter(**{f'{field}__isnull': False}).order_by()
+    history = []
+    previous_ema = {}
+    if from_date is not None:
+        history = list(
+            present.filter(data__lt=from_date).order_by('-data').values_list('data', field)[:max(windows)]
+        )[::-1]
+    if history:
+        previous_ema = dict(
+            IndicadorCotacao.objects.filter(moeda=currency, data=history[-1][0], janela__in=windows)
+            .values_list('janela', 'ema')
+        )
+        if len(previous_ema) < len(windows):
+            # Indicadores ainda não calculados até aqui: calcula a série desde o início
+            history, previous_ema, from_date = [], {}, None
+
+    stale = IndicadorCotacao.objects.filter(moeda=currency, janela__in=windows)
+    rows = present.order_by('data').values_list('data', field)
+    if from_date is not None:
+        stale = stale.filter(data__gte=from_date)
+        rows = rows.filter(data__gte=from_date)
+    # Os demais dias do trecho são regravados por upsert: só saem os que perderam a cotação
+    stale.exclude(data__in=rows.values('data')).delete()
+
+    history_values = [float(value) for _, value in history]
+    rollings = {
+        window: RollingIndicators(window, history_values[-window:], previous_ema.get(window))
+        for window in windows
+    }
+    objs = []
+    for day, value in rows.iterator(chunk_size=2000):
+        value = float(value)
+        for window, rolling in rollings.items():
+            indicators = rolling.push(value)
+            objs.append(IndicadorCotacao(
+                data=day, moeda=currency, janela=window,
+                sma=indicators['sma'], ema=indicators['ema'],
+                desvio_padrao=indicators['std'], retorno=indicators['return'],
+            ))
+    return objs
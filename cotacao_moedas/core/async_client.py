@@ -0,0 +1,216 @@
+# cotacao_moedas/core/async_client.py
+"""
+Cliente assíncrono da VatComply, para as views async servidas por ASGI.
+
+AsyncVatComplyService reaproveita toda a lógica de VatComplyService (cache no banco, TTL de
+"hoje", calendário, extração das taxas, circuit breaker) e troca só o transporte: as datas
+ausentes de um período são buscadas em paralelo com asyncio.gather, limitadas por um
+semáforo por host, e as leituras do banco usam o ORM assíncrono. Assim uma requisição
+esperando a API externa não ocupa uma thread do servidor.
+
+Com o httpx instalado as requisições usam um httpx.AsyncClient (pool keep-alive por event
+loop); sem ele cada busca roda o fluxo síncrono numa thread (asyncio.to_thread), com o
+mesmo limite de concorrência.
+"""
+import asyncio
+import logging
+import weakref
+from contextlib import asynccontextmanager, nullcontext
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+try:
+    import httpx
+except ImportError: # httpx é opcional
+    httpx = None
+
+from . import metrics
+from .models import aiterate
+from .services import CircuitOpenError, VatComplyService
+
+HAS_HTTPX = httpx is not None
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncVatComplyService(VatComplyService):
+    """
+    VatComplyService com get_rates_for_period/get_daily_rates assíncronos
+    (aget_rates_for_period/aget_daily_rates). Aceita os mesmos parâmetros.
+    """
+    # Estado por event loop: semáforos por host, clientes HTTP e buscas em andamento
+    _async_semaphores = weakref.WeakKeyDictionary()
+    _async_clients = weakref.WeakKeyDictionary()
+    _async_flights = weakref.WeakKeyDictionary()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Limite próprio desta instância, um semáforo por event loop
+        self._async_local_semaphores = weakref.WeakKeyDictionary()
+
+    def _async_semaphore(self, url):
+        """
+        Semáforo do host da URL no event loop atual (um por host, dimensionado por
+        host_connection_limit), criando-o na primeira vez.
+        """
+        loop = asyncio.get_running_loop()
+        semaphores = self._async_semaphores.setdefault(loop, {})
+        host = urlsplit(url).netloc
+        semaphore = semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.host_connection_limit())
+            semaphores[host] = semaphore
+        return semaphore
+
+    def _async_local_semaphore(self):
+        """
+        Limite próprio desta instância no event loop atual, ou None se não for mais restrito
+        que o teto do host.
+        """
+        if self._local_semaphore is None:
+            return None
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_local_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_connections_per_host)
+            self._async_local_semaphores[loop] = semaphore
+        return semaphore
+
+    @asynccontextmanager
+    async def _async_connection_slot(self, url):
+        """
+        Versão assíncrona de _connection_slot: limite da instância e depois o do host.
+        """
+        local = self._async_local_semaphore()
+        async with local if local is not None else nullcontext(), self._async_semaphore(url):
+            yield
+
+    def get_async_client(self):
+        """
+        httpx.AsyncClient do event loop atual (pool keep-alive compartilhado pelas requisições).
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            size = max(self.MAX_WORKERS, self.host_connection_limit())
+            client = httpx.AsyncClient(limits=httpx.Limits(max_connections=size, max_keepalive_connections=size))
+            self._async_clients[loop] = client
+        return client
+
+    async def _aget(self, url, params):
+        """
+        Versão assíncrona de _get: mesmo timeout, retentativas com backoff e circuit breaker.
+        """
+        breaker = self._circuit_breaker(url)
+        breaker.before_call()
+        client = self.get_async_client()
+        timeout = httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        response = None
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff_delay(attempt - 1))
+            try:
+                async with self._async_connection_slot(url):
+                    with metrics.timer('cotacoes_upstream_request_seconds'):
+                        response = await client.get(url, params=params, timeout=timeout)
+            except httpx.TransportError as e: # Falhas de conexão e timeouts
+                metrics.inc('cotacoes_upstream_requests_total', status='error')
+                response, error = None, e
+                continue
+            metrics.inc('cotacoes_upstream_requests_total', status=response.status_code)
+            if response.status_code not in self.RETRY_STATUSES:
+                breaker.record_success()
+                return response
+        breaker.record_failure()
+        if response is not None:
+            return response
+        raise error
+
+    async def aget_daily_rates(self, target_date, persist=True):
+        """
+        Versão assíncrona de get_daily_rates. Buscas simultâneas da mesma data no mesmo
+        event loop fazem uma única requisição.
+        """
+        key = f"{urlsplit(self.base_url).netloc}:{target_date.isoformat()}"
+        loop = asyncio.get_running_loop()
+        flights = self._async_flights.setdefault(loop, {})
+        future = flights.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = loop.create_future()
+        flights[key] = future
+        try:
+            result = await self._afetch_daily_rates(key, target_date)
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del flights[key]
+        if result and persist:
+            await sync_to_async(self.save_rates)([(target_date, result['rates'])])
+        return result
+
+    async def _afetch_daily_rates(self, key, target_date):
+        """
+        Entre processos, coordena a busca pelo lock no cache (settings.COTACOES_SINGLE_FLIGHT_SHARED).
+        Sem httpx, roda o fluxo síncrono numa thread, dentro do semáforo do host.
+        """
+        if not HAS_HTTPX:
+            async with self._async_connection_slot(self.base_url):
+                return await asyncio.to_thread(self._fetch_daily_rates_shared, key, target_date)
+        if getattr(settings, 'COTACOES_SINGLE_FLIGHT_SHARED', False):
+            return await self._shared_single_flight.ado(key, self._arequest_daily_rates, target_date)
+        return await self._arequest_daily_rates(target_date)
+
+    async def _arequest_daily_rates(self, target_date):
+        """
+        Versão assíncrona de _fetch_daily_rates (requisição com httpx, sem salvar).
+        """
+        date_str = target_date.strftime('%Y-%m-%d')
+        response = None
+        try:
+            logger.debug("Buscando cotações na API externa date=%s", date_str)
+            response = await self._aget(self.base_url, {'base': self.BASE_CURRENCY, 'date': date_str})
+            response.raise_for_status()
+            return self._daily_result(response.json(), date_str)
+        except (httpx.HTTPError, CircuitOpenError, ValueError) as e:
+            logger.warning(
+                "Erro na requisição HTTP date=%s status=%s: %s",
+                date_str, response.status_code if response is not None else None, e,
+            )
+            return None
+
+    async def afetch_rates(self, dates):
+        """
+        Versão assíncrona de fetch_rates: as datas são buscadas ao mesmo tempo (asyncio.gather),
+        limitadas pelo semáforo do host. Com range_url, a busca por janelas (poucas chamadas)
+        roda numa thread com o fluxo síncrono.
+        Retorna uma lista alinhada com `dates` (None para os dias sem cotação).
+        """
+        if not dates:
+            return []
+        if self.range_url:
+            return await asyncio.to_thread(self.fetch_rates, dates)
+        return list(await asyncio.gather(*(self.aget_daily_rates(day, persist=False) for day in dates)))
+
+    async def aget_rates_for_period(self, start_date, end_date, fetch_missing=True):
+        """
+        Versão assíncrona de get_rates_for_period: lê o banco com o ORM assíncrono, busca as
+        datas ausentes em paralelo e salva tudo num único upsert (save_rates numa thread).
+        """
+        cached = {}
+        if self.use_db_cache or not fetch_missing:
+            rows = [row async for row in aiterate(self._cached_rates_queryset(start_date, end_date))]
+            cached = self._cached_rates_from_rows(rows)
+        business_days, results, missing_dates = self._plan_period(start_date, end_date, cached, fetch_missing)
+        fetched_rates = await self.afetch_rates(missing_dates)
+        fetched = self._merge_fetched(results, missing_dates, fetched_rates)
+        if fetched:
+            await sync_to_async(self.save_rates)(fetched)
+        return [results[day] for day in business_days if day in results]
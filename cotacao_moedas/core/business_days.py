@@ -0,0 +1,255 @@
+# cotacao_moedas/core/business_days.py
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+
+
+def easter_sunday(year):
+    """
+    Domingo de Páscoa (calendário gregoriano, algoritmo de Meeus/Jones/Butcher).
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def target_holidays(year):
+    """
+    Feriados do TARGET (BCE), dias em que não há cotação de referência do euro,
+    que é a fonte dos dados da VatComply.
+    """
+    easter = easter_sunday(year)
+    return {
+        date(year, 1, 1),
+        easter - timedelta(days=2),  # Sexta-feira Santa
+        easter + timedelta(days=1),  # Segunda-feira de Páscoa
+        date(year, 5, 1),
+        date(year, 12, 25),
+        date(year, 12, 26),
+    }
+
+
+def brazil_holidays(year):
+    """
+    Feriados nacionais com pregão fechado na B3.
+    """
+    easter = easter_sunday(year)
+    holidays = {
+        date(year, 1, 1),
+        easter - timedelta(days=48),  # Carnaval (segunda)
+        easter - timedelta(days=47),  # Carnaval (terça)
+        easter - timedelta(days=2),   # Sexta-feira Santa
+        date(year, 4, 21),
+        date(year, 5, 1),
+        easter + timedelta(days=60),  # Corpus Christi
+        date(year, 9, 7),
+        date(year, 10, 12),
+        date(year, 11, 2),
+        date(year, 11, 15),
+        date(year, 12, 25),
+    }
+    if year >= 2024:
+        holidays.add(date(year, 11, 20))  # Consciência Negra
+    return holidays
+
+
+# Conjuntos de feriados disponíveis (nome -> função ano -> set de datas)
+HOLIDAY_SETS = {
+    'none': lambda year: set(),
+    'target': target_holidays,
+    'br': brazil_holidays,
+}
+
+
+def load_holidays_file(path):
+    """
+    Lê um arquivo de feriados com uma data YYYY-MM-DD por linha ('#' inicia comentário).
+    """
+    holidays = set()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                holidays.add(date.fromisoformat(line))
+    return holidays
+
+
+def _shift(day, days):
+    """
+    `day` deslocado de `days` dias, limitado a [date.min, date.max].
+    """
+    try:
+        return day + timedelta(days=days)
+    except OverflowError:
+        return date.max if days > 0 else date.min
+
+
+class BusinessCalendar:
+    """
+    Calendário de dias úteis (Seg-Sex menos feriados) com índice pré-calculado.
+    Os dias úteis de [first_year, last_year] ficam em uma lista ordenada, então
+    "dias úteis em [a, b]" é respondido com duas buscas binárias (bisect) em vez de
+    um laço dia a dia. Datas fora do índice fazem o índice crescer automaticamente, até
+    MAX_INDEX_YEARS anos; além disso as consultas são calculadas sem materializar os dias
+    (contagem aritmética de dias de semana menos os feriados dos anos envolvidos).
+    """
+    # Anos mantidos no índice, no máximo (~26 mil dias úteis por século)
+    MAX_INDEX_YEARS = 100
+
+    def __init__(self, holidays=None, holiday_rule=None, first_year=1999, last_year=None):
+        """
+        holidays: conjunto fixo de datas de feriado.
+        holiday_rule: função ano -> set de feriados (ex.: target_holidays).
+        """
+        self.holidays = set(holidays or ())
+        self.holiday_rule = holiday_rule
+        self._lock = threading.Lock()
+        self._build(date(first_year, 1, 1), date(last_year or date.today().year + 1, 12, 31))
+
+    def _holidays_between(self, first_year, last_year):
+        holidays = {day for day in self.holidays if first_year <= day.year <= last_year}
+        if self.holiday_rule is not None:
+            for year in range(first_year, last_year + 1):
+                holidays |= self.holiday_rule(year)
+        return holidays
+
+    def _build(self, first, last):
+        holidays = self._holidays_between(first.year, last.year)
+        days = []
+        for ordinal in range(first.toordinal(), last.toordinal() + 1): # Sem passar de date.max
+            day = date.fromordinal(ordinal)
+            if day.weekday() < 5 and day not in holidays:
+                days.append(day)
+        self._first, self._last, self._days = first, last, days
+
+    def _ensure_covers(self, start_date, end_date):
+        """
+        True se [start_date, end_date] está no índice, crescendo-o se ele continuar dentro
+        de MAX_INDEX_YEARS anos; False se o período fica (em parte) fora do índice.
+        """
+        if start_date >= self._first and end_date <= self._last:
+            return True
+        with self._lock:
+            first = min(self._first, date(start_date.year, 1, 1))
+            last = max(self._last, date(end_date.year, 12, 31))
+            if last.year - first.year >= self.MAX_INDEX_YEARS:
+                return False
+            if first != self._first or last != self._last:
+                self._build(first, last)
+        return True
+
+    def _outside(self, start_date, end_date):
+        """
+        Trechos (início, fim) de [start_date, end_date] antes e depois do índice.
+        """
+        first, last = self._first, self._last
+        parts = []
+        if start_date < first:
+            parts.append((start_date, min(end_date, _shift(first, -1))))
+        if end_date > last:
+            parts.append((max(start_date, _shift(last, 1)), end_date))
+        return parts
+
+    def _count_outside(self, start_date, end_date):
+        weeks, rest = divmod((end_date - start_date).days + 1, 7)
+        weekday = start_date.weekday()
+        weekdays = weeks * 5 + sum(1 for i in range(rest) if (weekday + i) % 7 < 5)
+        holidays = self._holidays_between(start_date.year, end_date.year)
+        return weekdays - sum(1 for day in holidays if start_date <= day <= end_date and day.weekday() < 5)
+
+    def _trading_days_outside(self, start_date, end_date):
+        holidays = self._holidays_between(start_date.year, end_date.year)
+        days = map(date.fromordinal, range(start_date.toordinal(), end_date.toordinal() + 1))
+        return [day for day in days if day.weekday() < 5 and day not in holidays]
+
+    def trading_days(self, start_date, end_date):
+        """
+        Lista ordenada de dias úteis entre start_date e end_date, inclusive.
+        """
+        if end_date < start_date:
+            return []
+        self._ensure_covers(start_date, end_date)
+        days = self._days
+        inside = days[bisect_left(days, start_date):bisect_right(days, end_date)]
+        before, after = [], []
+        for first, last in self._outside(start_date, end_date):
+            (before if first < self._first else after).extend(self._trading_days_outside(first, last))
+        return before + inside + after
+
+    def count(self, start_date, end_date):
+        """
+        Quantidade de dias úteis entre start_date e end_date, sem materializar a lista.
+        """
+        if end_date < start_date:
+            return 0
+        self._ensure_covers(start_date, end_date)
+        days = self._days
+        return (
+            bisect_right(days, end_date) - bisect_left(days, start_date)
+            + sum(self._count_outside(first, last) for first, last in self._outside(start_date, end_date))
+        )
+
+    def is_trading_day(self, day):
+        if not self._ensure_covers(day, day):
+            return day.weekday() < 5 and day not in self._holidays_between(day.year, day.year)
+        days = self._days
+        i = bisect_left(days, day)
+        return i < len(days) and days[i] == day
+
+    def previous_trading_day(self, day):
+        """
+        Último dia útil estritamente anterior a `day`.
+        """
+        if not self._ensure_covers(_shift(day, -31), day):
+            day = _shift(day, -1)
+            while not self.is_trading_day(day):
+                day = _shift(day, -1)
+            return day
+        i = bisect_left(self._days, day)
+        return self._days[i - 1]
+
+    def next_trading_day(self, day):
+        """
+        Primeiro dia útil estritamente posterior a `day`.
+        """
+        if not self._ensure_covers(day, _shift(day, 31)):
+            day = _shift(day, 1)
+            while not self.is_trading_day(day):
+                day = _shift(day, 1)
+            return day
+        i = bisect_right(self._days, day)
+        return self._days[i]
+
+
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+
+def get_calendar(name=None):
+    """
+    Retorna (e reaproveita) o calendário pelo nome de HOLIDAY_SETS ou pelo caminho de um
+    arquivo de feriados. Sem nome, usa settings.COTACOES_HOLIDAY_CALENDAR.
+    """
+    name = name or getattr(settings, 'COTACOES_HOLIDAY_CALENDAR', 'none')
+    with _calendars_lock:
+        calendar = _calendars.get(name)
+        if calendar is None:
+            if name in HOLIDAY_SETS:
+                calendar = BusinessCalendar(holiday_rule=HOLIDAY_SETS[name])
+            elif Path(name).is_file():
+                calendar = BusinessCalendar(holidays=load_holidays_file(name))
+            else:
+                raise ValueError(f"Calendário de feriados desconhecido: {name}")
+            _calendars[name] = calendar
+    return calendar
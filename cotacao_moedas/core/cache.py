@@ -0,0 +1,181 @@
+# cotacao_moedas/core/cache.py
+"""
+Cache em dois níveis para as séries de cotações já serializadas.
+
+1º nível: LRU em memória do processo, com tamanho limitado.
+2º nível: cache do Django (Redis, arquivo ou locmem, conforme settings.CACHES), compartilhado
+entre os workers.
+
+As chaves incluem uma "geração" por ano coberto pelo período, guardada no 2º nível. Quando
+VatComplyService grava novas cotações, a geração dos anos afetados muda e todas as entradas
+que cobrem aquelas datas deixam de ser encontradas, em todos os processos.
+
+Cada processo guarda as gerações que leu por settings.COTACOES_GENERATION_TTL segundos,
+para que um acerto no 1º nível não pague a ida ao 2º nível. Gravações no próprio processo
+trocam a geração local na hora; as de outros processos aparecem em até esse TTL.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+
+class LRUCache:
+    """
+    Dicionário com limite de itens que descarta o item usado há mais tempo. Thread-safe.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class QuoteSeriesCache:
+    """
+    Cache das séries serializadas, chaveado por período normalizado, conjunto de moedas e
+    variante (parâmetros que mudam o formato da resposta, como a resolução).
+    """
+    KEY_PREFIX = 'cotacoes'
+    # Gerações nunca expiram; as séries expiram para não acumular versões antigas
+    SERIES_TIMEOUT = 24 * 60 * 60
+
+    def __init__(self, alias=None, local_maxsize=None, generation_ttl=None):
+        self.alias = alias
+        self.local = LRUCache(local_maxsize or getattr(settings, 'COTACOES_LOCAL_CACHE_SIZE', 256))
+        self.generation_ttl = generation_ttl
+        # Ano -> (geração, instante em que expira a cópia local)
+        self._generations = {}
+        self._generations_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias or getattr(settings, 'COTACOES_CACHE_ALIAS', 'default')]
+
+    def _generation_key(self, year):
+        return f'{self.KEY_PREFIX}:gen:{year}'
+
+    def _ttl(self):
+        if self.generation_ttl is not None:
+            return self.generation_ttl
+        return getattr(settings, 'COTACOES_GENERATION_TTL', 5)
+
+    def _generations_for(self, years):
+        """
+        Geração de cada ano, da cópia local quando ainda válida; os demais anos são lidos do
+        2º nível numa única chamada.
+        """
+        now = time.monotonic()
+        with self._generations_lock:
+            local = {year: self._generations.get(year) for year in years}
+        generations = {year: entry[0] for year, entry in local.items() if entry is not None and entry[1] > now}
+        missing = [year for year in years if year not in generations]
+        if missing:
+            found = self.shared.get_many([self._generation_key(year) for year in missing])
+            for year in missing:
+                generation = found.get(self._generation_key(year))
+                if generation is None:
+                    generation = self._new_generation(year)
+                generations[year] = str(generation)
+            expires = now + self._ttl()
+            with self._generations_lock:
+                for year in missing:
+                    self._generations[year] = (generations[year], expires)
+        return [generations[year] for year in years]
+
+    def _new_generation(self, year):
+        """
+        Geração nova para um ano sem geração no 2º nível (nunca gravada ou descartada pelo
+        backend ao atingir MAX_ENTRIES). Sempre inédita: entradas guardadas sob a geração
+        perdida nunca voltam a ser servidas. Se outro processo criou uma antes, vale a dele.
+        """
+        key = self._generation_key(year)
+        generation = uuid.uuid4().hex
+        if self.shared.add(key, generation, timeout=None):
+            return generation
+        return self.shared.get(key, generation)
+
+    def _key(self, start_date, end_date, currencies, variant=''):
+        generations = self._generations_for(list(range(start_date.year, end_date.year + 1)))
+        parts = [start_date.isoformat(), end_date.isoformat(), ','.join(sorted(currencies)), variant]
+        parts += generations
+        digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+        return f'{self.KEY_PREFIX}:serie:{digest}'
+
+    def get(self, start_date, end_date, currencies, variant=''):
+        """
+        Retorna a entrada guardada para o período/moedas/variante ou None.
+        """
+        key = self._key(start_date, end_date, currencies, variant)
+        entry = self.local.get(key)
+        if entry is not None:
+            metrics.inc('cotacoes_cache_requests_total', result='hit', layer='local')
+            return entry
+        entry = self.shared.get(key)
+        if entry is not None:
+            metrics.inc('cotacoes_cache_requests_total', result='hit', layer='shared')
+            self.local.set(key, entry)
+        else:
+            metrics.inc('cotacoes_cache_requests_total', result='miss')
+        return entry
+
+    def set(self, start_date, end_date, currencies, entry, variant=''):
+        key = self._key(start_date, end_date, currencies, variant)
+        self.local.set(key, entry)
+        self.shared.set(key, entry, self.SERIES_TIMEOUT)
+
+    def invalidate_dates(self, dates):
+        """
+        Invalida as entradas que cobrem qualquer uma das datas (troca a geração dos anos).
+        """
+        years = {day.year for day in dates}
+        if years:
+            generations = {year: uuid.uuid4().hex for year in years}
+            self.shared.set_many(
+                {self._generation_key(year): generation for year, generation in generations.items()}, timeout=None
+            )
+            expires = time.monotonic() + self._ttl()
+            with self._generations_lock:
+                for year, generation in generations.items():
+                    self._generations[year] = (generation, expires)
+
+    def clear(self):
+        self.local.clear()
+        with self._generations_lock:
+            self._generations.clear()
+
+
+quote_series_cache = QuoteSeriesCache()
@@ -0,0 +1,58 @@
+# cotacao_moedas/core/columnar.py
+"""
+Utilitários para trabalhar com séries de cotações em formato colunar (uma lista por campo).
+Usa NumPy quando está instalado e cai para Python puro caso contrário.
+"""
+try:
+    import numpy as np
+except ImportError: # NumPy é opcional
+    np = None
+
+HAS_NUMPY = np is not None
+
+
+def transpose(rows, width):
+    """
+    Transpõe uma lista de tuplas em `width` colunas (listas) em uma única passada.
+    """
+    if not rows:
+        return [[] for _ in range(width)]
+    return [list(column) for column in zip(*rows)]
+
+
+def to_floats(values):
+    """
+    Converte uma coluna de Decimal/float/None para float/None.
+    Com NumPy a conversão é vetorizada (None vira NaN e volta a ser None no final).
+    """
+    if np is None or not values:
+        return [None if value is None else float(value) for value in values]
+    array = np.array(values, dtype=float)
+    missing = np.isnan(array)
+    if not missing.any():
+        return array.tolist()
+    result = array.astype(object)
+    result[missing] = None
+    return result.tolist()
+
+
+def divide(numerators, denominators):
+    """
+    Divide duas colunas elemento a elemento (numerators[i] / denominators[i]).
+    O resultado é None onde algum dos lados falta ou o divisor é zero. Com NumPy a divisão
+    é feita de uma vez sobre os arrays.
+    """
+    if np is None or not numerators:
+        return [
+            None if num is None or den is None or den == 0 else float(num) / float(den)
+            for num, den in zip(numerators, denominators)
+        ]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.array(numerators, dtype=float) / np.array(denominators, dtype=float)
+    missing = ~np.isfinite(result)
+    if not missing.any():
+        return result.tolist()
+    result = result.astype(object)
+    result[missing] = None
+    return result.tolist()
+
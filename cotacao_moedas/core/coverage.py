@@ -0,0 +1,146 @@
+# cotacao_moedas/core/coverage.py
+"""
+Índice de cobertura de Cotacao (CoberturaCotacao): os dias já salvos guardados como
+intervalos contíguos de dias úteis, em vez de um registro por dia.
+
+Cada gravação de cotações (VatComplyService.save_rates, BulkLoader.load) funde, na mesma
+transação, as datas gravadas nos intervalos vizinhos (uma query nos intervalos próximos e
+um bulk_create). As lacunas de um período saem de uma única query
+nos intervalos que o cruzam, com o calendário de dias úteis (buscas binárias) contando os
+dias de cada lacuna: verificar 10 anos custa O(intervalos), não O(dias).
+
+A contiguidade depende do calendário de feriados: depois de trocar
+settings.COTACOES_HOLIDAY_CALENDAR, reconstrua o índice com `manage.py rebuild_resumos`.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+
+from .business_days import get_calendar
+from .models import CoberturaCotacao, Cotacao
+
+ONE_DAY = timedelta(days=1)
+
+
+def _contiguous(calendar, end, start):
+    """
+    True se não há dia útil entre `end` (fim de um intervalo) e `start` (início do próximo).
+    """
+    return calendar.count(end + ONE_DAY, start - ONE_DAY) == 0
+
+
+def build_runs(dates, calendar):
+    """
+    Agrupa datas em intervalos (início, fim) de dias úteis contíguos. Dias não úteis são
+    ignorados. Retorna a lista ordenada de intervalos.
+    """
+    runs = []
+    for day in sorted(set(dates)):
+        if not calendar.is_trading_day(day):
+            continue
+        if runs and _contiguous(calendar, runs[-1][1], day):
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+def merge_runs(runs, calendar):
+    """
+    Funde intervalos sobrepostos ou contíguos.
+    """
+    merged = []
+    for start, end in sorted(runs):
+        if merged and (start <= merged[-1][1] or _contiguous(calendar, merged[-1][1], start)):
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def add_dates(dates, calendar=None):
+    """
+    Registra no índice as datas recém-gravadas em Cotacao, fundindo-as com os intervalos
+    vizinhos. Retorna o número de intervalos regravados.
+    """
+    calendar = calendar or get_calendar()
+    runs = build_runs(dates, calendar)
+    if not runs:
+        return 0
+    # Intervalos que tocam o lote: os que terminam a partir do dia útil anterior ao primeiro
+    # intervalo novo e começam até o dia útil seguinte ao último
+    low = calendar.previous_trading_day(runs[0][0])
+    high = calendar.next_trading_day(runs[-1][1])
+    with transaction.atomic():
+        existing = list(
+            CoberturaCotacao.objects.select_for_update()
+            .filter(inicio__lte=high, fim__gte=low)
+            .values_list('id', 'inicio', 'fim')
+        )
+        current = [(start, end) for _, start, end in existing]
+        merged = merge_runs(current + runs, calendar)
+        if merged == sorted(current):
+            return 0
+        CoberturaCotacao.objects.filter(id__in=[pk for pk, _, _ in existing]).delete()
+        CoberturaCotacao.objects.bulk_create([CoberturaCotacao(inicio=start, fim=end) for start, end in merged])
+    return len(merged)
+
+
+def gaps(start_date, end_date, calendar=None):
+    """
+    Lacunas de dias úteis do período, como tuplas (primeiro dia útil, último dia útil,
+    quantidade de dias úteis), em ordem. Uma query nos intervalos que cruzam o período.
+    """
+    calendar = calendar or get_calendar()
+    intervals = (
+        CoberturaCotacao.objects.filter(inicio__lte=end_date, fim__gte=start_date)
+        .order_by('inicio').values_list('inicio', 'fim')
+    )
+    result = []
+
+    def add_gap(first, last):
+        count = calendar.count(first, last)
+        if count:
+            first = first if calendar.is_trading_day(first) else calendar.next_trading_day(first)
+            last = last if calendar.is_trading_day(last) else calendar.previous_trading_day(last)
+            result.append((first, last, count))
+
+    cursor = start_date
+    for start, end in intervals:
+        if start > cursor:
+            add_gap(cursor, start - ONE_DAY)
+        cursor = max(cursor, end + ONE_DAY)
+    if cursor <= end_date:
+        add_gap(cursor, end_date)
+    return result
+
+
+def missing_days(start_date, end_date, calendar=None):
+    """
+    Dias úteis do período ausentes do índice, em ordem.
+    """
+    calendar = calendar or get_calendar()
+    days = []
+    for first, last, _ in gaps(start_date, end_date, calendar):
+        days += calendar.trading_days(first, last)
+    return days
+
+
+def is_complete(start_date, end_date, calendar=None):
+    return not gaps(start_date, end_date, calendar)
+
+
+def rebuild(calendar=None, chunk_size=5000):
+    """
+    Reconstrói o índice a partir de Cotacao (leitura das datas com um cursor).
+    Retorna o número de intervalos.
+    """
+    calendar = calendar or get_calendar()
+    dates = Cotacao.objects.order_by('data').values_list('data', flat=True).iterator(chunk_size=chunk_size)
+    runs = build_runs(dates, calendar)
+    with transaction.atomic():
+        CoberturaCotacao.objects.all().delete()
+        CoberturaCotacao.objects.bulk_create(
+            [CoberturaCotacao(inicio=start, fim=end) for start, end in runs], batch_size=500,
+        )
+    return len(runs)
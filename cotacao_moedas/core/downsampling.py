@@ -0,0 +1,213 @@
+# cotacao_moedas/core/downsampling.py
+"""
+Agregação por período (semana/mês, média ou OHLC) e redução de pontos (LTTB) das séries
+colunares {'dates': [...], '<moeda>': [...]}, para que o tamanho da resposta fique limitado
+ao que o gráfico consegue exibir. Usa NumPy quando está instalado e cai para Python puro
+caso contrário.
+"""
+import warnings
+from datetime import date
+
+from . import columnar
+
+RESOLUTIONS = ('day', 'week', 'month')
+OHLC_FIELDS = ('open', 'high', 'low', 'close')
+
+
+def _bucket_key(day, resolution):
+    if resolution == 'week':
+        return date.fromordinal(day.toordinal() - day.weekday()) # Segunda-feira da semana
+    if resolution == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_starts(dates, resolution):
+    """
+    Agrupa datas 'YYYY-MM-DD' (ordenadas) em períodos consecutivos.
+    Retorna (rótulos dos períodos, índice do primeiro dia de cada período).
+    """
+    labels, starts = [], []
+    previous = None
+    for index, day in enumerate(dates):
+        key = _bucket_key(date.fromisoformat(day), resolution)
+        if key != previous:
+            labels.append(key.isoformat())
+            starts.append(index)
+            previous = key
+    return labels, starts
+
+
+def _bucket_slices(starts, length):
+    ends = starts[1:] + [length]
+    return zip(starts, ends)
+
+
+def bucket_mean(values, starts):
+    """
+    Média de cada período, ignorando dias sem valor (None se o período não tiver nenhum).
+    """
+    np = columnar.np
+    if np is None or not values:
+        means = []
+        for start, end in _bucket_slices(starts, len(values)):
+            present = [value for value in values[start:end] if value is not None]
+            means.append(sum(present) / len(present) if present else None)
+        return means
+    array = np.array(values, dtype=float)
+    valid = ~np.isnan(array)
+    sums = np.add.reduceat(np.where(valid, array, 0.0), starts)
+    counts = np.add.reduceat(valid.astype(int), starts)
+    with np.errstate(invalid='ignore'):
+        return columnar.to_floats((sums / counts).tolist())
+
+
+def bucket_ohlc(values, starts):
+    """
+    Abertura, máxima, mínima e fechamento de cada período, considerando só os dias com valor.
+    Retorna {'open': [...], 'high': [...], 'low': [...], 'close': [...]}.
+    """
+    np = columnar.np
+    if np is None or not values:
+        ohlc = {field: [] for field in OHLC_FIELDS}
+        for start, end in _bucket_slices(starts, len(values)):
+            present = [value for value in values[start:end] if value is not None]
+            ohlc['open'].append(present[0] if present else None)
+            ohlc['high'].append(max(present) if present else None)
+            ohlc['low'].append(min(present) if present else None)
+            ohlc['close'].append(present[-1] if present else None)
+        return ohlc
+    array = np.array(values, dtype=float)
+    valid = ~np.isnan(array)
+    positions = np.arange(len(array))
+    # Primeiro/último índice com valor em cada período (len(array)/-1 quando não há nenhum)
+    first = np.minimum.reduceat(np.where(valid, positions, len(array)), starts)
+    last = np.maximum.reduceat(np.where(valid, positions, -1), starts)
+    empty = last < 0
+    padded = np.append(array, np.nan)
+    return {
+        'open': columnar.to_floats(padded[first].tolist()),
+        'high': columnar.to_floats(np.fmax.reduceat(array, starts).tolist()),
+        'low': columnar.to_floats(np.fmin.reduceat(array, starts).tolist()),
+        'close': columnar.to_floats(np.where(empty, np.nan, array[last]).tolist()),
+    }
+
+
+def resample(series, currencies, resolution='day', ohlc=False):
+    """
+    Agrega a série por dia/semana/mês: média de cada período ou, com ohlc=True, um
+    dicionário {'open', 'high', 'low', 'close'} por moeda. Os rótulos são o primeiro dia
+    do período (segunda-feira na semana).
+    """
+    if resolution == 'day' and not ohlc:
+        return series
+    labels, starts = bucket_starts(series['dates'], resolution)
+    result = {'dates': labels}
+    for currency in currencies:
+        aggregate = bucket_ohlc if ohlc else bucket_mean
+        result[currency] = aggregate(series[currency], starts)
+    return result
+
+
+def lttb_indices(xs, columns, threshold):
+    """
+    Índices escolhidos pelo Largest-Triangle-Three-Buckets para reduzir a série a
+    `threshold` pontos (sempre incluindo o primeiro e o último).
+    Com várias colunas (moedas) o mesmo eixo X é mantido: a área de cada candidato é a soma
+    das áreas em cada coluna, com os valores normalizados pela amplitude da coluna. Valores
+    ausentes não contribuem para a área.
+    """
+    length = len(xs)
+    if threshold >= length or threshold < 3:
+        return list(range(length))
+    np = columnar.np
+    if np is None:
+        return _lttb_indices_python(xs, columns, threshold)
+
+    with warnings.catch_warnings():
+        # Colunas ou trechos sem nenhum valor geram NaN (e avisos) que não contam na área
+        warnings.simplefilter('ignore', RuntimeWarning)
+        x = np.array(xs, dtype=float)
+        y = np.array([[np.nan if value is None else value for value in column] for column in columns], dtype=float)
+        low, high = np.nanmin(y, axis=1, keepdims=True), np.nanmax(y, axis=1, keepdims=True)
+        span = np.where(high - low > 0, high - low, 1.0)
+        y = (y - low) / span
+
+        every = (length - 2) / (threshold - 2)
+        selected = [0]
+        a = 0
+        for bucket in range(threshold - 2):
+            range_start = int(bucket * every) + 1
+            range_end = int((bucket + 1) * every) + 1
+            avg_end = min(int((bucket + 2) * every) + 1, length)
+            avg_x = x[range_end:avg_end].mean()
+            avg_y = np.nanmean(y[:, range_end:avg_end], axis=1, keepdims=True)
+            areas = np.abs(
+                (x[a] - avg_x) * (y[:, range_start:range_end] - y[:, a:a + 1])
+                - (x[a] - x[range_start:range_end]) * (avg_y - y[:, a:a + 1])
+            )
+            a = range_start + int(np.argmax(np.nansum(areas, axis=0)))
+            selected.append(a)
+    selected.append(length - 1)
+    return selected
+
+
+def _lttb_indices_python(xs, columns, threshold):
+    length = len(xs)
+    normalized = []
+    for column in columns:
+        present = [value for value in column if value is not None]
+        low = min(present, default=0.0)
+        span = (max(present, default=0.0) - low) or 1.0
+        normalized.append([None if value is None else (value - low) / span for value in column])
+
+    every = (length - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for bucket in range(threshold - 2):
+        range_start = int(bucket * every) + 1
+        range_end = int((bucket + 1) * every) + 1
+        avg_end = min(int((bucket + 2) * every) + 1, length)
+        avg_x = sum(xs[range_end:avg_end]) / (avg_end - range_end)
+        avg_ys = []
+        for column in normalized:
+            present = [value for value in column[range_end:avg_end] if value is not None]
+            avg_ys.append(sum(present) / len(present) if present else None)
+
+        best, best_area = range_start, -1.0
+        for j in range(range_start, range_end):
+            area = 0.0
+            for column, avg_y in zip(normalized, avg_ys):
+                if column[a] is None or column[j] is None or avg_y is None:
+                    continue
+                area += abs((xs[a] - avg_x) * (column[j] - column[a]) - (xs[a] - xs[j]) * (avg_y - column[a]))
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        selected.append(a)
+    selected.append(length - 1)
+    return selected
+
+
+def downsample(series, currencies, max_points):
+    """
+    Reduz a série (diária, agregada ou OHLC) a no máximo `max_points` pontos com LTTB.
+    Nas séries OHLC a escolha dos pontos usa o fechamento.
+    """
+    if len(series['dates']) <= max_points:
+        return series
+    xs = [date.fromisoformat(day).toordinal() for day in series['dates']]
+    lines = [
+        series[currency]['close'] if isinstance(series[currency], dict) else series[currency]
+        for currency in currencies
+    ]
+    indices = lttb_indices(xs, lines, max_points)
+
+    result = {'dates': [series['dates'][index] for index in indices]}
+    for currency in currencies:
+        column = series[currency]
+        if isinstance(column, dict):
+            result[currency] = {field: [values[index] for index in indices] for field, values in column.items()}
+        else:
+            result[currency] = [column[index] for index in indices]
+    return result
@@ -0,0 +1,108 @@
+# cotacao_moedas/core/export.py
+"""
+Exportação em massa das cotações em CSV (opcionalmente gzip, comprimido durante o envio) e
+Parquet (quando o pyarrow está instalado).
+
+As linhas vêm de um cursor do lado do servidor (.iterator(chunk_size=...), que no PostgreSQL
+usa um cursor nomeado) no formato (data, moeda 1, moeda 2, ...) já convertido pelo banco, e
+são escritas em blocos: a memória usada não depende do tamanho do período.
+"""
+import csv
+import io
+import zlib
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # pyarrow é opcional (só para Parquet)
+    pa = pq = None
+
+from .columnar import transpose
+from .models import Cotacao, TaxaCambio
+from .services import VatComplyService
+
+HAS_PYARROW = pa is not None
+CHUNK_SIZE = 5000
+# wbits=31: formato gzip (cabeçalho + CRC), compatível com gunzip
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def export_rows(start_date=None, end_date=None, currencies=None):
+    """
+    Iterador de tuplas (data 'YYYY-MM-DD', taxa de cada moeda) em ordem cronológica, lido
+    com um cursor do lado do servidor. Sem `currencies` usa as colunas de Cotacao; com elas,
+    a tabela normalizada TaxaCambio. Retorna (moedas, iterador).
+    """
+    fixed = list(Cotacao.CURRENCY_FIELDS)
+    if currencies is None or list(currencies) == fixed:
+        queryset = Cotacao.objects.order_by('data')
+        if start_date is not None and end_date is not None:
+            queryset = queryset.in_range(start_date, end_date)
+        return fixed, queryset.rows().iterator(chunk_size=CHUNK_SIZE)
+    queryset = TaxaCambio.objects.for_base(VatComplyService.BASE_CURRENCY)
+    if start_date is not None and end_date is not None:
+        queryset = queryset.filter(data__range=(start_date, end_date))
+    return list(currencies), queryset.pivot_rows(currencies, chunk_size=CHUNK_SIZE)
+
+
+def _chunks(rows, size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_csv(rows, currencies):
+    """
+    Gera o CSV (cabeçalho date,<moedas>) em blocos de texto de CHUNK_SIZE linhas.
+    Valores ausentes ficam vazios.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(['date', *currencies])
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_csv_bytes(rows, currencies, compress=False):
+    """
+    CSV em bytes UTF-8; com compress=True cada bloco passa por um compressor gzip
+    incremental e o resultado é um único arquivo .csv.gz válido.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, GZIP_WBITS) if compress else None
+    for text in iter_csv(rows, currencies):
+        data = text.encode('utf-8')
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def write_parquet(rows, currencies, fileobj):
+    """
+    Escreve as linhas em Parquet, um row group por bloco de CHUNK_SIZE linhas.
+    Retorna o número de linhas escritas. Exige pyarrow.
+    """
+    if pa is None:
+        raise RuntimeError("Exportação em Parquet requer o pacote pyarrow.")
+    schema = pa.schema([('date', pa.date32())] + [(currency, pa.float64()) for currency in currencies])
+    count = 0
+    with pq.ParquetWriter(fileobj, schema, compression='snappy') as writer:
+        for chunk in _chunks(rows):
+            dates, *columns = transpose(chunk, len(currencies) + 1)
+            arrays = [pa.array(dates, pa.string()).cast(pa.date32())]
+            arrays += [pa.array(column, pa.float64()) for column in columns]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(chunk)
+    return count
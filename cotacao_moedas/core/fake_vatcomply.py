@@ -0,0 +1,161 @@
+# cotacao_moedas/core/fake_vatcomply.py
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+def fake_rates_for(day):
+    """
+    Cotações determinísticas para uma data (mesmo formato de 'rates' da VatComply).
+    """
+    offset = (day.toordinal() % 100) / 100
+    return {
+        'BRL': round(5 + offset, 4),
+        'EUR': round(0.85 + offset / 10, 4),
+        'JPY': round(140 + offset * 10, 4),
+        'GBP': round(0.75 + offset / 10, 4),
+    }
+
+
+class _FakeVatComplyHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 para permitir conexões keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # Cada instância do handler corresponde a uma conexão TCP
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.status != 200:
+            self._send_json(self.server.status, {'error': 'Erro simulado'})
+            return
+
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/timeseries' and self.server.supports_range:
+            self._send_timeseries(params)
+            return
+        if url.path != '/rates':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        try:
+            day = date.fromisoformat(params['date'])
+        except (KeyError, ValueError):
+            self._send_json(400, {'error': 'Parâmetro date inválido'})
+            return
+        if day in self.server.missing_dates:
+            self._send_json(404, {'error': 'Sem cotação para a data'})
+            return
+        self._send_json(200, {'date': day.isoformat(), 'base': params.get('base', 'USD'), 'rates': fake_rates_for(day)})
+
+    def _send_timeseries(self, params):
+        try:
+            start = date.fromisoformat(params['start_date'])
+            end = date.fromisoformat(params['end_date'])
+        except (KeyError, ValueError):
+            self._send_json(400, {'error': 'Parâmetros start_date/end_date inválidos'})
+            return
+        rates = {}
+        day = start
+        while day <= end:
+            if day.weekday() < 5:
+                rates[day.isoformat()] = fake_rates_for(day)
+            day += timedelta(days=1)
+        self._send_json(200, {'base': params.get('base', 'USD'), 'start_date': start.isoformat(),
+                              'end_date': end.isoformat(), 'rates': rates})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Silencia o log de acesso
+
+
+class _QuietThreadingHTTPServer(ThreadingHTTPServer):
+
+    def handle_error(self, request, client_address):
+        pass # Clientes que desistem por timeout fecham a conexão no meio da resposta
+
+
+class FakeVatComplyServer:
+    """
+    Servidor HTTP local que imita a API da VatComply, para testes e benchmarks offline.
+    Conta conexões TCP e requisições recebidas; `latency` simula um upstream lento e
+    `status` diferente de 200 simula uma indisponibilidade e `missing_dates` responde 404 só
+    para essas datas (em /rates). Com `supports_range` o servidor
+    também responde /timeseries?start_date=&end_date= com as cotações de todo o período.
+
+        with FakeVatComplyServer() as server:
+            VatComplyService(base_url=server.rates_url).get_daily_rates(date(2024, 1, 2))
+    """
+
+    def __init__(self, latency=0.0, status=200, supports_range=True, missing_dates=()):
+        self.httpd = _QuietThreadingHTTPServer(('127.0.0.1', 0), _FakeVatComplyHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.lock = threading.Lock()
+        self.httpd.connections = 0
+        self.httpd.requests = 0
+        self.httpd.latency = latency
+        self.httpd.status = status
+        self.httpd.supports_range = supports_range
+        self.httpd.missing_dates = set(missing_dates)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def rates_url(self):
+        return f"{self.url}/rates"
+
+    @property
+    def timeseries_url(self):
+        return f"{self.url}/timeseries"
+
+    @property
+    def connections(self):
+        return self.httpd.connections
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def status(self):
+        return self.httpd.status
+
+    @status.setter
+    def status(self, value):
+        self.httpd.status = value
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
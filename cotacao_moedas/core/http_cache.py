@@ -0,0 +1,115 @@
+# cotacao_moedas/core/http_cache.py
+"""
+Validadores (ETag / Last-Modified) e Cache-Control para as APIs de cotações.
+"""
+import hashlib
+from calendar import timegm
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .business_days import get_calendar
+from .models import Cotacao, TaxaCambio
+from .services import VatComplyService
+
+# Períodos inteiramente no passado e completos não mudam: browser e CDN podem guardá-los por muito tempo
+PAST_RANGE_MAX_AGE = 30 * 24 * 60 * 60
+# Períodos que incluem hoje, com dias faltando (ou a lista das últimas cotações) podem ganhar
+# dados a qualquer momento
+RECENT_MAX_AGE = 60
+
+
+class RangeValidators:
+    """
+    ETag forte e Last-Modified de um período, derivados do período pedido, da quantidade de
+    linhas e do data_registro mais recente nele. Custa uma única query de agregação.
+    """
+
+    def __init__(self, start_date, end_date, etag, last_modified, count):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.etag = etag
+        self.last_modified = last_modified
+        self.count = count
+
+    @classmethod
+    def for_range(cls, start_date=None, end_date=None, currencies=None):
+        """
+        Calcula os validadores do período (ou da tabela inteira, sem período).
+        Com `currencies`, usa as linhas dessas moedas em TaxaCambio e `count` é o número de
+        dias com alguma delas; sem, usa Cotacao.
+        """
+        queryset, aggregates = cls._state_query(start_date, end_date, currencies)
+        return cls._from_state(start_date, end_date, currencies, queryset.aggregate(**aggregates))
+
+    @classmethod
+    async def afor_range(cls, start_date=None, end_date=None, currencies=None):
+        """
+        Versão assíncrona de for_range() (aaggregate), para as views async.
+        """
+        queryset, aggregates = cls._state_query(start_date, end_date, currencies)
+        return cls._from_state(start_date, end_date, currencies, await queryset.aaggregate(**aggregates))
+
+    @staticmethod
+    def _state_query(start_date, end_date, currencies):
+        if currencies is None:
+            queryset = Cotacao.objects.order_by()
+            count = Count('*') # Sem tocar em id: o agregado sai só do índice de cobertura
+        else:
+            queryset = TaxaCambio.objects.for_base(VatComplyService.BASE_CURRENCY).filter(moeda__in=currencies).order_by()
+            count = Count('data', distinct=True)
+        if start_date is not None and end_date is not None:
+            queryset = queryset.filter(data__range=(start_date, end_date))
+        return queryset, {'latest': Max('data_registro'), 'count': count, 'last_day': Max('data')}
+
+    @classmethod
+    def _from_state(cls, start_date, end_date, currencies, state):
+        key = '|'.join(str(part) for part in (
+            start_date, end_date, ','.join(currencies or ()), state['count'], state['last_day'],
+            state['latest'].isoformat() if state['latest'] else '',
+        ))
+        etag = '"%s"' % hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return cls(start_date, end_date, etag, state['latest'], state['count'])
+
+    @property
+    def last_modified_timestamp(self):
+        if self.last_modified is None:
+            return None
+        return timegm(self.last_modified.utctimetuple())
+
+    @property
+    def is_past_range(self):
+        return self.end_date is not None and self.end_date < timezone.localdate()
+
+    @property
+    def is_final(self):
+        """
+        Período passado e completo no banco (uma linha por dia útil): esta versão já é a final.
+        """
+        return self.is_past_range and self.count == get_calendar().count(self.start_date, self.end_date)
+
+    def not_modified_response(self, request):
+        """
+        Retorna um 304 (com os cabeçalhos de cache) se o cliente já tem esta versão, senão None.
+        """
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified_timestamp
+        )
+        if response is not None:
+            self.apply(response)
+        return response
+
+    def apply(self, response):
+        """
+        Adiciona ETag, Last-Modified e Cache-Control à resposta.
+        """
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified_timestamp)
+        # Um período passado com dias faltando (falha no upstream, modo somente banco, carga
+        # incompleta) ainda pode ser completado: não deixa a versão parcial presa no CDN
+        max_age = PAST_RANGE_MAX_AGE if self.is_final else RECENT_MAX_AGE
+        patch_cache_control(response, public=True, max_age=max_age)
+        return response
@@ -0,0 +1,245 @@
+# cotacao_moedas/core/importer.py
+"""
+Carga em massa de arquivos de cotações vindos de outras fontes (CSV ou NDJSON, opcionalmente
+.gz), usada pelo comando import_cotacoes.
+
+O arquivo é lido como stream, registro a registro, e validado; os registros válidos são
+gravados em lotes em TaxaCambio e, se a base for a da VatComply (USD), também nas colunas
+fixas de Cotacao. No PostgreSQL cada lote entra por COPY numa tabela
+temporária seguido de um INSERT ... SELECT ... ON CONFLICT; nos demais bancos (SQLite) por
+executemany de um INSERT ... ON CONFLICT.
+
+Formatos aceitos:
+- CSV com cabeçalho `date` (ou `data`) e uma coluna por moeda: date,BRL,EUR,JPY,GBP
+- NDJSON, um objeto por linha: {"date": "2024-01-08", "rates": {"BRL": 5.25, ...}} ou
+  {"date": "2024-01-08", "BRL": 5.25, ...}
+"""
+import csv
+import gzip
+import io
+import json
+import math
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import coverage
+from .cache import quote_series_cache
+from .models import Cotacao, TaxaCambio
+from .services import VatComplyService
+from .summaries import update_summaries
+
+ON_CONFLICT_CHOICES = ('update', 'skip', 'error')
+DATE_KEYS = ('date', 'data')
+
+
+class InvalidRecord(ValueError):
+    """
+    Registro do arquivo que não passou na validação.
+    """
+
+
+def detect_format(path):
+    """
+    'csv' ou 'ndjson' pela extensão do arquivo (ignorando .gz).
+    """
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'ndjson'
+    return 'csv'
+
+
+def open_text(path):
+    if path.lower().endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def parse_record(raw_date, raw_rates):
+    """
+    Valida um registro: data YYYY-MM-DD e taxas numéricas, finitas e positivas em moedas de
+    3 letras. Valores vazios são ignorados. Retorna (data, {moeda: float}).
+    """
+    try:
+        day = datetime.strptime(str(raw_date).strip(), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise InvalidRecord(f"data inválida: {raw_date!r}")
+    rates = {}
+    for currency, value in raw_rates.items():
+        currency = str(currency).strip().upper()
+        if len(currency) != 3 or not currency.isalpha():
+            raise InvalidRecord(f"moeda inválida: {currency!r}")
+        if value is None or value == '':
+            continue
+        try:
+            rate = float(value)
+        except (TypeError, ValueError):
+            raise InvalidRecord(f"taxa inválida para {currency}: {value!r}")
+        if not math.isfinite(rate) or rate <= 0:
+            raise InvalidRecord(f"taxa fora do intervalo para {currency}: {value!r}")
+        rates[currency] = rate
+    if not rates:
+        raise InvalidRecord(f"nenhuma taxa para {day}")
+    return day, rates
+
+
+def read_records(stream, file_format):
+    """
+    Gera (número da linha, data, taxas) ou (número da linha, None, InvalidRecord) para
+    cada registro do stream, sem carregar o arquivo em memória.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        date_key = next((key for key in reader.fieldnames or () if key.strip().lower() in DATE_KEYS), None)
+        if date_key is None:
+            raise InvalidRecord("cabeçalho do CSV sem a coluna 'date'")
+        for row in reader:
+            raw_date = row.pop(date_key)
+            try:
+                yield (reader.line_num, *parse_record(raw_date, row))
+            except InvalidRecord as e:
+                yield reader.line_num, None, e
+        return
+
+    for line_num, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+            if not isinstance(obj, dict):
+                raise InvalidRecord("linha não é um objeto JSON")
+            raw_date = next((obj.pop(key) for key in DATE_KEYS if key in obj), None)
+            raw_rates = obj.get('rates') if isinstance(obj.get('rates'), dict) else obj
+            yield (line_num, *parse_record(raw_date, raw_rates))
+        except (InvalidRecord, json.JSONDecodeError) as e:
+            yield line_num, None, InvalidRecord(str(e))
+
+
+class BulkLoader:
+    """
+    Grava lotes de (data, taxas) em Cotacao e TaxaCambio com a política de conflito escolhida:
+    'update' (substitui as taxas presentes no arquivo), 'skip' (mantém o que já existe) ou
+    'error' (um registro já existente aborta o lote com IntegrityError).
+    As colunas de Cotacao são cotações em USD: com outra base, só TaxaCambio é gravada.
+    """
+
+    def __init__(self, on_conflict='update', base='USD'):
+        if on_conflict not in ON_CONFLICT_CHOICES:
+            raise ValueError(f"on_conflict deve ser um de {ON_CONFLICT_CHOICES}")
+        self.on_conflict = on_conflict
+        self.base = base
+        self.writes_quotes = base == VatComplyService.BASE_CURRENCY
+        self.use_copy = connection.vendor == 'postgresql'
+
+    def _tables(self):
+        """
+        (modelo, colunas, colunas únicas, colunas atualizadas no conflito) de cada tabela.
+        """
+        currency_columns = list(Cotacao.CURRENCY_FIELDS.values())
+        tables = [
+            (TaxaCambio, ['data', 'base', 'moeda', 'taxa', 'data_registro'], ['data', 'base', 'moeda'], ['taxa']),
+        ]
+        if self.writes_quotes:
+            tables.insert(0, (Cotacao, ['data', *currency_columns, 'data_registro'], ['data'], currency_columns))
+        return tables
+
+    def quote_dates(self, batch):
+        """
+        Datas do lote que entram em Cotacao (alguma moeda das colunas fixas, base USD).
+        """
+        if not self.writes_quotes:
+            return []
+        return [day for day, rates in batch if any(rates.get(currency) is not None for currency in Cotacao.CURRENCY_FIELDS)]
+
+    def _rows(self, model, batch, now):
+        if model is Cotacao:
+            for day, rates in batch:
+                values = [rates.get(currency) for currency in Cotacao.CURRENCY_FIELDS]
+                if any(value is not None for value in values): # Só outras moedas: só vai para TaxaCambio
+                    yield [day, *values, now]
+        else:
+            for day, rates in batch:
+                for currency, rate in rates.items():
+                    yield [day, self.base, currency, rate, now]
+
+    def _conflict_clause(self, table, unique, updated):
+        qn = connection.ops.quote_name
+        if self.on_conflict == 'error':
+            return ''
+        target = ', '.join(qn(column) for column in unique)
+        if self.on_conflict == 'skip':
+            return f' ON CONFLICT ({target}) DO NOTHING'
+        # Moedas ausentes no arquivo (NULL) mantêm o valor já gravado
+        assignments = [
+            f'{qn(column)} = COALESCE(EXCLUDED.{qn(column)}, {qn(table)}.{qn(column)})' for column in updated
+        ] + [f'{qn("data_registro")} = EXCLUDED.{qn("data_registro")}']
+        return f' ON CONFLICT ({target}) DO UPDATE SET {", ".join(assignments)}'
+
+    def load(self, batch):
+        """
+        Grava um lote numa transação. Datas repetidas no lote: vale a última.
+        Retorna o número de dias enviados.
+        """
+        batch = list(dict(batch).items())
+        if not batch:
+            return 0
+        now = timezone.now()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model, columns, unique, updated in self._tables():
+                fields = [model._meta.get_field(column) for column in columns]
+                rows = [
+                    [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+                    for row in self._rows(model, batch, now)
+                ]
+                if not rows:
+                    continue
+                conflict = self._conflict_clause(model._meta.db_table, unique, updated)
+                if self.use_copy:
+                    self._copy(cursor, model._meta.db_table, columns, rows, conflict)
+                else:
+                    self._executemany(cursor, model._meta.db_table, columns, rows, conflict)
+            # Registros só com outras moedas (ou outra base) vão apenas para TaxaCambio e ficam fora da cobertura
+            coverage.add_dates(self.quote_dates(batch))
+        return len(batch)
+
+    def _executemany(self, cursor, table, columns, rows, conflict):
+        qn = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(columns))
+        cursor.executemany(
+            f'INSERT INTO {qn(table)} ({", ".join(qn(c) for c in columns)}) VALUES ({placeholders}){conflict}',
+            rows,
+        )
+
+    def _copy(self, cursor, table, columns, rows, conflict):
+        qn = connection.ops.quote_name
+        staging = qn(f'{table}_import')
+        column_list = ', '.join(qn(c) for c in columns)
+        cursor.execute(
+            f'CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {column_list} FROM {qn(table)} WITH NO DATA'
+        )
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(
+            [['' if value is None else value for value in row] for row in rows]
+        )
+        buffer.seek(0)
+        copy_sql = f'COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)'
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'): # psycopg2
+            raw_cursor.copy_expert(copy_sql, buffer)
+        else: # psycopg 3
+            with raw_cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+        cursor.execute(f'INSERT INTO {qn(table)} ({column_list}) SELECT {column_list} FROM {staging}{conflict}')
+        cursor.execute(f'DROP TABLE {staging}')
+
+
+def refresh_derived(dates):
+    """
+    Depois de um lote: invalida o cache de séries e recalcula os resumos dos meses/anos das
+    datas. Os indicadores móveis (update_indicators) são estendidos uma vez ao final da carga.
+    """
+    quote_series_cache.invalidate_dates(dates)
+    update_summaries(dates)
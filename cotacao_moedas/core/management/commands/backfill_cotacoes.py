@@ -0,0 +1,156 @@
+# cotacao_moedas/core/management/commands/backfill_cotacoes.py
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.analytics import update_indicators
+from core.services import VatComplyService
+
+
+class Command(BaseCommand):
+    help = (
+        "Popula Cotacao com o histórico de um período, dividindo-o em blocos que são "
+        "buscados em paralelo na VatComply e salvos com upsert em massa. O progresso é "
+        "registrado em um arquivo de checkpoint para que uma execução interrompida continue "
+        "de onde parou. Só os dias ausentes do índice de cobertura são buscados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True, help="Data inicial (YYYY-MM-DD).")
+        parser.add_argument('--end', help="Data final (YYYY-MM-DD). Padrão: hoje.")
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Blocos buscados em paralelo (requisições limitadas ainda por COTACOES_MAX_CONNECTIONS_PER_HOST).",
+        )
+        parser.add_argument('--chunk-days', type=int, default=30, help="Dias corridos por bloco.")
+        parser.add_argument(
+            '--checkpoint',
+            default=str(settings.BASE_DIR / 'backfill_cotacoes.checkpoint.json'),
+            help="Arquivo de checkpoint com os blocos já concluídos.",
+        )
+        parser.add_argument('--reset', action='store_true', help="Ignora o checkpoint existente.")
+        parser.add_argument('--base-url', help="URL alternativa do endpoint de cotações.")
+        parser.add_argument('--range-url', help="URL do endpoint de série temporal (uma chamada por bloco).")
+        parser.add_argument(
+            '--refetch', action='store_true',
+            help="Busca também os dias já presentes no banco (por padrão só as lacunas do índice de cobertura).",
+        )
+
+    def handle(self, *args, **options):
+        start_date = self._parse_date(options['start'])
+        end_date = self._parse_date(options['end']) if options['end'] else timezone.localdate()
+        if end_date < start_date:
+            raise CommandError("A data de início deve ser anterior à data de fim.")
+        workers = options['workers']
+        chunk_days = options['chunk_days']
+        if workers < 1 or chunk_days < 1:
+            raise CommandError("--workers e --chunk-days devem ser maiores que zero.")
+
+        checkpoint_path = options['checkpoint']
+        checkpoint = self._load_checkpoint(checkpoint_path, start_date, end_date, chunk_days, options['reset'])
+        done = set(checkpoint['done'])
+
+        chunks = self._split(start_date, end_date, chunk_days)
+        pending = [chunk for chunk in chunks if chunk[0].isoformat() not in done]
+        self.stdout.write(f"{len(chunks)} bloco(s) no período, {len(pending)} pendente(s).")
+
+        # Cada bloco é buscado em sua própria thread (uma chamada de série temporal ou dia a dia);
+        # `workers` limita as requisições simultâneas
+        service = VatComplyService(
+            max_workers=1,
+            max_connections_per_host=workers,
+            base_url=options['base_url'],
+            range_url=options['range_url'],
+            # Blocos chegam fora de ordem: os indicadores são estendidos uma única vez no final
+            update_analytics=False,
+        )
+
+        # Lacunas do período inteiro numa consulta ao índice de cobertura
+        missing = None if options['refetch'] else set(service.find_missing_days(start_date, end_date))
+
+        total_rows = 0
+        failed_days = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._fetch_chunk, service, chunk, missing): chunk for chunk in pending}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                days, results = future.result()
+                rows = [(day, result['rates']) for day, result in zip(days, results) if result]
+                saved = service.save_rates(rows)
+                total_rows += saved
+                chunk_failed = len(days) - saved
+                failed_days += chunk_failed
+
+                # Bloco com falhas fica pendente: a próxima execução busca só os dias que faltam
+                if not chunk_failed:
+                    done.add(chunk[0].isoformat())
+                    checkpoint['done'] = sorted(done)
+                    self._save_checkpoint(checkpoint_path, checkpoint)
+                self.stdout.write(f"Bloco {chunk[0]} a {chunk[1]}: {saved} cotação(ões) salva(s).")
+
+        indicators = update_indicators(start_date)
+        self.stdout.write(f"{indicators} indicador(es) móvel(is) recalculado(s) a partir de {start_date}.")
+
+        elapsed = time.monotonic() - started
+        rate = total_rows / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfill concluído: {total_rows} linha(s) em {elapsed:.2f}s ({rate:.1f} linhas/s)."
+        ))
+        if failed_days:
+            self.stdout.write(self.style.WARNING(
+                f"{failed_days} dia(s) sem cotação retornada pela API; os blocos deles continuam "
+                "pendentes e são buscados de novo na próxima execução."
+            ))
+
+    def _fetch_chunk(self, service, chunk, missing):
+        days = service.business_days(*chunk)
+        if missing is not None:
+            days = [day for day in days if day in missing]
+        return days, service.fetch_rates(days)
+
+    def _split(self, start_date, end_date, chunk_days):
+        chunks = []
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end + timedelta(days=1)
+        return chunks
+
+    def _load_checkpoint(self, path, start_date, end_date, chunk_days, reset):
+        fresh = {
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'chunk_days': chunk_days,
+            'done': [],
+        }
+        if reset or not os.path.exists(path):
+            return fresh
+        with open(path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if {key: checkpoint.get(key) for key in ('start', 'end', 'chunk_days')} != \
+                {key: fresh[key] for key in ('start', 'end', 'chunk_days')}:
+            self.stdout.write(self.style.WARNING("Checkpoint de outro período encontrado; começando do zero."))
+            return fresh
+        self.stdout.write(f"Retomando a partir do checkpoint {path}.")
+        return checkpoint
+
+    def _save_checkpoint(self, path, checkpoint):
+        # Escreve em um arquivo temporário e troca, para o checkpoint nunca ficar corrompido
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
+
+    def _parse_date(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"Formato de data inválido: {value}. Use YYYY-MM-DD.")
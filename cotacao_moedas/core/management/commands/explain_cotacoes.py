@@ -0,0 +1,72 @@
+# cotacao_moedas/core/management/commands/explain_cotacoes.py
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.query_plans import check_plan, explain, heap_fetches, hot_queries
+
+
+class Command(BaseCommand):
+    help = (
+        "Relatório dos planos de execução das leituras de Cotacao por período no banco atual "
+        "(SQLite ou PostgreSQL): confere se cada uma sai só do índice de cobertura de `data`, "
+        "sem ler a tabela e sem etapa de ordenação."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="Data inicial (YYYY-MM-DD). Padrão: um ano antes de --end.")
+        parser.add_argument('--end', help="Data final (YYYY-MM-DD). Padrão: hoje.")
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help="PostgreSQL: EXPLAIN (ANALYZE, BUFFERS), executando as queries e mostrando os Heap Fetches.",
+        )
+        parser.add_argument(
+            '--force-index', action='store_true',
+            help="PostgreSQL: desliga seq scan e bitmap scan (SET LOCAL) para conferir o plano com o "
+                 "índice mesmo em tabelas pequenas, onde o planejador prefere ler a tabela inteira.",
+        )
+        parser.add_argument('--strict', action='store_true', help="Termina com erro se algum plano tiver problemas.")
+
+    def handle(self, *args, **options):
+        try:
+            end_date = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else timezone.localdate()
+            start_date = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] else end_date - timedelta(days=365)
+        except ValueError:
+            raise CommandError("Formato de data inválido. Use YYYY-MM-DD.")
+        if end_date < start_date:
+            raise CommandError("A data de início deve ser anterior à data de fim.")
+
+        vendor = connection.vendor
+        self.stdout.write(f"Banco: {vendor}. Período: {start_date} a {end_date}.")
+        failed = []
+        with transaction.atomic():
+            if vendor == 'postgresql' and options['force_index']:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                    cursor.execute('SET LOCAL enable_bitmapscan = off')
+            for query in hot_queries(start_date, end_date):
+                plan = explain(query, options['analyze'])
+                problems = check_plan(vendor, plan, query.ordered)
+                self.stdout.write(f"\n[{query.name}] {query.description}")
+                self.stdout.write(plan)
+                if problems is None:
+                    self.stdout.write(self.style.WARNING("Não verificado neste banco."))
+                elif problems:
+                    failed.append(query.name)
+                    self.stdout.write(self.style.ERROR(f"Problemas: {'; '.join(problems)}."))
+                else:
+                    self.stdout.write(self.style.SUCCESS("OK: index-only, sem ordenação."))
+                if vendor == 'postgresql' and options['analyze'] and heap_fetches(plan):
+                    self.stdout.write(self.style.WARNING(
+                        f"{heap_fetches(plan)} linha(s) buscadas na tabela (Heap Fetches): rode VACUUM em core_cotacao."
+                    ))
+
+        if failed:
+            message = f"{len(failed)} plano(s) com problemas: {', '.join(failed)}."
+            if options['strict']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("\nTodos os planos verificados estão index-only."))
@@ -0,0 +1,113 @@
+# cotacao_moedas/core/management/commands/import_cotacoes.py
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from core.analytics import update_indicators
+from core.importer import ON_CONFLICT_CHOICES, BulkLoader, InvalidRecord, detect_format, open_text, read_records, refresh_derived
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa cotações de arquivos CSV (date,BRL,EUR,...) ou NDJSON ({\"date\": ..., \"rates\": {...}}), "
+        "opcionalmente .gz, lendo em stream, validando e gravando em lotes (COPY no PostgreSQL, "
+        "executemany nos demais bancos). Ao final atualiza resumos, indicadores e o cache."
+    )
+
+    # Quantos registros inválidos são listados na saída
+    MAX_REPORTED_ERRORS = 20
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help="Arquivos a importar ('-' para a entrada padrão).")
+        parser.add_argument('--format', choices=['auto', 'csv', 'ndjson'], default='auto', help="Formato (padrão: pela extensão).")
+        parser.add_argument(
+            '--on-conflict', choices=ON_CONFLICT_CHOICES, default='update',
+            help=(
+                "Data já existente: update (substitui as taxas do arquivo), skip (mantém) ou error "
+                "(aborta e desfaz a importação inteira)."
+            ),
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help="Registros por lote.")
+        parser.add_argument(
+            '--base', default='USD',
+            help="Moeda base das taxas do arquivo. Com base diferente de USD só a tabela TaxaCambio é gravada.",
+        )
+        parser.add_argument('--strict', action='store_true', help="Aborta no primeiro registro inválido.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size deve ser maior que zero.")
+        loader = BulkLoader(options['on_conflict'], options['base'].upper())
+        self.stdout.write(f"Carga via {'COPY' if loader.use_copy else 'executemany'}, conflitos: {options['on_conflict']}.")
+
+        self.loaded = 0
+        self.invalid = 0
+        self.first_day = None
+        # Com 'error' a importação é tudo ou nada: os lotes rodam numa única transação e
+        # resumos/cache só são atualizados depois do commit
+        all_or_nothing = loader.on_conflict == 'error'
+        self.deferred_dates = [] if all_or_nothing else None
+        started = time.monotonic()
+        with transaction.atomic() if all_or_nothing else nullcontext():
+            for path in options['files']:
+                file_format = options['format'] if options['format'] != 'auto' else detect_format(path)
+                stream = sys.stdin if path == '-' else open_text(path)
+                try:
+                    self._import_stream(stream, file_format, path, loader, options)
+                except InvalidRecord as e:
+                    raise CommandError(f"{path}: {e}")
+                finally:
+                    if stream is not sys.stdin:
+                        stream.close()
+        if self.deferred_dates:
+            refresh_derived(self.deferred_dates)
+
+        if self.first_day is not None:
+            # Indicadores móveis estendidos uma única vez, do dia mais antigo importado em diante
+            update_indicators(self.first_day)
+
+        elapsed = time.monotonic() - started
+        rate = self.loaded / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Importação concluída: {self.loaded} dia(s) em {elapsed:.2f}s ({rate:.1f} registros/s)."
+        ))
+        if self.invalid:
+            self.stdout.write(self.style.WARNING(f"{self.invalid} registro(s) inválido(s) ignorado(s)."))
+
+    def _import_stream(self, stream, file_format, path, loader, options):
+        batch = []
+        for line_num, day, rates in read_records(stream, file_format):
+            if day is None:
+                self.invalid += 1
+                if options['strict']:
+                    raise CommandError(f"{path}:{line_num}: {rates}")
+                if self.invalid <= self.MAX_REPORTED_ERRORS:
+                    self.stderr.write(f"{path}:{line_num}: {rates}")
+                continue
+            batch.append((day, rates))
+            if len(batch) >= options['batch_size']:
+                self._flush(batch, loader)
+                batch = []
+        self._flush(batch, loader)
+
+    def _flush(self, batch, loader):
+        if not batch:
+            return
+        try:
+            self.loaded += loader.load(batch)
+        except IntegrityError as e:
+            raise CommandError(
+                f"Cotação já existente no lote (use --on-conflict update ou skip), nada foi importado: {e}"
+            )
+        if self.deferred_dates is not None:
+            self.deferred_dates.extend(day for day, _ in batch)
+        else:
+            refresh_derived([day for day, _ in batch])
+        # Indicadores só derivam de Cotacao: lotes em outra base não os alteram
+        quote_dates = loader.quote_dates(batch)
+        if quote_dates:
+            first = min(quote_dates)
+            self.first_day = first if self.first_day is None else min(self.first_day, first)
@@ -0,0 +1,67 @@
+# cotacao_moedas/core/management/commands/ingest_cotacoes.py
+import sched
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core.analytics import process_pending
+from core.services import VatComplyService
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de ingestão: em intervalos regulares busca o dia útil mais recente na VatComply "
+        "e preenche as lacunas dos últimos dias, para que as requisições nunca esperem pela API "
+        "externa (veja COTACOES_API_DB_ONLY em settings). Também recalcula os indicadores móveis "
+        "marcados como pendentes pelas gravações de cotações."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=900, help="Segundos entre execuções.")
+        parser.add_argument('--lookback-days', type=int, default=30, help="Janela, em dias, em que lacunas são preenchidas.")
+        parser.add_argument('--once', action='store_true', help="Executa um único ciclo e sai.")
+        parser.add_argument('--today', help="Data de referência (YYYY-MM-DD). Padrão: hoje.")
+
+    def handle(self, *args, **options):
+        if options['interval'] < 1 or options['lookback_days'] < 0:
+            raise CommandError("--interval deve ser maior que zero e --lookback-days não pode ser negativo.")
+        try:
+            self.today = datetime.strptime(options['today'], '%Y-%m-%d').date() if options['today'] else None
+        except ValueError:
+            raise CommandError(f"Formato de data inválido: {options['today']}. Use YYYY-MM-DD.")
+        self.options = options
+        self.service = VatComplyService()
+
+        if options['once']:
+            self.run_cycle()
+            return
+
+        self.scheduler = sched.scheduler(time.monotonic, time.sleep)
+        self.scheduler.enter(0, 1, self._scheduled_cycle)
+        self.stdout.write(f"Worker de ingestão iniciado (intervalo de {options['interval']}s). Ctrl+C para sair.")
+        try:
+            self.scheduler.run()
+        except KeyboardInterrupt:
+            self.stdout.write("Worker de ingestão encerrado.")
+
+    def _scheduled_cycle(self):
+        # Agenda o próximo ciclo antes de executar este, mantendo o intervalo estável
+        self.scheduler.enter(self.options['interval'], 1, self._scheduled_cycle)
+        try:
+            self.run_cycle()
+        except Exception as e:
+            # Uma falha (banco fora do ar, por exemplo) não pode derrubar o worker
+            self.stderr.write(f"Erro no ciclo de ingestão: {e}")
+
+    def run_cycle(self):
+        close_old_connections()
+        started = time.monotonic()
+        saved = self.service.sync_recent(self.options['lookback_days'], today=self.today)
+        indicators = process_pending()
+        message = f"Ciclo de ingestão: {saved} cotação(ões) salva(s)"
+        if indicators is not None:
+            message += f", {indicators} indicador(es) móvel(is) recalculado(s)"
+        self.stdout.write(f"{message} em {time.monotonic() - started:.2f}s.")
+        return saved
@@ -0,0 +1,32 @@
+# cotacao_moedas/core/management/commands/rebuild_resumos.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import coverage
+from core.analytics import update_indicators
+from core.summaries import update_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói do zero as tabelas derivadas de Cotacao (resumos mensais/anuais, "
+        "indicadores móveis e índice de cobertura), para quando elas divergirem dos dados "
+        "diários ou depois de trocar o calendário de feriados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-indicators', action='store_true', help="Não reconstrói os indicadores móveis.")
+        parser.add_argument('--skip-coverage', action='store_true', help="Não reconstrói o índice de cobertura.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        summaries = update_summaries()
+        self.stdout.write(f"{summaries} resumo(s) reconstruído(s).")
+        if not options['skip_indicators']:
+            indicators = update_indicators()
+            self.stdout.write(f"{indicators} indicador(es) móvel(is) reconstruído(s).")
+        if not options['skip_coverage']:
+            runs = coverage.rebuild()
+            self.stdout.write(f"{runs} intervalo(s) de cobertura reconstruído(s).")
+        self.stdout.write(self.style.SUCCESS(f"Reconstrução concluída em {time.monotonic() - started:.2f}s."))
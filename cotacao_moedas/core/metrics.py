@@ -0,0 +1,181 @@
+# cotacao_moedas/core/metrics.py
+"""
+Métricas de processo (contadores e timers) expostas no formato texto do Prometheus em /metrics.
+
+Ficam desligadas por padrão (settings.COTACOES_METRICS_ENABLED): desligadas, inc() e
+timer() retornam sem tocar em lock nem relógio, então o custo nos caminhos quentes é o de
+uma chamada de função. Os valores são por processo; com vários workers cada um responde
+pelos seus (o Prometheus agrega pelos rótulos de instância).
+
+    from core import metrics
+    metrics.inc('cotacoes_cache_requests_total', result='hit')
+    with metrics.timer('cotacoes_db_upsert_seconds'):
+        ...
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+# Limites (em segundos) dos buckets dos histogramas
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'cotacoes_upstream_request_seconds': 'Latência das requisições à API externa (VatComply).',
+    'cotacoes_upstream_requests_total': 'Requisições à API externa por resultado.',
+    'cotacoes_db_upsert_seconds': 'Tempo do upsert em massa das cotações no banco.',
+    'cotacoes_db_upsert_rows_total': 'Dias gravados pelo upsert em massa.',
+    'cotacoes_serialization_seconds': 'Tempo de montagem e serialização JSON das respostas.',
+    'cotacoes_cache_requests_total': 'Consultas ao cache de séries por resultado (hit/miss).',
+}
+
+
+def enabled():
+    return getattr(settings, 'COTACOES_METRICS_ENABLED', False)
+
+
+class _Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1) # Último bucket: +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Contadores e histogramas por (nome, rótulos), protegidos por um lock.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def value(self, name, **labels):
+        """
+        Valor de um contador (ou número de observações de um histograma); 0 se não existir.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key].count
+            return self._counters.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """
+        Texto no formato de exposição do Prometheus (versão 0.0.4).
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.total, h.count)) for key, h in self._histograms.items()
+            )
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append(f'# HELP {name} {HELP[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f'{name}{_labels(labels)} {value}')
+        for (name, labels), (counts, total, count) in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+
+        hits = sum(value for (name, labels), value in counters if name == 'cotacoes_cache_requests_total' and ('result', 'hit') in labels)
+        lookups = sum(value for (name, _), value in counters if name == 'cotacoes_cache_requests_total')
+        if lookups:
+            lines.append('# HELP cotacoes_cache_hit_ratio Fração das consultas ao cache de séries atendidas pelo cache.')
+            lines.append('# TYPE cotacoes_cache_hit_ratio gauge')
+            lines.append(f'cotacoes_cache_hit_ratio {hits / lookups}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+registry = Registry()
+
+
+def inc(name, amount=1, **labels):
+    if enabled():
+        registry.inc(name, amount, **labels)
+
+
+class _Timer:
+    __slots__ = ('name', 'labels', 'started')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """
+    Context manager que registra a duração do bloco no histograma `name`.
+    """
+    if not enabled():
+        return _NULL_TIMER
+    return _Timer(name, labels)
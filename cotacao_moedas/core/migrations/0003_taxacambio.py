@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+def copiar_cotacoes(apps, schema_editor):
+    # Popula a tabela normalizada com as moedas das colunas fixas de Cotacao
+    Cotacao = apps.get_model('core', 'Cotacao')
+    TaxaCambio = apps.get_model('core', 'TaxaCambio')
+    campos = {'BRL': 'valor_brl', 'EUR': 'valor_eur', 'JPY': 'valor_jpy'}
+    taxas = []
+    for cotacao in Cotacao.objects.order_by('data').iterator(chunk_size=2000):
+        for moeda, campo in campos.items():
+            valor = getattr(cotacao, campo)
+            if valor is not None:
+                taxas.append(TaxaCambio(data=cotacao.data, base='USD', moeda=moeda, taxa=valor))
+    TaxaCambio.objects.bulk_create(taxas, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_cotacao_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxaCambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(help_text='Data da cotação (formato YYYY-MM-DD)')),
+                ('base', models.CharField(default='USD', help_text='Moeda base (ex.: USD)', max_length=3)),
+                ('moeda', models.CharField(help_text='Moeda cotada (ex.: BRL)', max_length=3)),
+                ('taxa', models.DecimalField(decimal_places=8, help_text='Valor de 1 unidade da moeda base na moeda cotada', max_digits=18)),
+                ('data_registro', models.DateTimeField(auto_now_add=True, help_text='Data e hora do registro/última atualização no banco de dados')),
+            ],
+            options={
+                'verbose_name': 'Taxa de câmbio',
+                'verbose_name_plural': 'Taxas de câmbio',
+                'indexes': [models.Index(fields=['moeda', 'base', 'data', 'taxa'], name='taxacambio_moeda_data_idx')],
+                'constraints': [models.UniqueConstraint(fields=('data', 'base', 'moeda'), name='taxacambio_data_base_moeda_uniq')],
+            },
+        ),
+        migrations.RunPython(copiar_cotacoes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_taxacambio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndicadorCotacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(help_text='Data da cotação (formato YYYY-MM-DD)')),
+                ('moeda', models.CharField(help_text='Moeda (ex.: BRL)', max_length=3)),
+                ('janela', models.PositiveSmallIntegerField(help_text='Tamanho da janela, em dias com cotação')),
+                ('sma', models.FloatField(blank=True, help_text='Média móvel simples da janela', null=True)),
+                ('ema', models.FloatField(blank=True, help_text='Média móvel exponencial (alfa = 2 / (janela + 1))', null=True)),
+                ('desvio_padrao', models.FloatField(blank=True, help_text='Desvio padrão amostral da janela', null=True)),
+                ('retorno', models.FloatField(blank=True, help_text='Retorno em relação ao dia com cotação anterior', null=True)),
+            ],
+            options={
+                'verbose_name': 'Indicador de cotação',
+                'verbose_name_plural': 'Indicadores de cotação',
+                'constraints': [models.UniqueConstraint(fields=('moeda', 'janela', 'data'), name='indicador_moeda_janela_data_uniq')],
+            },
+        ),
+    ]
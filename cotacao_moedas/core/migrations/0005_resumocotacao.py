@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_indicadorcotacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoCotacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('month', 'Mensal'), ('year', 'Anual')], help_text='Granularidade do agregado', max_length=5)),
+                ('inicio', models.DateField(help_text='Primeiro dia do período (YYYY-MM-01 ou YYYY-01-01)')),
+                ('moeda', models.CharField(help_text='Moeda (ex.: BRL)', max_length=3)),
+                ('media', models.FloatField(blank=True, help_text='Média das cotações do período', null=True)),
+                ('minimo', models.FloatField(blank=True, help_text='Menor cotação do período', null=True)),
+                ('maximo', models.FloatField(blank=True, help_text='Maior cotação do período', null=True)),
+                ('dias', models.PositiveIntegerField(default=0, help_text='Dias com cotação no período')),
+            ],
+            options={
+                'verbose_name': 'Resumo de cotação',
+                'verbose_name_plural': 'Resumos de cotação',
+                'constraints': [models.UniqueConstraint(fields=('periodo', 'moeda', 'inicio'), name='resumo_periodo_moeda_inicio_uniq')],
+            },
+        ),
+    ]
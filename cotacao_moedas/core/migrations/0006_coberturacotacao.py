@@ -0,0 +1,56 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:20
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def _sem_dia_de_semana_entre(anterior, data):
+    # Três dias seguidos sempre incluem um dia de semana; menos que isso, confere um a um
+    intermediarios = (data - anterior).days - 1
+    if intermediarios >= 3:
+        return False
+    return all((anterior + timedelta(days=i)).weekday() >= 5 for i in range(1, intermediarios + 1))
+
+
+def construir_cobertura(apps, schema_editor):
+    # Agrupa as datas já salvas em intervalos sem nenhum dia de semana faltando. Sem o
+    # calendário de feriados (código do app), um feriado corta o intervalo: o índice fica menos
+    # compacto, mas correto, e rebuild_resumos o reconstrói com o calendário configurado
+    Cotacao = apps.get_model('core', 'Cotacao')
+    CoberturaCotacao = apps.get_model('core', 'CoberturaCotacao')
+    intervalos = []
+    for data in Cotacao.objects.order_by('data').values_list('data', flat=True).iterator(chunk_size=5000):
+        if intervalos and _sem_dia_de_semana_entre(intervalos[-1][1], data):
+            intervalos[-1][1] = data
+        else:
+            intervalos.append([data, data])
+    CoberturaCotacao.objects.bulk_create(
+        [CoberturaCotacao(inicio=inicio, fim=fim) for inicio, fim in intervalos], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_resumocotacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoberturaCotacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateField(help_text='Primeiro dia útil do intervalo')),
+                ('fim', models.DateField(help_text='Último dia útil do intervalo')),
+            ],
+            options={
+                'verbose_name': 'Cobertura de cotações',
+                'verbose_name_plural': 'Coberturas de cotações',
+                'ordering': ['inicio'],
+                'indexes': [models.Index(fields=['inicio', 'fim'], name='cobertura_inicio_fim_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('fim__gte', models.F('inicio'))), name='cobertura_fim_gte_inicio')],
+            },
+        ),
+        migrations.RunPython(construir_cobertura, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:24
+
+import core.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_coberturacotacao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cotacao',
+            index=core.models.CoveringIndex(covering=('valor_brl', 'valor_eur', 'valor_jpy', 'data_registro'), fields=['data'], name='cotacao_data_covering_idx'),
+        ),
+    ]
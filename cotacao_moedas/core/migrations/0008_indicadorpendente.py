@@ -0,0 +1,67 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:02
+
+import math
+from collections import deque
+
+from django.conf import settings
+from django.db import migrations, models
+
+MOEDAS = {'BRL': 'valor_brl', 'EUR': 'valor_eur', 'JPY': 'valor_jpy'}
+
+
+def calcular_indicadores(apps, schema_editor):
+    # Preenche IndicadorCotacao com a série inteira, para que a primeira gravação depois do
+    # deploy só estenda os indicadores. Média e desvio padrão são recalculados sobre os
+    # valores da janela a cada dia (O(n x janela), uma única vez), sem código do app
+    Cotacao = apps.get_model('core', 'Cotacao')
+    IndicadorCotacao = apps.get_model('core', 'IndicadorCotacao')
+    janelas = sorted(set(getattr(settings, 'COTACOES_ANALYTICS_WINDOWS', (5, 21))))
+    IndicadorCotacao.objects.all().delete()
+    for moeda, campo in MOEDAS.items():
+        serie = list(
+            Cotacao.objects.filter(**{f'{campo}__isnull': False}).order_by('data').values_list('data', campo)
+        )
+        for janela in janelas:
+            alfa = 2.0 / (janela + 1)
+            valores = deque(maxlen=janela)
+            ema = None
+            anterior = None
+            objs = []
+            for data, valor in serie:
+                valor = float(valor)
+                valores.append(valor)
+                ema = valor if ema is None else alfa * valor + (1 - alfa) * ema
+                sma = desvio = None
+                if len(valores) == janela:
+                    sma = math.fsum(valores) / janela
+                    if janela > 1:
+                        desvio = math.sqrt(math.fsum((v - sma) ** 2 for v in valores) / (janela - 1))
+                objs.append(IndicadorCotacao(
+                    data=data, moeda=moeda, janela=janela, sma=sma, ema=ema, desvio_padrao=desvio,
+                    retorno=valor / anterior - 1 if anterior else None,
+                ))
+                anterior = valor
+            IndicadorCotacao.objects.bulk_create(objs, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_cotacao_data_covering_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndicadorPendente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desde', models.DateField(help_text='Primeiro dia com indicadores desatualizados')),
+                ('versao', models.PositiveBigIntegerField(default=0, help_text='Incrementada a cada gravação marcada')),
+            ],
+            options={
+                'verbose_name': 'Indicador pendente',
+                'verbose_name_plural': 'Indicadores pendentes',
+            },
+        ),
+        migrations.RunPython(calcular_indicadores, migrations.RunPython.noop),
+    ]
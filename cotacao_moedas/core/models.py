@@ -1,17 +1,354 @@
 # cotacao_moedas/core/models.py
+from itertools import islice
+
+from asgiref.sync import sync_to_async
 from django.db import models
+from django.db.models import CharField, FloatField
+from django.db.models.functions import Cast
+
+from .columnar import divide, to_floats, transpose
+
+
+async def aiterate(queryset, chunk_size=2000):
+    """
+    Percorre a query com async for, buscando blocos de `chunk_size` linhas de um cursor
+    (.iterator) numa thread. Substitui QuerySet.aiterator(), que em values_list anotados
+    executa a query dentro do event loop e levanta SynchronousOnlyOperation.
+    """
+    rows = queryset.iterator(chunk_size=chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while True:
+        chunk = await next_chunk()
+        for row in chunk:
+            yield row
+        if len(chunk) < chunk_size:
+            break
+
+
+class CoveringIndex(models.Index):
+    """
+    Índice em `fields` que também carrega as colunas `covering`, para que as leituras que
+    só usam essas colunas sejam index-only. No PostgreSQL as colunas entram como INCLUDE
+    (fora da chave da B-tree); nos bancos sem índices de cobertura (SQLite) são
+    acrescentadas ao fim da chave, o que dá o mesmo efeito nas leituras por `fields`.
+    """
+
+    def __init__(self, *args, covering=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.covering = tuple(covering)
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.features.supports_covering_indexes:
+            index = models.Index(fields=self.fields, include=self.covering, name=self.name)
+        else:
+            index = models.Index(fields=[*self.fields, *self.covering], name=self.name)
+        return index.create_sql(model, schema_editor, using=using, **kwargs)
+
+    def deconstruct(self):
+        path, args, kwargs = super().deconstruct()
+        kwargs['covering'] = self.covering
+        return path, args, kwargs
+
+
+class CotacaoQuerySet(models.QuerySet):
+
+    def in_range(self, start_date, end_date, ordered=True):
+        """
+        Cotações do período em ordem cronológica, lidas pelo índice de cobertura de `data`.
+        Com ordered=False a query sai sem ORDER BY (nem o Meta.ordering = ['-data']), para
+        quando a ordem não importa (dicionários por data, agregados, conjuntos): o banco
+        fica livre para escolher o plano mais barato sem uma etapa de ordenação.
+        """
+        queryset = self.filter(data__range=(start_date, end_date))
+        return queryset.order_by('data') if ordered else queryset.order_by()
+
+    def rows(self):
+        """
+        Tuplas (data 'YYYY-MM-DD', BRL, EUR, JPY) já convertidas pelo banco (CAST para texto e
+        float), sem instanciar modelos nem passar por Decimal/date no Python.
+        """
+        casts = {'data_str': Cast('data', CharField())}
+        for currency, field in Cotacao.CURRENCY_FIELDS.items():
+            casts[f'{field}_float'] = Cast(field, FloatField())
+        return self.annotate(**casts).values_list(*casts)
+
+    def columns(self, db_cast=True):
+        """
+        Série colunar {'dates': [...], 'BRL': [...], 'EUR': [...], 'JPY': [...]} em uma única
+        query e uma única passada de transposição.
+        Com db_cast=False os valores chegam como Decimal e são convertidos em bloco por
+        columnar.to_floats (vetorizado com NumPy, quando disponível).
+        """
+        keys = ['dates'] + list(Cotacao.CURRENCY_FIELDS)
+        if db_cast:
+            return dict(zip(keys, transpose(list(self.rows()), len(keys))))
+
+        fields = ['data'] + list(Cotacao.CURRENCY_FIELDS.values())
+        dates, *values = transpose(list(self.values_list(*fields)), len(fields))
+        columns = {'dates': [day.isoformat() for day in dates]}
+        for currency, column in zip(Cotacao.CURRENCY_FIELDS, values):
+            columns[currency] = to_floats(column)
+        return columns
+
+    async def acolumns(self):
+        """
+        Versão assíncrona de columns() (ORM assíncrono, para as views async).
+        """
+        keys = ['dates'] + list(Cotacao.CURRENCY_FIELDS)
+        return dict(zip(keys, transpose([row async for row in aiterate(self.rows())], len(keys))))
+
 
 class Cotacao(models.Model):
+    # Moeda -> coluna com o valor de 1 USD nessa moeda
+    CURRENCY_FIELDS = {
+        'BRL': 'valor_brl',
+        'EUR': 'valor_eur',
+        'JPY': 'valor_jpy',
+    }
+
     data = models.DateField(unique=True, help_text="Data da cotação (formato YYYY-MM-DD)")
     valor_brl = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True, help_text="Valor do Dólar em Real (USD/BRL)")
     valor_eur = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True, help_text="Valor do Dólar em Euro (USD/EUR)")
     valor_jpy = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True, help_text="Valor do Dólar em Iene (USD/JPY)")
     data_registro = models.DateTimeField(auto_now_add=True, help_text="Data e hora do registro/última atualização no banco de dados")
 
+    objects = CotacaoQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Cotação"
         verbose_name_plural = "Cotações"
         ordering = ['-data'] # Ordena por data (mais recente primeiro)
+        indexes = [
+            # Leituras por período (séries, streaming, ETag, cache no banco) só tocam essas
+            # colunas e ficam index-only, sem ir à tabela
+            CoveringIndex(
+                fields=['data'], covering=['valor_brl', 'valor_eur', 'valor_jpy', 'data_registro'],
+                name='cotacao_data_covering_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Cotações de USD para {self.data.strftime('%Y-%m-%d')}"
+
+
+class _RowPivot:
+    """
+    Agrupa linhas (data, moeda, taxa) ordenadas por data em tuplas (data, taxa de cada moeda).
+    push() devolve a tupla do dia anterior quando a data muda; finish() devolve a última.
+    """
+
+    def __init__(self, currencies):
+        self.width = len(currencies)
+        self.position = {currency: index for index, currency in enumerate(currencies, start=1)}
+        self.current = None
+
+    def push(self, day, currency, rate):
+        completed = None
+        if self.current is None or self.current[0] != day:
+            if self.current is not None:
+                completed = tuple(self.current)
+            self.current = [day] + [None] * self.width
+        self.current[self.position[currency]] = rate
+        return completed
+
+    def finish(self):
+        return tuple(self.current) if self.current is not None else None
+
+
+class TaxaCambioQuerySet(models.QuerySet):
+
+    def for_base(self, base):
+        """
+        Taxas de uma única moeda base. Toda leitura das APIs filtra a base (a da VatComply):
+        o importador pode gravar outras bases nas mesmas datas e moedas.
+        """
+        return self.filter(base=base)
+
+    def _pivot_source(self, currencies, descending):
+        """
+        Linhas normalizadas (data 'YYYY-MM-DD', moeda, taxa float) das moedas pedidas, na
+        ordem em que pivot_rows as agrupa.
+        """
+        return (
+            self.filter(moeda__in=currencies)
+            .annotate(data_str=Cast('data', CharField()), taxa_float=Cast('taxa', FloatField()))
+            .order_by('-data' if descending else 'data', 'moeda')
+            .values_list('data_str', 'moeda', 'taxa_float')
+        )
+
+    def pivot_rows(self, currencies, descending=False, chunk_size=2000):
+        """
+        Gera tuplas (data 'YYYY-MM-DD', taxa da 1ª moeda, taxa da 2ª moeda, ...) no mesmo
+        formato de CotacaoQuerySet.rows(), pivotando as linhas normalizadas das moedas pedidas
+        em uma única passada por um cursor (.iterator). Moedas sem taxa no dia ficam None.
+        """
+        pivot = _RowPivot(currencies)
+        for day, currency, rate in self._pivot_source(currencies, descending).iterator(chunk_size=chunk_size):
+            row = pivot.push(day, currency, rate)
+            if row is not None:
+                yield row
+        row = pivot.finish()
+        if row is not None:
+            yield row
+
+    async def apivot_rows(self, currencies, descending=False, chunk_size=2000):
+        """
+        Versão assíncrona de pivot_rows() (async for, ver aiterate).
+        """
+        pivot = _RowPivot(currencies)
+        async for day, currency, rate in aiterate(self._pivot_source(currencies, descending), chunk_size):
+            row = pivot.push(day, currency, rate)
+            if row is not None:
+                yield row
+        row = pivot.finish()
+        if row is not None:
+            yield row
+
+    def series(self, currencies, descending=False):
+        """
+        Série colunar {'dates': [...], '<moeda>': [...], ...} das moedas pedidas, em uma única query.
+        """
+        columns = transpose(list(self.pivot_rows(currencies, descending)), len(currencies) + 1)
+        return dict(zip(['dates', *currencies], columns))
+
+    async def aseries(self, currencies, descending=False):
+        """
+        Versão assíncrona de series().
+        """
+        rows = [row async for row in self.apivot_rows(currencies, descending)]
+        return dict(zip(['dates', *currencies], transpose(rows, len(currencies) + 1)))
+
+    def cross_rates(self, from_currency, to_currency, base='USD'):
+        """
+        Taxa cruzada from_currency -> to_currency (quanto vale 1 from_currency em to_currency)
+        derivada das taxas com base `base`: taxa(to) / taxa(from), com a taxa da própria
+        base igual a 1. Retorna {'dates': [...], 'rates': [...]} com uma query e uma divisão
+        vetorizada; dias sem alguma das taxas ficam None.
+        """
+        currencies = [currency for currency in dict.fromkeys((from_currency, to_currency)) if currency != base]
+        series = self.for_base(base).series(currencies)
+        ones = [1.0] * len(series['dates'])
+        rates = divide(series.get(to_currency, ones), series.get(from_currency, ones))
+        return {'dates': series['dates'], 'rates': rates}
+
+
+class TaxaCambio(models.Model):
+    """
+    Taxa de câmbio normalizada: uma linha por (data, moeda base, moeda), para qualquer
+    quantidade de moedas. O índice (moeda, base, data, taxa) cobre as consultas de uma moeda
+    ao longo de um período, que são respondidas só pelo índice (index-only scan).
+    """
+    data = models.DateField(help_text="Data da cotação (formato YYYY-MM-DD)")
+    base = models.CharField(max_length=3, default='USD', help_text="Moeda base (ex.: USD)")
+    moeda = models.CharField(max_length=3, help_text="Moeda cotada (ex.: BRL)")
+    taxa = models.DecimalField(max_digits=18, decimal_places=8, help_text="Valor de 1 unidade da moeda base na moeda cotada")
+    data_registro = models.DateTimeField(auto_now_add=True, help_text="Data e hora do registro/última atualização no banco de dados")
+
+    objects = TaxaCambioQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Taxa de câmbio"
+        verbose_name_plural = "Taxas de câmbio"
+        constraints = [
+            models.UniqueConstraint(fields=['data', 'base', 'moeda'], name='taxacambio_data_base_moeda_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['moeda', 'base', 'data', 'taxa'], name='taxacambio_moeda_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.base}/{self.moeda} em {self.data.strftime('%Y-%m-%d')}: {self.taxa}"
+
+
+class IndicadorCotacao(models.Model):
+    """
+    Indicadores de janela móvel de uma moeda em um dia (veja core.analytics), mantidos
+    incrementalmente pelo worker de ingestão. `janela` é o tamanho da janela em dias com cotação.
+    """
+    data = models.DateField(help_text="Data da cotação (formato YYYY-MM-DD)")
+    moeda = models.CharField(max_length=3, help_text="Moeda (ex.: BRL)")
+    janela = models.PositiveSmallIntegerField(help_text="Tamanho da janela, em dias com cotação")
+    sma = models.FloatField(null=True, blank=True, help_text="Média móvel simples da janela")
+    ema = models.FloatField(null=True, blank=True, help_text="Média móvel exponencial (alfa = 2 / (janela + 1))")
+    desvio_padrao = models.FloatField(null=True, blank=True, help_text="Desvio padrão amostral da janela")
+    retorno = models.FloatField(null=True, blank=True, help_text="Retorno em relação ao dia com cotação anterior")
+
+    class Meta:
+        verbose_name = "Indicador de cotação"
+        verbose_name_plural = "Indicadores de cotação"
+        constraints = [
+            models.UniqueConstraint(fields=['moeda', 'janela', 'data'], name='indicador_moeda_janela_data_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.moeda} ({self.janela}d) em {self.data.strftime('%Y-%m-%d')}"
+
+
+class IndicadorPendente(models.Model):
+    """
+    Marcador (registro único, id=1) de que IndicadorCotacao está desatualizado a partir de
+    `desde`. Cada gravação de cotações recua `desde` para o dia mais antigo gravado e
+    incrementa `versao`; o worker de ingestão recalcula os indicadores e apaga o marcador
+    (veja core.analytics.process_pending).
+    """
+    desde = models.DateField(help_text="Primeiro dia com indicadores desatualizados")
+    versao = models.PositiveBigIntegerField(default=0, help_text="Incrementada a cada gravação marcada")
+
+    class Meta:
+        verbose_name = "Indicador pendente"
+        verbose_name_plural = "Indicadores pendentes"
+
+    def __str__(self):
+        return f"Indicadores pendentes desde {self.desde.strftime('%Y-%m-%d')}"
+
+
+class ResumoCotacao(models.Model):
+    """
+    Agregado mensal ou anual de uma moeda (média, mínima, máxima e dias com cotação),
+    recalculado para os períodos tocados a cada ingestão (veja core.summaries). Consultas
+    agregadas leem um registro por período em vez de todos os dias.
+    """
+    PERIODOS = [('month', 'Mensal'), ('year', 'Anual')]
+
+    periodo = models.CharField(max_length=5, choices=PERIODOS, help_text="Granularidade do agregado")
+    inicio = models.DateField(help_text="Primeiro dia do período (YYYY-MM-01 ou YYYY-01-01)")
+    moeda = models.CharField(max_length=3, help_text="Moeda (ex.: BRL)")
+    media = models.FloatField(null=True, blank=True, help_text="Média das cotações do período")
+    minimo = models.FloatField(null=True, blank=True, help_text="Menor cotação do período")
+    maximo = models.FloatField(null=True, blank=True, help_text="Maior cotação do período")
+    dias = models.PositiveIntegerField(default=0, help_text="Dias com cotação no período")
+
+    class Meta:
+        verbose_name = "Resumo de cotação"
+        verbose_name_plural = "Resumos de cotação"
+        constraints = [
+            models.UniqueConstraint(fields=['periodo', 'moeda', 'inicio'], name='resumo_periodo_moeda_inicio_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.moeda} ({self.periodo}) a partir de {self.inicio.strftime('%Y-%m-%d')}"
+
+
+class CoberturaCotacao(models.Model):
+    """
+    Intervalo de dias úteis já presentes em Cotacao: todo dia útil (no calendário de
+    settings.COTACOES_HOLIDAY_CALENDAR) entre `inicio` e `fim` tem cotação. Os intervalos
+    não se sobrepõem e são fundidos quando ficam contíguos (veja core.coverage), então
+    saber se um período está completo custa O(intervalos) em vez de O(dias).
+    """
+    inicio = models.DateField(help_text="Primeiro dia útil do intervalo")
+    fim = models.DateField(help_text="Último dia útil do intervalo")
+
+    class Meta:
+        verbose_name = "Cobertura de cotações"
+        verbose_name_plural = "Coberturas de cotações"
+        ordering = ['inicio']
+        constraints = [
+            models.CheckConstraint(condition=models.Q(fim__gte=models.F('inicio')), name='cobertura_fim_gte_inicio'),
+        ]
+        indexes = [
+            models.Index(fields=['inicio', 'fim'], name='cobertura_inicio_fim_idx'),
+        ]
 
     def __str__(self):
-        return f"Cotações de USD para {self.data.strftime('%Y-%m-%d')}"
\ No newline at end of file
+        return f"Cotações de {self.inicio.strftime('%Y-%m-%d')} a {self.fim.strftime('%Y-%m-%d')}"
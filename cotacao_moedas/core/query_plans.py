@@ -0,0 +1,97 @@
+# cotacao_moedas/core/query_plans.py
+"""
+Planos de execução das leituras quentes de Cotacao, usados pelo comando explain_cotacoes.
+
+Cada leitura por período deve sair inteira do índice de cobertura (cotacao_data_covering_idx,
+ver models.CoveringIndex), sem ir à tabela e sem etapa de ordenação: no SQLite o plano tem
+"USING COVERING INDEX" e nenhum "USE TEMP B-TREE"; no PostgreSQL, "Index Only Scan" e
+nenhum nó Sort, Seq Scan, Index Scan ou Bitmap Heap Scan. Nos demais bancos o plano é só
+exibido.
+"""
+import re
+
+from django.db import connection
+
+from .models import Cotacao
+
+RATE_FIELDS = list(Cotacao.CURRENCY_FIELDS.values())
+
+_PG_TABLE_ACCESS = re.compile(r'Seq Scan|Bitmap Heap Scan|(?<!Only )Index Scan')
+_PG_SORT = re.compile(r'Sort\s+\(')
+_PG_HEAP_FETCHES = re.compile(r'Heap Fetches: (\d+)')
+
+
+class PlannedQuery:
+    """
+    Leitura a verificar. `ordered`: a ordem tem de vir do índice (um Sort no plano é um problema).
+    """
+
+    def __init__(self, name, description, queryset, ordered):
+        self.name = name
+        self.description = description
+        self.queryset = queryset
+        self.ordered = ordered
+
+
+def hot_queries(start_date, end_date):
+    """
+    As leituras de Cotacao feitas a cada requisição, com os mesmos filtros e colunas das views.
+    """
+    return [
+        PlannedQuery(
+            'periodo', "Série de um período (get_cotacoes_db_api, streaming, exportação)",
+            Cotacao.objects.in_range(start_date, end_date).rows(), ordered=True,
+        ),
+        PlannedQuery(
+            'periodo-sem-ordem', "Cotações salvas do período (cache no banco de VatComplyService)",
+            Cotacao.objects.in_range(start_date, end_date, ordered=False).values_list('data', 'data_registro', *RATE_FIELDS),
+            ordered=False,
+        ),
+        PlannedQuery(
+            'etag', "Linhas lidas pelo agregado do ETag/Last-Modified (RangeValidators)",
+            Cotacao.objects.in_range(start_date, end_date, ordered=False).values_list('data', 'data_registro'),
+            ordered=False,
+        ),
+        PlannedQuery(
+            'recentes', "30 cotações mais recentes (get_cotacoes_db_api sem período)",
+            Cotacao.objects.order_by('-data')[:30].rows(), ordered=True,
+        ),
+    ]
+
+
+def check_plan(vendor, plan, ordered):
+    """
+    Problemas encontrados no plano (lista vazia se a leitura é index-only e sem ordenação).
+    Retorna None nos bancos sem verificação.
+    """
+    problems = []
+    if vendor == 'sqlite':
+        if 'USING COVERING INDEX' not in plan:
+            problems.append("não é index-only (sem USING COVERING INDEX)")
+        if ordered and 'USE TEMP B-TREE' in plan:
+            problems.append("ordenação fora do índice (USE TEMP B-TREE)")
+        return problems
+    if vendor == 'postgresql':
+        if 'Index Only Scan' not in plan or _PG_TABLE_ACCESS.search(plan):
+            problems.append("não é index-only (lê a tabela)")
+        if ordered and _PG_SORT.search(plan):
+            problems.append("ordenação fora do índice (nó Sort)")
+        return problems
+    return None
+
+
+def heap_fetches(plan):
+    """
+    Soma de "Heap Fetches" de um EXPLAIN ANALYZE do PostgreSQL: linhas que o Index Only
+    Scan ainda buscou na tabela por causa de páginas fora do visibility map (VACUUM resolve).
+    """
+    return sum(int(count) for count in _PG_HEAP_FETCHES.findall(plan))
+
+
+def explain(query, analyze=False):
+    """
+    Texto do plano da query no banco atual (EXPLAIN ANALYZE com analyze=True no PostgreSQL).
+    """
+    if connection.vendor == 'postgresql' and analyze:
+        return query.queryset.explain(analyze=True, buffers=True)
+    return query.queryset.explain()
@@ -1,91 +1,643 @@
 # cotacao_moedas/core/services.py
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, date, datetime
-from django.db import IntegrityError 
-from .models import Cotacao 
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from . import coverage, metrics
+from .analytics import mark_pending
+from .business_days import get_calendar
+from .cache import quote_series_cache
+from .singleflight import SharedSingleFlight, SingleFlight
+from .summaries import update_summaries
+from .models import Cotacao, TaxaCambio
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """
+    Levantada quando o circuito do host está aberto e a chamada é recusada sem ir à rede.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker simples (fechado -> aberto -> meio-aberto) para um host.
+    Após `failure_threshold` falhas seguidas o circuito abre e as chamadas falham
+    imediatamente; depois de `reset_timeout` segundos uma chamada de teste é liberada.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Meio-aberto: libera esta chamada e mantém as demais bloqueadas até o resultado
+                self._opened_at = time.monotonic()
+                return
+            raise CircuitOpenError("Circuito aberto: API externa indisponível, requisição não enviada.")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
 
 class VatComplyService:
     BASE_URL = "https://api.vatcomply.com/rates" 
+    # Moedas devolvidas por padrão; a ingestão grava todas as moedas recebidas em TaxaCambio
     TARGET_CURRENCIES = ['BRL', 'EUR', 'JPY']
     BASE_CURRENCY = 'USD'
+    # Mapeia cada moeda para a coluna correspondente em Cotacao
+    CURRENCY_FIELDS = Cotacao.CURRENCY_FIELDS
+    # Limites do motor de busca concorrente. O teto de conexões por host, somando todas as
+    # instâncias do processo, vem de settings.COTACOES_MAX_CONNECTIONS_PER_HOST
+    MAX_WORKERS = 8
+    MAX_CONNECTIONS_PER_HOST = 4
+    # Tamanho de lote do upsert em massa (o Django reduz o lote se o banco exigir)
+    BULK_BATCH_SIZE = 500
+    # Endpoint de série temporal (uma chamada por janela). A /rates da VatComply só aceita
+    # uma data por vez, então por padrão vem de settings.VATCOMPLY_RANGE_URL (se definido).
+    RANGE_URL = None
+    MAX_RANGE_DAYS = 366
+    # Status que indicam que o provedor não oferece busca por período
+    RANGE_UNSUPPORTED_STATUSES = (404, 405, 501)
+
+    # Timeouts (segundos) e política de retentativa das requisições GET
+    CONNECT_TIMEOUT = 3.05
+    READ_TIMEOUT = 10
+    MAX_RETRIES = 3
+    BACKOFF_FACTOR = 0.5
+    BACKOFF_MAX = 8
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    # Circuit breaker por host
+    CIRCUIT_FAILURE_THRESHOLD = 5
+    CIRCUIT_RESET_TIMEOUT = 30
+
+    # Semáforos compartilhados por processo, um por (host, limite): instâncias com o mesmo
+    # max_connections_per_host dividem o limite; um limite diferente ganha o seu semáforo
+    _host_semaphores = {}
+    _host_semaphores_lock = threading.Lock()
+    # Sessão HTTP (pool keep-alive) e circuit breakers compartilhados por processo
+    _session = None
+    _session_lock = threading.Lock()
+    _circuit_breakers = {}
+    _circuit_breakers_lock = threading.Lock()
+    # Buscas idênticas em andamento são compartilhadas (threads do processo e, opcionalmente, processos)
+    _single_flight = SingleFlight()
+    _shared_single_flight = SharedSingleFlight()
+
+    def __init__(self, use_db_cache=True, today_ttl=None, max_workers=None, max_connections_per_host=None,
+                 base_url=None, connect_timeout=None, read_timeout=None, max_retries=None, backoff_factor=None,
+                 range_url=None, calendar=None, currencies=None, update_analytics=True):
+        """
+        use_db_cache: se True, get_rates_for_period lê primeiro as cotações já salvas
+        em Cotacao (read-through) e só consulta a API externa para as datas ausentes.
+        today_ttl: timedelta opcional. Cotações históricas nunca mudam, mas a de "hoje"
+        pode mudar ao longo do dia; sem TTL ela é sempre buscada novamente, com TTL ela
+        é reaproveitada enquanto data_registro for mais recente que o TTL
+        (padrão: settings.COTACOES_TODAY_TTL, em segundos).
+        max_workers: número máximo de threads usadas para buscar um período.
+        max_connections_per_host: requisições simultâneas desta instância para o mesmo host.
+        Todas as instâncias do processo dividem ainda um teto por host
+        (settings.COTACOES_MAX_CONNECTIONS_PER_HOST), que um limite maior não ultrapassa.
+        base_url: URL do endpoint de cotações (permite apontar para um servidor local).
+        connect_timeout/read_timeout: timeouts em segundos de cada requisição.
+        max_retries/backoff_factor: retentativas de GET com backoff exponencial e jitter.
+        range_url: endpoint de série temporal; se definido, períodos são buscados com uma
+        chamada por janela, com fallback para a busca dia a dia.
+        calendar: BusinessCalendar usado para saber quais dias têm cotação
+        (padrão: settings.COTACOES_HOLIDAY_CALENDAR).
+        currencies: moedas devolvidas por get_rates_for_period (padrão: TARGET_CURRENCIES).
+        Fora das colunas fixas de Cotacao, são lidas da tabela normalizada TaxaCambio.
+        update_analytics: se True, cada save_rates marca os indicadores móveis como pendentes
+        a partir do primeiro dia gravado (core.analytics.mark_pending), para o worker de
+        ingestão recalculá-los; cargas em massa desligam e recalculam uma única vez no final.
+        """
+        self.use_db_cache = use_db_cache
+        if today_ttl is None and getattr(settings, 'COTACOES_TODAY_TTL', None) is not None:
+            today_ttl = timedelta(seconds=settings.COTACOES_TODAY_TTL)
+        self.today_ttl = today_ttl
+        self.max_workers = max_workers or self.MAX_WORKERS
+        self.max_connections_per_host = max_connections_per_host or self.MAX_CONNECTIONS_PER_HOST
+        # Limite próprio, só quando é mais restrito que o teto compartilhado do host
+        self._local_semaphore = None
+        if self.max_connections_per_host < self.host_connection_limit():
+            self._local_semaphore = threading.BoundedSemaphore(self.max_connections_per_host)
+        self.base_url = base_url or self.BASE_URL
+        self.connect_timeout = connect_timeout if connect_timeout is not None else self.CONNECT_TIMEOUT
+        self.read_timeout = read_timeout if read_timeout is not None else self.READ_TIMEOUT
+        self.max_retries = max_retries if max_retries is not None else self.MAX_RETRIES
+        self.backoff_factor = backoff_factor if backoff_factor is not None else self.BACKOFF_FACTOR
+        self.range_url = range_url or self.RANGE_URL or getattr(settings, 'VATCOMPLY_RANGE_URL', None)
+        self.calendar = calendar or get_calendar()
+        self.currencies = list(currencies or self.TARGET_CURRENCIES)
+        self.update_analytics = update_analytics
+
+    @classmethod
+    def get_session(cls):
+        """
+        Retorna a sessão HTTP do processo, criando-a na primeira vez.
+        A sessão mantém um pool de conexões keep-alive, evitando um novo handshake
+        TCP+TLS a cada dia buscado. O pool de cada host comporta o teto de conexões
+        simultâneas (host_connection_limit), então nenhuma conexão é descartada ao voltar.
+        """
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=max(cls.MAX_WORKERS, cls.host_connection_limit()))
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                cls._session = session
+        return cls._session
+
+    def _circuit_breaker(self, url):
+        """
+        Retorna o circuit breaker do host da URL, criando-o na primeira vez.
+        """
+        host = urlsplit(url).netloc
+        with self._circuit_breakers_lock:
+            breaker = self._circuit_breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(self.CIRCUIT_FAILURE_THRESHOLD, self.CIRCUIT_RESET_TIMEOUT)
+                self._circuit_breakers[host] = breaker
+        return breaker
+
+    def _backoff_delay(self, attempt):
+        """
+        Backoff exponencial com jitter ("full jitter") para a tentativa `attempt` (0, 1, 2...).
+        """
+        return random.uniform(0, min(self.BACKOFF_MAX, self.backoff_factor * (2 ** attempt)))
+
+    def _get(self, url, params):
+        """
+        GET com timeout, retentativas e circuit breaker.
+        Falhas de conexão, timeouts e status em RETRY_STATUSES são retentados; quando as
+        tentativas se esgotam a falha é registrada no circuito do host. Com o circuito aberto
+        levanta CircuitOpenError imediatamente.
+        """
+        breaker = self._circuit_breaker(url)
+        breaker.before_call()
+        session = self.get_session()
+        response = None
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff_delay(attempt - 1))
+            try:
+                with self._connection_slot(url), metrics.timer('cotacoes_upstream_request_seconds'):
+                    response = session.get(url, params=params, timeout=(self.connect_timeout, self.read_timeout))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                metrics.inc('cotacoes_upstream_requests_total', status='error')
+                response, error = None, e
+                continue
+            metrics.inc('cotacoes_upstream_requests_total', status=response.status_code)
+            if response.status_code not in self.RETRY_STATUSES:
+                breaker.record_success()
+                return response
+        breaker.record_failure()
+        if response is not None:
+            return response # raise_for_status do chamador trata o status de erro
+        raise error
+
+    @classmethod
+    def host_connection_limit(cls):
+        """
+        Teto de requisições simultâneas por host no processo (settings.COTACOES_MAX_CONNECTIONS_PER_HOST).
+        """
+        return getattr(settings, 'COTACOES_MAX_CONNECTIONS_PER_HOST', cls.MAX_CONNECTIONS_PER_HOST)
+
+    def _host_semaphore(self, url):
+        """
+        Retorna o semáforo do host da URL, um por host para todas as instâncias do processo,
+        criando-o na primeira vez.
+        """
+        host = urlsplit(url).netloc
+        with self._host_semaphores_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.host_connection_limit())
+                self._host_semaphores[host] = semaphore
+        return semaphore
+
+    @contextmanager
+    def _connection_slot(self, url):
+        """
+        Ocupa uma conexão com o host: primeiro o limite desta instância (se houver), depois
+        o semáforo compartilhado, para que quem espera o limite local não segure o teto do host.
+        """
+        local = self._local_semaphore if self._local_semaphore is not None else nullcontext()
+        with local, self._host_semaphore(url):
+            yield
 
-    def get_daily_rates(self, target_date):
+    def get_daily_rates(self, target_date, persist=True):
         """
         Para obter as cotações para uma data específica da API externa.
-        Se bem-sucedido, salva ou atualiza a cotação no banco de dados.
+        Se bem-sucedido (e persist=True), salva ou atualiza a cotação no banco de dados.
         Retorna o dicionário de cotações para a data ou None em caso de erro.
+        Chamadas simultâneas para a mesma data fazem uma única requisição (single-flight)
+        e todas recebem o mesmo resultado.
+        """
+        key = f"{urlsplit(self.base_url).netloc}:{target_date.isoformat()}"
+        result = self._single_flight.do(key, self._fetch_daily_rates_shared, key, target_date)
+        if result and persist:
+            self.save_rates([(target_date, result['rates'])])
+        return result
+
+    def _fetch_daily_rates_shared(self, key, target_date):
+        """
+        Entre processos, coordena a busca pelo lock no cache (settings.COTACOES_SINGLE_FLIGHT_SHARED).
+        """
+        if getattr(settings, 'COTACOES_SINGLE_FLIGHT_SHARED', False):
+            return self._shared_single_flight.do(key, self._fetch_daily_rates, target_date)
+        return self._fetch_daily_rates(target_date)
+
+    def _fetch_daily_rates(self, target_date):
+        """
+        Faz a requisição de uma data à API externa e extrai as cotações (sem salvar).
         """
         date_str = target_date.strftime('%Y-%m-%d')
         params = {
             'base': self.BASE_CURRENCY,
             'date': date_str
         }
+        response = None
         try:
-            print(f"DEBUG (VatComplyService): Buscando cotações para a data: {date_str} da API externa...")
-            response = requests.get(self.BASE_URL, params=params)
+            logger.debug("Buscando cotações na API externa date=%s", date_str)
+            response = self._get(self.base_url, params)
             response.raise_for_status() # Lança um erro para status codes 4xx/5xx
 
+            return self._daily_result(response.json(), date_str)
+        except requests.exceptions.RequestException as e:
+            logger.warning(
+                "Erro na requisição HTTP date=%s status=%s: %s",
+                date_str, response.status_code if response is not None else None, e,
+            )
+            return None # Retorna None em caso de erro na requisição HTTP
+
+    def _daily_result(self, data, date_str):
+        """
+        Extrai da resposta JSON de uma data o resultado {'date', 'rates'} (None sem 'rates').
+        """
+        if 'rates' not in data:
+            logger.warning("Resposta da API sem a chave 'rates' date=%s", date_str)
+            return None # Não há dados de cotação válidos
+        rates = self._extract_rates(data['rates'], date_str)
+
+        return {
+            'date': date_str,
+            'rates': rates
+        }
+
+    def _extract_rates(self, all_rates, date_str):
+        """
+        Mantém todas as taxas numéricas retornadas pela API (todas são gravadas em TaxaCambio).
+        """
+        rates = {
+            currency: value for currency, value in all_rates.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+        for currency in self.currencies:
+            if currency not in rates:
+                logger.debug("Moeda ausente nas taxas currency=%s date=%s", currency, date_str)
+        return rates
+
+    def get_range_rates(self, start_date, end_date):
+        """
+        Busca as cotações de um período inteiro com uma única chamada ao endpoint de série
+        temporal (formato {'rates': {'YYYY-MM-DD': {'BRL': ...}}}).
+        Retorna {data: rates} ou None se o provedor não suportar a busca por período ou a
+        chamada falhar, para o chamador recorrer à busca dia a dia.
+        """
+        if not self.range_url:
+            return None
+        params = {
+            'base': self.BASE_CURRENCY,
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d'),
+        }
+        try:
+            logger.debug("Buscando período em uma única chamada start=%s end=%s", start_date, end_date)
+            response = self._get(self.range_url, params)
+            if response.status_code in self.RANGE_UNSUPPORTED_STATUSES:
+                logger.info("Provedor sem busca por período status=%s", response.status_code)
+                return None
+            response.raise_for_status()
             data = response.json()
-            print(f"DEBUG (VatComplyService): Resposta JSON bruta da API para {date_str}: {data}")
-
-            rates = {}
-            if 'rates' in data:
-                for currency in self.TARGET_CURRENCIES:
-                    if currency in data['rates']:
-                        rates[currency] = data['rates'][currency]
-                    else:
-                        print(f"DEBUG (VatComplyService): Moeda {currency} não encontrada nas taxas para {date_str}.")
-            else:
-                print(f"DEBUG (VatComplyService): Chave 'rates' não encontrada na resposta da API para {date_str}.")
-                return None # Não há dados de cotação válidos
+        except requests.exceptions.RequestException as e:
+            logger.warning("Erro na busca por período start=%s end=%s: %s", start_date, end_date, e)
+            return None
+        if not isinstance(data.get('rates'), dict):
+            logger.warning("Resposta de período sem a chave 'rates' start=%s end=%s", start_date, end_date)
+            return None
 
-            # --- LÓGICA DE PERSISTÊNCIA: Salvar no banco de dados ---
+        results = {}
+        for date_str, day_rates in data['rates'].items():
             try:
-                # update_or_create tenta encontrar um registro. Se encontra, atualiza; senão, cria.
-                cotacao_obj, created = Cotacao.objects.update_or_create(
-                    data=target_date, # Condição para encontrar o registro
-                    defaults={ # Valores a serem criados/atualizados
-                        'valor_brl': rates.get('BRL'),
-                        'valor_eur': rates.get('EUR'),
-                        'valor_jpy': rates.get('JPY'),
-                    }
-                )
-                if created:
-                    print(f"DEBUG (VatComplyService): Cotação para {date_str} SALVA com sucesso no banco de dados.")
-                else:
-                    print(f"DEBUG (VatComplyService): Cotação para {date_str} ATUALIZADA com sucesso no banco de dados.")
-            except IntegrityError as e:
-                print(f"DEBUG (VatComplyService): Erro de integridade ao salvar cotação para {date_str} (provavelmente duplicata): {e}")
-            except Exception as e:
-                print(f"DEBUG (VatComplyService): Erro INESPERADO ao salvar cotação para {date_str}: {e}")
-            
+                day = datetime.strptime(date_str, '%Y-%m-%d').date()
+            except ValueError:
+                continue
+            results[day] = self._extract_rates(day_rates, date_str)
+        return results
+
+    def fetch_rates(self, dates):
+        """
+        Busca na API externa as cotações de várias datas, sem salvar no banco.
+        Com range_url, cada janela de até MAX_RANGE_DAYS custa uma única chamada; sem ela
+        (ou se o provedor recusar) cai para a busca dia a dia em paralelo.
+        Retorna uma lista alinhada com `dates` (None para os dias sem cotação).
+        """
+        if not dates or not self.range_url:
+            return self.fetch_rates_concurrently(dates)
+
+        by_date = {}
+        window_start = 0
+        while window_start < len(dates):
+            first = dates[window_start]
+            window_end = window_start
+            while window_end + 1 < len(dates) and (dates[window_end + 1] - first).days < self.MAX_RANGE_DAYS:
+                window_end += 1
+            window = dates[window_start:window_end + 1]
+            range_rates = self.get_range_rates(window[0], window[-1])
+            if range_rates is None:
+                for day, result in zip(window, self.fetch_rates_concurrently(window)):
+                    by_date[day] = result
+            else:
+                for day in window:
+                    if day in range_rates:
+                        by_date[day] = {'date': day.strftime('%Y-%m-%d'), 'rates': range_rates[day]}
+            window_start = window_end + 1
+        return [by_date.get(day) for day in dates]
+
+    def save_rates(self, daily_rates):
+        """
+        Salva ou atualiza no banco, em lote, as cotações de vários dias.
+        `daily_rates` é uma lista de tuplas (data, {'BRL': ..., 'EUR': ..., 'JPY': ..., ...}).
+        Usa um único upsert (INSERT ... ON CONFLICT (data) DO UPDATE) por lote, tanto no
+        SQLite quanto no PostgreSQL, em vez de um SELECT + INSERT/UPDATE por dia.
+        Todas as moedas recebidas vão também para TaxaCambio, na mesma transação.
+        Retorna o número de dias enviados ao banco.
+        """
+        if not daily_rates:
+            return 0
+        now = timezone.now()
+        objs = [
+            Cotacao(
+                data=target_date,
+                valor_brl=rates.get('BRL'),
+                valor_eur=rates.get('EUR'),
+                valor_jpy=rates.get('JPY'),
+                # auto_now_add só vale na criação; atualiza para o TTL de "hoje" funcionar
+                data_registro=now,
+            )
+            for target_date, rates in daily_rates
+        ]
+        taxas = [
+            TaxaCambio(data=target_date, base=self.BASE_CURRENCY, moeda=currency, taxa=value, data_registro=now)
+            for target_date, rates in daily_rates
+            for currency, value in rates.items()
+            if value is not None
+        ]
+        # --- LÓGICA DE PERSISTÊNCIA: Salvar no banco de dados ---
+        try:
+            with transaction.atomic():
+                with metrics.timer('cotacoes_db_upsert_seconds'):
+                    Cotacao.objects.bulk_create(
+                        objs,
+                        batch_size=self.BULK_BATCH_SIZE,
+                        update_conflicts=True,
+                        unique_fields=['data'],
+                        update_fields=['valor_brl', 'valor_eur', 'valor_jpy', 'data_registro'],
+                    )
+                    TaxaCambio.objects.bulk_create(
+                        taxas,
+                        batch_size=self.BULK_BATCH_SIZE,
+                        update_conflicts=True,
+                        unique_fields=['data', 'base', 'moeda'],
+                        update_fields=['taxa', 'data_registro'],
+                    )
+                # Na mesma transação: o índice de cobertura nunca fica à frente dos dados e
+                # nenhuma gravação escapa do recálculo dos indicadores
+                coverage.add_dates([obj.data for obj in objs])
+                if self.update_analytics:
+                    mark_pending(min(obj.data for obj in objs))
+        except IntegrityError as e:
+            logger.error("Erro de integridade ao salvar cotações days=%d: %s", len(objs), e)
+            return 0
+        except Exception:
+            logger.exception("Erro inesperado ao salvar cotações days=%d", len(objs))
+            return 0
+        metrics.inc('cotacoes_db_upsert_rows_total', len(objs))
+        logger.debug("Cotações salvas no banco days=%d", len(objs))
+        # As linhas já estão gravadas: uma falha nos derivados não vira falha de gravação
+        try:
+            self._after_save([obj.data for obj in objs])
+        except Exception:
+            logger.exception("Erro ao atualizar os derivados das cotações salvas days=%d", len(objs))
+        return len(objs)
+
+    def _after_save(self, dates):
+        """
+        Atualiza o que deriva das cotações recém-gravadas: invalida as respostas em cache que
+        cobrem as datas e recalcula os resumos dos meses/anos tocados. Os indicadores móveis
+        ficam para o worker de ingestão (marcados em save_rates).
+        """
+        quote_series_cache.invalidate_dates(dates)
+        try:
+            update_summaries(dates)
+        except Exception:
+            logger.exception("Erro ao atualizar os resumos dates=%d", len(dates))
+
+    def fetch_rates_concurrently(self, dates):
+        """
+        Busca na API externa as cotações de várias datas em paralelo, sem salvar no banco.
+        Usa um pool de threads limitado por max_workers e pelo semáforo do host.
+        Retorna uma lista alinhada com `dates` (None para os dias com erro).
+        """
+        if len(dates) <= 1 or self.max_workers == 1:
+            return [self.get_daily_rates(d, persist=False) for d in dates]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(dates))) as executor:
+            return list(executor.map(lambda d: self.get_daily_rates(d, persist=False), dates))
+
+    @property
+    def uses_fixed_columns(self):
+        """
+        True se todas as moedas pedidas são colunas de Cotacao (uma linha por dia).
+        """
+        return set(self.currencies) <= set(self.CURRENCY_FIELDS)
+
+    def _load_cached_rates(self, start_date, end_date):
+        """
+        Carrega em uma única query todas as cotações salvas no período.
+        Retorna um dicionário {data: (data_registro, rates)}. Na tabela normalizada, um dia
+        só conta como salvo se tiver todas as moedas pedidas.
+        """
+        return self._cached_rates_from_rows(self._cached_rates_queryset(start_date, end_date))
+
+    def _cached_rates_queryset(self, start_date, end_date):
+        """
+        Query das cotações salvas no período: (data, data_registro, taxa de cada moeda) em
+        Cotacao ou (data, data_registro, moeda, taxa) em TaxaCambio.
+        """
+        if self.uses_fixed_columns:
+            fields = [self.CURRENCY_FIELDS[currency] for currency in self.currencies]
+            return (
+                Cotacao.objects.in_range(start_date, end_date, ordered=False)
+                .values_list('data', 'data_registro', *fields)
+            )
+        return (
+            TaxaCambio.objects
+            .filter(data__range=(start_date, end_date), base=self.BASE_CURRENCY, moeda__in=self.currencies)
+            .order_by().values_list('data', 'data_registro', 'moeda', 'taxa')
+        )
 
+    def _cached_rates_from_rows(self, rows):
+        """
+        Monta {data: (data_registro, rates)} a partir das linhas de _cached_rates_queryset.
+        """
+        if self.uses_fixed_columns:
             return {
-                'date': date_str,
-                'rates': rates
+                row[0]: (row[1], {
+                    currency: float(value)
+                    for currency, value in zip(self.currencies, row[2:]) if value is not None
+                })
+                for row in rows
             }
-        except requests.exceptions.RequestException as e:
-            print(f"DEBUG (VatComplyService): Erro na requisição HTTP para a data {date_str}: {e}")
-            if response is not None:
-                print(f"DEBUG (VatComplyService): Status Code: {response.status_code}")
-                print(f"DEBUG (VatComplyService): Resposta da API (texto): {response.text}")
-            return None # Retorna None em caso de erro na requisição HTTP
 
-    def get_rates_for_period(self, start_date, end_date):
+        by_date = {}
+        for day, registered_at, currency, value in rows:
+            entry = by_date.setdefault(day, [registered_at, {}])
+            entry[0] = min(entry[0], registered_at)
+            entry[1][currency] = float(value)
+        return {
+            day: (registered_at, rates)
+            for day, (registered_at, rates) in by_date.items()
+            if len(rates) == len(self.currencies)
+        }
+
+    def _is_cache_fresh(self, day, registered_at, today):
+        """
+        Cotações de dias passados são sempre válidas. A de hoje só é válida
+        se houver TTL configurado e o registro ainda estiver dentro dele.
+        """
+        if day < today:
+            return True
+        if self.today_ttl is None:
+            return False
+        return timezone.now() - registered_at <= self.today_ttl
+
+    def _select_currencies(self, rates):
+        """
+        Restringe as taxas às moedas pedidas, na ordem de self.currencies.
+        """
+        return {currency: rates[currency] for currency in self.currencies if currency in rates}
+
+    def business_days(self, start_date, end_date):
+        """
+        Retorna a lista de dias úteis (Seg-Sex, sem feriados do calendário) entre
+        start_date e end_date, inclusive.
+        """
+        return self.calendar.trading_days(start_date, end_date)
+
+    def get_rates_for_period(self, start_date, end_date, fetch_missing=True):
+        """
+        Para obter cotações para um período específico.
+        Com use_db_cache, os dias já presentes no banco são lidos de uma vez só e apenas
+        as datas ausentes (ou a de hoje, conforme o TTL) são buscadas na API externa.
+        As buscas usam a série temporal quando disponível (ou são feitas em paralelo, dia a
+        dia) e o salvamento no banco ocorre ao final, em um
+        único upsert na thread da requisição, mantendo a ordem cronológica do resultado.
+        Com fetch_missing=False a API externa nunca é chamada: retorna só o que está no banco
+        (modo usado quando o worker de ingestão mantém o banco atualizado).
+        O índice de cobertura não é consultado aqui: as linhas do período são lidas de qualquer
+        forma para montar a resposta (numa única query), e só elas dizem se o dia tem as moedas
+        pedidas e se a cotação de hoje ainda está dentro do TTL.
+        """
+        cached = self._load_cached_rates(start_date, end_date) if self.use_db_cache or not fetch_missing else {}
+        business_days, results, missing_dates = self._plan_period(start_date, end_date, cached, fetch_missing)
+        fetched_rates = self.fetch_rates(missing_dates) if missing_dates else []
+        self.save_rates(self._merge_fetched(results, missing_dates, fetched_rates))
+        return [results[day] for day in business_days if day in results]
+
+    def _plan_period(self, start_date, end_date, cached, fetch_missing):
+        """
+        Separa os dias úteis do período entre os já resolvidos pelo banco e os que faltam
+        buscar. Retorna (dias úteis, {data: resultado}, datas a buscar).
+        """
+        today = timezone.localdate()
+        business_days = self.business_days(start_date, end_date)
+
+        results = {}
+        missing_dates = []
+        for day in business_days:
+            entry = cached.get(day)
+            if entry is not None and (not fetch_missing or self._is_cache_fresh(day, entry[0], today)):
+                results[day] = {'date': day.strftime('%Y-%m-%d'), 'rates': entry[1]}
+            elif fetch_missing:
+                logger.debug("Dia útil ausente no banco date=%s", day)
+                missing_dates.append(day)
+        return business_days, results, missing_dates
+
+    def _merge_fetched(self, results, missing_dates, fetched_rates):
+        """
+        Junta em `results` as cotações buscadas (alinhadas com missing_dates) e retorna a
+        lista (data, rates) a salvar.
+        """
+        fetched = []
+        for day, daily_rates in zip(missing_dates, fetched_rates):
+            if daily_rates:
+                fetched.append((day, daily_rates['rates']))
+                results[day] = {'date': day.strftime('%Y-%m-%d'), 'rates': self._select_currencies(daily_rates['rates'])}
+            else:
+                logger.debug("Nenhuma cotação válida retornada date=%s", day)
+        return fetched
+
+    def find_missing_days(self, start_date, end_date):
+        """
+        Dias úteis do período que ainda não estão em Cotacao, pelas lacunas do índice de
+        cobertura (uma query nos intervalos, sem ler as datas do período).
+        """
+        return coverage.missing_days(start_date, end_date, self.calendar)
+
+    def sync_recent(self, lookback_days=30, today=None):
         """
-        Para obter cotações para um período específico, chamando get_daily_rates para cada dia.
-        O salvamento no banco ocorre dentro de get_daily_rates.
+        Busca e salva os dias úteis ausentes dos últimos `lookback_days` dias e sempre
+        atualiza o dia útil mais recente (cuja cotação pode mudar ao longo do dia).
+        Retorna o número de cotações salvas.
         """
-        all_rates = []
-        current_date = start_date
+        today = today or timezone.localdate()
+        start_date = today - timedelta(days=lookback_days)
+        days = set(self.find_missing_days(start_date, today))
+        latest = today if self.calendar.is_trading_day(today) else self.calendar.previous_trading_day(today)
+        days.add(latest)
+        days = sorted(days)
 
-        while current_date <= end_date:
-            if current_date.weekday() < 5: # Verifica se é dia útil (Seg-Sex)
-                print(f"DEBUG (get_rates_for_period): Processando dia útil: {current_date}")
-                daily_rates = self.get_daily_rates(current_date)
-                if daily_rates:
-                    all_rates.append(daily_rates)
-                else:
-                    print(f"DEBUG (get_rates_for_period): Nenhuma cotação válida retornada ou salva para {current_date}.")
-            current_date += timedelta(days=1) # Avança para o próximo dia
-        return all_rates
\ No newline at end of file
+        logger.debug("Sincronizando dias recentes days=%d start=%s end=%s", len(days), start_date, today)
+        results = self.fetch_rates(days)
+        return self.save_rates([(day, result['rates']) for day, result in zip(days, results) if result])
@@ -0,0 +1,134 @@
+# cotacao_moedas/core/singleflight.py
+"""
+Deduplicação de chamadas concorrentes idênticas ("single-flight").
+
+SingleFlight coordena as threads de um processo: a primeira chamada para uma chave executa
+a função e as demais esperam pelo mesmo Future. SharedSingleFlight faz o mesmo entre
+processos usando um lock no cache do Django (cache.add), publicando o resultado no cache
+para os processos que ficaram esperando; SharedSingleFlight.ado é a versão para corrotinas.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class SingleFlight:
+    """
+    Garante no máximo uma execução em andamento por chave dentro do processo.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class SharedSingleFlight:
+    """
+    Single-flight entre processos com um lock no cache compartilhado.
+
+    O processo que consegue o lock (cache.add) executa a função e grava o resultado sob o
+    token do lock; os demais leem o token e aguardam esse resultado. Se o dono do lock
+    terminar sem publicar resultado (ou morrer e o lock expirar), quem espera executa a
+    função por conta própria. O lock só é atômico em backends com add atômico (ex.: Redis).
+    """
+    KEY_PREFIX = 'cotacoes:flight'
+    LOCK_TIMEOUT = 30
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, alias=None):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias or getattr(settings, 'COTACOES_CACHE_ALIAS', 'default')]
+
+    def do(self, key, func, *args, **kwargs):
+        lock_key = f'{self.KEY_PREFIX}:lock:{key}'
+        token = uuid.uuid4().hex
+        if self.cache.add(lock_key, token, self.LOCK_TIMEOUT):
+            try:
+                result = func(*args, **kwargs)
+                self.cache.set(f'{self.KEY_PREFIX}:result:{token}', {'value': result}, self.LOCK_TIMEOUT)
+                return result
+            finally:
+                self.cache.delete(lock_key)
+
+        leader_token = self.cache.get(lock_key)
+        if leader_token is not None:
+            entry = self._wait_for(lock_key, leader_token)
+            if entry is not None:
+                return entry['value']
+        return func(*args, **kwargs)
+
+    def _wait_for(self, lock_key, leader_token):
+        result_key = f'{self.KEY_PREFIX}:result:{leader_token}'
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+            entry = self.cache.get(result_key)
+            if entry is not None:
+                return entry
+            if self.cache.get(lock_key) != leader_token:
+                # O dono terminou: o resultado (se houver) já foi gravado antes de soltar o lock
+                return self.cache.get(result_key)
+        return None
+
+    async def ado(self, key, func, *args, **kwargs):
+        """
+        Versão assíncrona de do(): `func` é uma corrotina e a espera não bloqueia o event loop.
+        """
+        lock_key = f'{self.KEY_PREFIX}:lock:{key}'
+        token = uuid.uuid4().hex
+        if await self.cache.aadd(lock_key, token, self.LOCK_TIMEOUT):
+            try:
+                result = await func(*args, **kwargs)
+                await self.cache.aset(f'{self.KEY_PREFIX}:result:{token}', {'value': result}, self.LOCK_TIMEOUT)
+                return result
+            finally:
+                await self.cache.adelete(lock_key)
+
+        leader_token = await self.cache.aget(lock_key)
+        if leader_token is not None:
+            entry = await self._await_for(lock_key, leader_token)
+            if entry is not None:
+                return entry['value']
+        return await func(*args, **kwargs)
+
+    async def _await_for(self, lock_key, leader_token):
+        result_key = f'{self.KEY_PREFIX}:result:{leader_token}'
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.POLL_INTERVAL)
+            entry = await self.cache.aget(result_key)
+            if entry is not None:
+                return entry
+            if await self.cache.aget(lock_key) != leader_token:
+                return await self.cache.aget(result_key)
+        return None
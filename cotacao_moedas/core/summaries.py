@@ -0,0 +1,103 @@
+# cotacao_moedas/core/summaries.py
+"""
+Tabela de resumos (ResumoCotacao): média, mínima, máxima e dias com cotação de cada moeda por
+mês e por ano.
+
+A cada upsert de cotações só os meses/anos que contêm as datas gravadas são recalculados,
+com uma única query agregada (GROUP BY período) por granularidade, restrita a esses períodos.
+Consultas de resumo passam a ler um registro por período em vez de todos os dias.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Q
+from django.db.models.functions import TruncMonth, TruncYear
+
+from .models import Cotacao, ResumoCotacao
+
+GRANULARITIES = {'month': TruncMonth, 'year': TruncYear}
+BULK_BATCH_SIZE = 500
+
+
+def bucket_start(day, periodo):
+    """
+    Primeiro dia do mês ou do ano de `day`.
+    """
+    if periodo == 'year':
+        return day.replace(month=1, day=1)
+    return day.replace(day=1)
+
+
+def bucket_end(start, periodo):
+    """
+    Último dia do período que começa em `start`.
+    """
+    if periodo == 'year':
+        return start.replace(month=12, day=31)
+    return (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def _touched_ranges(dates, periodo):
+    """
+    Intervalos (início, fim) dos períodos que contêm as datas, unindo períodos consecutivos.
+    """
+    ranges = []
+    for start in sorted({bucket_start(day, periodo) for day in dates}):
+        end = bucket_end(start, periodo)
+        if ranges and ranges[-1][1] + timedelta(days=1) == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def _as_float(value):
+    return None if value is None else float(value)
+
+
+def update_summaries(dates=None):
+    """
+    Recalcula os resumos mensais e anuais dos períodos que contêm `dates`. Sem datas,
+    reconstrói a tabela inteira (útil se ela divergir de Cotacao).
+    Retorna o número de resumos gravados.
+    """
+    if dates is not None and not dates:
+        return 0
+    aggregates = {}
+    for currency, field in Cotacao.CURRENCY_FIELDS.items():
+        aggregates[f'{currency}_media'] = Avg(field)
+        aggregates[f'{currency}_minimo'] = Min(field)
+        aggregates[f'{currency}_maximo'] = Max(field)
+        aggregates[f'{currency}_dias'] = Count(field)
+
+    objs = []
+    for periodo, trunc in GRANULARITIES.items():
+        queryset = Cotacao.objects.order_by()
+        if dates is not None:
+            touched = Q()
+            for start, end in _touched_ranges(dates, periodo):
+                touched |= Q(data__range=(start, end))
+            queryset = queryset.filter(touched)
+        for row in queryset.annotate(bucket=trunc('data')).values('bucket').annotate(**aggregates):
+            for currency in Cotacao.CURRENCY_FIELDS:
+                objs.append(ResumoCotacao(
+                    periodo=periodo,
+                    inicio=row['bucket'],
+                    moeda=currency,
+                    media=_as_float(row[f'{currency}_media']),
+                    minimo=_as_float(row[f'{currency}_minimo']),
+                    maximo=_as_float(row[f'{currency}_maximo']),
+                    dias=row[f'{currency}_dias'],
+                ))
+
+    with transaction.atomic():
+        if dates is None:
+            ResumoCotacao.objects.all().delete()
+        ResumoCotacao.objects.bulk_create(
+            objs,
+            batch_size=BULK_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['periodo', 'moeda', 'inicio'],
+            update_fields=['media', 'minimo', 'maximo', 'dias'],
+        )
+    return len(objs)
@@ -1,9 +1,54 @@
 from django.test import TestCase, Client
 from datetime import date, timedelta
-from unittest.mock import patch
-from .services import VatComplyService # Importação correta
+from unittest.mock import patch, Mock
+from decimal import Decimal
+from django.utils import timezone
+from .services import VatComplyService, CircuitBreaker, CircuitOpenError # Importação correta
+from .fake_vatcomply import FakeVatComplyServer, fake_rates_for
+from .columnar import divide, to_floats, transpose
+from .downsampling import downsample, lttb_indices, resample
+from .cache import LRUCache, QuoteSeriesCache, quote_series_cache
+from .singleflight import SharedSingleFlight, SingleFlight
+from .business_days import BusinessCalendar, brazil_holidays, easter_sunday, get_calendar, load_holidays_file, target_holidays
+from .models import CoberturaCotacao, Cotacao, CoveringIndex, IndicadorCotacao, IndicadorPendente, ResumoCotacao, TaxaCambio
+from .analytics import mark_pending, pending_from, process_pending, rolling_indicators, update_indicators
+from .summaries import update_summaries
+from .export import HAS_PYARROW, CHUNK_SIZE
+from .async_client import AsyncVatComplyService
+from . import coverage, metrics
+from .query_plans import check_plan
+from . import views
 import requests
+import gzip
 import json
+import logging
+import unittest
+import statistics
+import os
+import tempfile
+import threading
+import time
+import io
+from io import StringIO
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from asgiref.sync import sync_to_async
+
+# Os testes usam um cache em memória em vez do diretório configurado em settings
+_test_caches = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+
+def setUpModule():
+    _test_caches.enable()
+
+
+def tearDownModule():
+    _test_caches.disable()
+
 
 # Testes para o serviço VatComplyService
 class VatComplyServiceTestCase(TestCase):
@@ -11,7 +56,7 @@ class VatComplyServiceTestCase(TestCase):
     def setUp(self):
         self.service = VatComplyService()
 
-    @patch('requests.get') 
+    @patch('core.services.requests.Session.get')
     def test_get_daily_rates_success(self, mock_get):
         # simula a resposta da API
         mock_response = {
@@ -36,7 +81,7 @@ class VatComplyServiceTestCase(TestCase):
         self.assertEqual(rates['rates']['EUR'], 0.85) # AssertEqual para verificar valor
         self.assertEqual(rates['rates']['JPY'], 110.0) # AssertEqual para verificar valor
 
-    @patch('requests.get') 
+    @patch('core.services.requests.Session.get')
     def test_get_daily_rates_failure(self, mock_get):
         # simula erro na API
         # mock.get.return_value.status_code = 404 # Corrigido: 'mock_get', não 'mock'
@@ -51,26 +96,1259 @@ class VatComplyServiceTestCase(TestCase):
     def test_get_rates_for_period(self, mock_get_daily_rates):
         # Simula a resposta da API para várias datas
         mock_get_daily_rates.side_effect = [
-            {'date': '2024-01-01', 'rates': {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.0}},
-            {'date': '2024-01-02', 'rates': {'BRL': 5.30, 'EUR': 0.86, 'JPY': 111.0}},
-            {'date': '2024-01-03', 'rates': {'BRL': 5.35, 'EUR': 0.87, 'JPY': 112.0}},
-            {'date': '2024-01-04', 'rates': {'BRL': 5.40, 'EUR': 0.88, 'JPY': 113.0}},
-            {'date': '2024-01-05', 'rates': {'BRL': 5.45, 'EUR': 0.89, 'JPY': 114.0}},
+            {'date': '2024-01-08', 'rates': {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.0}},
+            {'date': '2024-01-09', 'rates': {'BRL': 5.30, 'EUR': 0.86, 'JPY': 111.0}},
+            {'date': '2024-01-10', 'rates': {'BRL': 5.35, 'EUR': 0.87, 'JPY': 112.0}},
+            {'date': '2024-01-11', 'rates': {'BRL': 5.40, 'EUR': 0.88, 'JPY': 113.0}},
+            {'date': '2024-01-12', 'rates': {'BRL': 5.45, 'EUR': 0.89, 'JPY': 114.0}},
         ]
 
-        start_date = date(2024, 1, 1)
-        end_date = date(2024, 1, 5)
+        # Semana sem feriados (01/01 é feriado no calendário TARGET)
+        start_date = date(2024, 1, 8)
+        end_date = date(2024, 1, 12)
         rates = self.service.get_rates_for_period(start_date, end_date)
 
         self.assertEqual(len(rates), 5)
-        self.assertEqual(rates[0]['date'], '2024-01-01')
-        self.assertEqual(rates[-1]['date'], '2024-01-05')
+        self.assertEqual(rates[0]['date'], '2024-01-08')
+        self.assertEqual(rates[-1]['date'], '2024-01-12')
+
+    @patch('core.services.VatComplyService.get_daily_rates')
+    def test_get_rates_for_period_reads_through_db(self, mock_get_daily_rates):
+        # Dias já salvos no banco não devem ir para a API externa
+        Cotacao.objects.create(data=date(2024, 1, 8), valor_brl=Decimal('5.25'), valor_eur=Decimal('0.85'), valor_jpy=Decimal('110.0'))
+        Cotacao.objects.create(data=date(2024, 1, 10), valor_brl=Decimal('5.35'), valor_eur=Decimal('0.87'), valor_jpy=Decimal('112.0'))
+        mock_get_daily_rates.side_effect = lambda d, persist=True: {'date': d.strftime('%Y-%m-%d'), 'rates': {'BRL': 5.0}}
+
+        rates = self.service.get_rates_for_period(date(2024, 1, 8), date(2024, 1, 10))
+
+        self.assertEqual([r['date'] for r in rates], ['2024-01-08', '2024-01-09', '2024-01-10'])
+        self.assertEqual(rates[0]['rates']['BRL'], 5.25)
+        mock_get_daily_rates.assert_called_once_with(date(2024, 1, 9), persist=False)
+
+    # "Hoje" fixo num dia útil: em fins de semana e feriados do calendário não há o que buscar
+    @patch('django.utils.timezone.localdate', return_value=date(2024, 1, 10))
+    @patch('core.services.VatComplyService.get_daily_rates')
+    def test_get_rates_for_period_today_ttl(self, mock_get_daily_rates, mock_localdate):
+        today = timezone.localdate()
+        Cotacao.objects.create(data=today, valor_brl=Decimal('5.25'))
+        mock_get_daily_rates.return_value = {'date': today.strftime('%Y-%m-%d'), 'rates': {'BRL': 5.30}}
+
+        # Sem TTL a cotação de hoje é sempre buscada novamente
+        VatComplyService().get_rates_for_period(today, today)
+        # Com TTL ela é reaproveitada enquanto estiver fresca
+        rates = VatComplyService(today_ttl=timedelta(minutes=5)).get_rates_for_period(today, today)
+
+        self.assertEqual(mock_get_daily_rates.call_count, 1)
+        self.assertEqual(rates[0]['rates']['BRL'], 5.30) # A gravada pela busca anterior
+
+    @patch('django.utils.timezone.localdate', return_value=date(2024, 1, 10))
+    @patch('core.services.VatComplyService.get_daily_rates')
+    def test_today_ttl_read_from_settings(self, mock_get_daily_rates, mock_localdate):
+        today = timezone.localdate()
+        Cotacao.objects.create(data=today, valor_brl=Decimal('5.25'))
+
+        with override_settings(COTACOES_TODAY_TTL=300):
+            self.assertEqual(VatComplyService().today_ttl, timedelta(minutes=5))
+            rates = VatComplyService().get_rates_for_period(today, today)
+        with override_settings(COTACOES_TODAY_TTL=None):
+            self.assertIsNone(VatComplyService().today_ttl)
+
+        mock_get_daily_rates.assert_not_called()
+        self.assertEqual(rates[0]['rates']['BRL'], 5.25)
+
+    @patch('core.services.requests.Session.get')
+    def test_get_rates_for_period_fetches_concurrently(self, mock_get):
+        # Cada chamada "demora" 0.2s; em paralelo o período inteiro leva ~1 round trip
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+
+        def slow_get(url, params, timeout):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.2)
+            with lock:
+                state['active'] -= 1
+            response = Mock(status_code=200)
+            response.json.return_value = {'date': params['date'], 'rates': {'BRL': 5.0, 'EUR': 0.9, 'JPY': 150.0}}
+            response.raise_for_status.return_value = None
+            return response
+        mock_get.side_effect = slow_get
+
+        service = VatComplyService(max_workers=5, max_connections_per_host=5)
+        started = time.monotonic()
+        rates = service.get_rates_for_period(date(2024, 1, 8), date(2024, 1, 14))
+        elapsed = time.monotonic() - started
+
+        self.assertEqual([r['date'] for r in rates], ['2024-01-08', '2024-01-09', '2024-01-10', '2024-01-11', '2024-01-12'])
+        self.assertLess(elapsed, 0.6)
+        self.assertGreater(state['peak'], 1)
+        self.assertEqual(Cotacao.objects.count(), 5)
+
+    @override_settings(COTACOES_MAX_CONNECTIONS_PER_HOST=3)
+    def test_host_semaphore_limits_concurrency(self):
+        service = VatComplyService(max_connections_per_host=8)
+        semaphore = service._host_semaphore('https://limite.example.com/rates')
+        self.assertIs(semaphore, service._host_semaphore('https://limite.example.com/outra'))
+        for _ in range(3): # O teto do host vale mesmo com um limite maior na instância
+            self.assertTrue(semaphore.acquire(blocking=False))
+        self.assertFalse(semaphore.acquire(blocking=False))
+        for _ in range(3):
+            semaphore.release()
+
+    @override_settings(COTACOES_MAX_CONNECTIONS_PER_HOST=4)
+    def test_host_cap_shared_by_instances_with_different_limits(self):
+        url = 'https://limite-outro.example.com/rates'
+        low, high = VatComplyService(max_connections_per_host=2), VatComplyService(max_connections_per_host=8)
+        self.assertIs(low._host_semaphore(url), high._host_semaphore(url)) # Um semáforo por host
+
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0, 'low_active': 0, 'low_peak': 0}
+        release = threading.Event()
+
+        def hold(service):
+            with service._connection_slot(url):
+                with lock:
+                    state['active'] += 1
+                    state['peak'] = max(state['peak'], state['active'])
+                    if service is low:
+                        state['low_active'] += 1
+                        state['low_peak'] = max(state['low_peak'], state['low_active'])
+                release.wait(0.2)
+                with lock:
+                    state['active'] -= 1
+                    if service is low:
+                        state['low_active'] -= 1
+
+        threads = [threading.Thread(target=hold, args=(service,)) for service in [low] * 4 + [high] * 8]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(state['peak'], 4)
+        self.assertLessEqual(state['low_peak'], 2)
+
+class BusinessCalendarTestCase(TestCase):
+
+    def test_easter_and_target_holidays(self):
+        self.assertEqual(easter_sunday(2024), date(2024, 3, 31))
+        self.assertIn(date(2024, 3, 29), target_holidays(2024)) # Sexta-feira Santa
+        self.assertIn(date(2024, 4, 1), target_holidays(2024)) # Segunda-feira de Páscoa
+        self.assertIn(date(2024, 2, 13), brazil_holidays(2024)) # Carnaval
+
+    def test_trading_days_skip_weekends_and_holidays(self):
+        calendar = get_calendar('target')
+        days = calendar.trading_days(date(2024, 3, 25), date(2024, 4, 5))
+        self.assertEqual(len(days), 8) # 10 dias úteis menos Sexta Santa e Segunda de Páscoa
+        self.assertNotIn(date(2024, 3, 29), days)
+        self.assertEqual(calendar.count(date(2024, 3, 25), date(2024, 4, 5)), 8)
+        self.assertFalse(calendar.is_trading_day(date(2024, 4, 1)))
+        self.assertEqual(calendar.previous_trading_day(date(2024, 4, 2)), date(2024, 3, 28))
+
+    def test_index_grows_outside_initial_range(self):
+        calendar = BusinessCalendar(first_year=2020, last_year=2020)
+        self.assertEqual(calendar.count(date(2030, 1, 7), date(2030, 1, 11)), 5)
+        self.assertEqual(calendar.count(date(2030, 1, 11), date(2030, 1, 7)), 0)
+
+    def test_index_reaches_date_max_without_overflow(self):
+        calendar = BusinessCalendar(first_year=9999, last_year=9999)
+        self.assertEqual(calendar.count(date(9999, 12, 27), date.max), 5)
+        self.assertTrue(calendar.is_trading_day(date.max))
+
+    def test_spans_beyond_index_limit_are_computed_without_growing(self):
+        calendar = BusinessCalendar(holiday_rule=target_holidays, first_year=2000, last_year=2001)
+        reference = BusinessCalendar(holiday_rule=target_holidays, first_year=1800, last_year=1899)
+        reference.MAX_INDEX_YEARS = 1000
+
+        self.assertEqual(calendar.count(date(1800, 1, 1), date(2001, 12, 31)), reference.count(date(1800, 1, 1), date(2001, 12, 31)))
+        self.assertEqual(calendar.trading_days(date(1850, 12, 20), date(1851, 1, 10)), reference.trading_days(date(1850, 12, 20), date(1851, 1, 10)))
+        self.assertEqual(calendar.previous_trading_day(date(1851, 1, 2)), date(1850, 12, 31))
+        self.assertFalse(calendar.is_trading_day(date(1850, 12, 25)))
+        self.assertGreater(calendar.count(date.min, date.max), 0)
+        self.assertLess(calendar._last.year - calendar._first.year, BusinessCalendar.MAX_INDEX_YEARS)
+
+    def test_load_holidays_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write("# feriados locais\n2024-01-09\n\n")
+        try:
+            calendar = BusinessCalendar(holidays=load_holidays_file(f.name))
+        finally:
+            os.unlink(f.name)
+        self.assertEqual(calendar.count(date(2024, 1, 8), date(2024, 1, 12)), 4)
+
+class SaveRatesTestCase(TestCase):
+
+    def setUp(self):
+        self.service = VatComplyService()
+
+    def test_after_save_failure_still_reports_committed_rows(self):
+        with patch.object(VatComplyService, '_after_save', side_effect=RuntimeError("cache fora do ar")), \
+                self.assertLogs('core.services', level='ERROR'):
+            saved = self.service.save_rates([(date(2024, 1, 8), {'BRL': 5.0})])
+        self.assertEqual(saved, 1)
+        self.assertTrue(Cotacao.objects.filter(data=date(2024, 1, 8)).exists())
+
+    def test_save_rates_inserts_and_updates_in_bulk(self):
+        Cotacao.objects.create(data=date(2024, 1, 2), valor_brl=Decimal('1.0'))
+        daily_rates = [
+            (date(2024, 1, 1) + timedelta(days=i), {'BRL': 5.0 + i / 10, 'EUR': 0.9, 'JPY': 150.0})
+            for i in range(150)
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            saved = self.service.save_rates(daily_rates)
+
+        cotacao_inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "core_cotacao"')]
+        self.assertEqual(len(cotacao_inserts), 1) # Um único INSERT ... ON CONFLICT para o lote inteiro
+        self.assertEqual(saved, 150)
+        self.assertEqual(Cotacao.objects.count(), 150)
+        self.assertEqual(Cotacao.objects.get(data=date(2024, 1, 2)).valor_brl, Decimal('5.1'))
+        self.assertEqual(TaxaCambio.objects.count(), 450)
+
+    def test_save_rates_stores_every_currency(self):
+        self.service.save_rates([(date(2024, 1, 8), {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.5, 'GBP': 0.79})])
+        self.service.save_rates([(date(2024, 1, 8), {'BRL': 5.3, 'GBP': 0.8})])
+
+        taxas = dict(TaxaCambio.objects.filter(data=date(2024, 1, 8), base='USD').values_list('moeda', 'taxa'))
+        self.assertEqual(taxas, {'BRL': Decimal('5.3'), 'EUR': Decimal('0.85'), 'JPY': Decimal('110.5'), 'GBP': Decimal('0.8')})
+
+    def test_get_rates_for_period_other_currencies(self):
+        self.service.save_rates([
+            (date(2024, 1, 8), {'BRL': 5.25, 'GBP': 0.79}),
+            (date(2024, 1, 9), {'BRL': 5.3}), # Sem GBP: o dia não está completo para essas moedas
+        ])
+        service = VatComplyService(currencies=['GBP', 'BRL'])
+
+        with self.assertNumQueries(1):
+            rates = service.get_rates_for_period(date(2024, 1, 8), date(2024, 1, 9), fetch_missing=False)
+
+        self.assertEqual(rates, [{'date': '2024-01-08', 'rates': {'GBP': 0.79, 'BRL': 5.25}}])
+
+    def test_save_rates_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.service.save_rates([]), 0)
+
+class ColumnarTestCase(TestCase):
+
+    def setUp(self):
+        VatComplyService().save_rates([
+            (date(2024, 1, 8), {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.5}),
+            (date(2024, 1, 9), {'BRL': 5.3, 'EUR': None, 'JPY': 111.0}),
+        ])
+
+    def test_columns_single_query(self):
+        with self.assertNumQueries(1):
+            columns = Cotacao.objects.filter(data__range=(date(2024, 1, 1), date(2024, 1, 31))).order_by('data').columns()
+
+        self.assertEqual(columns, {
+            'dates': ['2024-01-08', '2024-01-09'],
+            'BRL': [5.25, 5.3],
+            'EUR': [0.85, None],
+            'JPY': [110.5, 111.0],
+        })
+
+    def test_taxacambio_series_pivots_currencies(self):
+        VatComplyService().save_rates([(date(2024, 1, 10), {'BRL': 5.4, 'GBP': 0.78})])
+
+        with self.assertNumQueries(1):
+            series = TaxaCambio.objects.filter(data__range=(date(2024, 1, 8), date(2024, 1, 10))).series(['GBP', 'BRL'])
+
+        self.assertEqual(series, {
+            'dates': ['2024-01-08', '2024-01-09', '2024-01-10'],
+            'GBP': [None, None, 0.78],
+            'BRL': [5.25, 5.3, 5.4],
+        })
+
+    def test_columns_python_conversion_matches_db_cast(self):
+        queryset = Cotacao.objects.order_by('-data')[:30]
+        self.assertEqual(queryset.columns(db_cast=False), queryset.columns())
+
+    def test_to_floats_and_transpose(self):
+        self.assertEqual(to_floats([Decimal('1.5'), None, 2]), [1.5, None, 2.0])
+        self.assertEqual(to_floats([]), [])
+        self.assertEqual(transpose([], 3), [[], [], []])
+        self.assertEqual(transpose([(1, 'a'), (2, 'b')], 2), [[1, 2], ['a', 'b']])
+
+    def test_divide(self):
+        expected = [2.0, None, None, None]
+        self.assertEqual(divide([4.0, None, 1.0, 3.0], [2.0, 1.0, 0.0, None]), expected)
+        with patch('core.columnar.np', None): # Mesmo resultado sem NumPy
+            self.assertEqual(divide([4.0, None, 1.0, 3.0], [2.0, 1.0, 0.0, None]), expected)
+
+    def test_cross_rates(self):
+        queryset = TaxaCambio.objects.filter(data__range=(date(2024, 1, 8), date(2024, 1, 9)))
+
+        with self.assertNumQueries(1):
+            eur_brl = queryset.cross_rates('EUR', 'BRL')
+
+        self.assertEqual(eur_brl['dates'], ['2024-01-08', '2024-01-09'])
+        self.assertAlmostEqual(eur_brl['rates'][0], 5.25 / 0.85)
+        self.assertIsNone(eur_brl['rates'][1]) # Sem EUR no dia 09
+        self.assertEqual(queryset.cross_rates('USD', 'JPY')['rates'], [110.5, 111.0])
+        self.assertAlmostEqual(queryset.cross_rates('JPY', 'USD')['rates'][0], 1 / 110.5)
+
+class DownsamplingTestCase(TestCase):
+
+    series = {
+        # Segunda 08/01 a terça 16/01 (sem o fim de semana) e 01/02
+        'dates': ['2024-01-08', '2024-01-09', '2024-01-10', '2024-01-15', '2024-01-16', '2024-02-01'],
+        'BRL': [5.0, 5.4, 5.2, None, 5.6, 6.0],
+    }
+
+    def test_resample_week_and_month_mean(self):
+        self.assertEqual(resample(self.series, ['BRL'], 'week'), {
+            'dates': ['2024-01-08', '2024-01-15', '2024-01-29'],
+            'BRL': [5.2, 5.6, 6.0],
+        })
+        monthly = resample(self.series, ['BRL'], 'month')
+        self.assertEqual(monthly['dates'], ['2024-01-01', '2024-02-01'])
+        self.assertAlmostEqual(monthly['BRL'][0], 5.3)
+
+    def test_resample_ohlc(self):
+        expected = {
+            'dates': ['2024-01-08', '2024-01-15', '2024-01-29'],
+            'BRL': {'open': [5.0, 5.6, 6.0], 'high': [5.4, 5.6, 6.0], 'low': [5.0, 5.6, 6.0], 'close': [5.2, 5.6, 6.0]},
+        }
+        self.assertEqual(resample(self.series, ['BRL'], 'week', ohlc=True), expected)
+        with patch('core.columnar.np', None): # Mesmo resultado sem NumPy
+            self.assertEqual(resample(self.series, ['BRL'], 'week', ohlc=True), expected)
+
+    def test_lttb_keeps_extremes_and_bounds_points(self):
+        xs = list(range(1000))
+        columns = [[float(x % 50) for x in xs], [None if x % 7 == 0 else float(x) for x in xs]]
+        columns[0][500] = 1000.0 # Pico isolado precisa sobreviver à redução
+
+        indices = lttb_indices(xs, columns, 40)
+        self.assertEqual(len(indices), 40)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertIn(500, indices)
+        with patch('core.columnar.np', None):
+            self.assertEqual(lttb_indices(xs, columns, 40), indices)
+        self.assertEqual(downsample(self.series, ['BRL'], 10), self.series) # Já cabe no limite
+
+@override_settings(COTACOES_ANALYTICS_WINDOWS=[3, 5])
+class AnalyticsTestCase(TestCase):
+
+    values = [5.0, 5.2, 5.1, 5.4, 5.3, 5.6, 5.5, 5.9]
+
+    def _rates(self, days):
+        return [(date(2024, 1, 1) + timedelta(days=i), {'BRL': self.values[i], 'EUR': 0.9, 'JPY': 110.0 + i}) for i in days]
+
+    def _indicators(self):
+        return list(IndicadorCotacao.objects.order_by('moeda', 'janela', 'data').values_list(
+            'data', 'moeda', 'janela', 'sma', 'ema', 'desvio_padrao', 'retorno'
+        ))
+
+    def assertIndicatorsAlmostEqual(self, first, second):
+        # Acumuladores deslizantes dependem do caminho: estender ou recalcular difere no último bit
+        self.assertEqual([row[:3] for row in first], [row[:3] for row in second])
+        for row, other in zip(first, second):
+            for value, expected in zip(row[3:], other[3:]):
+                if expected is None:
+                    self.assertIsNone(value)
+                else:
+                    self.assertAlmostEqual(value, expected, places=12)
+
+    def test_rolling_indicators_match_naive_computation(self):
+        indicators = rolling_indicators(self.values, 3)
+
+        self.assertIsNone(indicators[1]['sma']) # Janela ainda incompleta
+        for i in range(2, len(self.values)):
+            window = self.values[i - 2:i + 1]
+            self.assertAlmostEqual(indicators[i]['sma'], statistics.mean(window))
+            self.assertAlmostEqual(indicators[i]['std'], statistics.stdev(window))
+            self.assertAlmostEqual(indicators[i]['return'], self.values[i] / self.values[i - 1] - 1)
+        self.assertAlmostEqual(indicators[1]['ema'], 0.5 * 5.2 + 0.5 * 5.0)
+
+    def test_rolling_std_is_stable_for_large_values(self):
+        # Soma dos quadrados perde a variância em valores grandes com pouca oscilação
+        values = [1e9 + (i % 3) for i in range(1000)]
+        for indicators in rolling_indicators(values, 3)[2:]:
+            self.assertAlmostEqual(indicators['std'], 1.0, places=6)
+            self.assertAlmostEqual(indicators['sma'], 1e9 + 1, places=6)
+
+    def test_save_only_marks_indicators_as_pending(self):
+        service = VatComplyService()
+        service.save_rates(self._rates(range(3, 8)))
+        service.save_rates(self._rates(range(0, 3)))
+
+        self.assertFalse(IndicadorCotacao.objects.exists()) # Nada recalculado na gravação
+        self.assertEqual(pending_from(), date(2024, 1, 1))
+        self.assertEqual(process_pending(), 8 * 3 * 2)
+        self.assertIsNone(pending_from())
+        self.assertIsNone(process_pending())
+
+    def test_marker_changed_during_recompute_is_kept(self):
+        VatComplyService().save_rates(self._rates(range(8)))
+
+        # Uma gravação concorrente marca de novo enquanto o worker recalcula
+        with patch('core.analytics.update_indicators', side_effect=lambda day: mark_pending(date(2024, 1, 5)) or 0):
+            process_pending()
+        self.assertEqual(pending_from(), date(2024, 1, 1))
+        process_pending()
+        self.assertFalse(IndicadorPendente.objects.exists())
+
+    def test_ingestion_extends_indicators_incrementally(self):
+        service = VatComplyService()
+        service.save_rates(self._rates(range(0, 5)))
+        process_pending()
+        service.save_rates(self._rates(range(5, 8))) # Só os novos dias são calculados
+        process_pending()
+        incremental = self._indicators()
+
+        IndicadorCotacao.objects.all().delete()
+        update_indicators()
+        self.assertIndicatorsAlmostEqual(self._indicators(), incremental)
+        self.assertEqual(len(incremental), 8 * 3 * 2) # Dias x moedas x janelas
+
+        # Recalcular sobre linhas existentes regrava por upsert, sem violar (moeda, janela, data)
+        update_indicators(date(2024, 1, 3))
+        self.assertIndicatorsAlmostEqual(self._indicators(), incremental)
+
+        # Um dia antigo corrigido recalcula daquele dia em diante
+        self.values = list(self.values)
+        self.values[6] = 7.0
+        service.save_rates(self._rates([6]))
+        process_pending()
+        brl = IndicadorCotacao.objects.get(moeda='BRL', janela=3, data=date(2024, 1, 8))
+        self.assertAlmostEqual(brl.sma, statistics.mean([5.6, 7.0, 5.9]))
+
+        # Dia apagado de Cotacao perde os indicadores
+        Cotacao.objects.filter(data=date(2024, 1, 8)).delete()
+        update_indicators(date(2024, 1, 7))
+        self.assertFalse(IndicadorCotacao.objects.filter(data=date(2024, 1, 8)).exists())
+
+    def test_get_analytics_api(self):
+        service = VatComplyService()
+        service.save_rates(self._rates(range(8)))
+        process_pending()
+
+        response = self.client.get('/api/cotacoes/analytics/?currency=brl&window=3&start_date=2024-01-01&end_date=2024-01-31')
+        data = response.json()
+        self.assertEqual(data['dates'][0], '2024-01-01')
+        self.assertEqual(len(data['sma']), 8)
+        self.assertAlmostEqual(data['sma'][2], statistics.mean(self.values[:3]))
+        self.assertIn('ETag', response)
+
+        # Recálculo pendente no período: sem validadores, para não fixar a versão antiga no cache
+        service.save_rates(self._rates([5]))
+        response = self.client.get('/api/cotacoes/analytics/?currency=brl&window=3&start_date=2024-01-01&end_date=2024-01-31')
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        self.assertEqual(self.client.get('/api/cotacoes/analytics/?window=21&start_date=2024-01-01&end_date=2024-01-31').status_code, 400)
+        self.assertEqual(self.client.get('/api/cotacoes/analytics/?currency=GBP&start_date=2024-01-01&end_date=2024-01-31').status_code, 400)
+
+class SummariesTestCase(TestCase):
+
+    def _summaries(self):
+        return list(ResumoCotacao.objects.order_by('periodo', 'moeda', 'inicio').values_list(
+            'periodo', 'inicio', 'moeda', 'media', 'minimo', 'maximo', 'dias'
+        ))
+
+    def test_ingestion_updates_only_touched_buckets(self):
+        service = VatComplyService()
+        service.save_rates([
+            (date(2024, 1, 8), {'BRL': 5.0, 'EUR': 0.9, 'JPY': 110.0}),
+            (date(2024, 1, 9), {'BRL': 6.0, 'EUR': None, 'JPY': 112.0}),
+            (date(2024, 2, 1), {'BRL': 5.5, 'EUR': 0.8, 'JPY': 111.0}),
+        ])
+        january = ResumoCotacao.objects.get(periodo='month', moeda='BRL', inicio=date(2024, 1, 1))
+        self.assertEqual((january.media, january.minimo, january.maximo, january.dias), (5.5, 5.0, 6.0, 2))
+        self.assertEqual(ResumoCotacao.objects.get(periodo='month', moeda='EUR', inicio=date(2024, 1, 1)).dias, 1)
+        self.assertEqual(ResumoCotacao.objects.get(periodo='year', moeda='BRL', inicio=date(2024, 1, 1)).dias, 3)
+
+        ResumoCotacao.objects.filter(periodo='month', inicio=date(2024, 1, 1)).update(media=0.0) # "Deriva"
+        service.save_rates([(date(2024, 2, 2), {'BRL': 6.5, 'EUR': 0.8, 'JPY': 111.0})])
+        self.assertEqual(ResumoCotacao.objects.get(periodo='month', moeda='BRL', inicio=date(2024, 1, 1)).media, 0.0) # Janeiro não foi tocado
+        self.assertEqual(ResumoCotacao.objects.get(periodo='month', moeda='BRL', inicio=date(2024, 2, 1)).media, 6.0)
+
+        out = StringIO()
+        call_command('rebuild_resumos', '--skip-indicators', stdout=out)
+        self.assertEqual(ResumoCotacao.objects.get(periodo='month', moeda='BRL', inicio=date(2024, 1, 1)).media, 5.5)
+        incremental = self._summaries()
+        update_summaries()
+        self.assertEqual(self._summaries(), incremental)
+
+    def test_get_resumo_api(self):
+        VatComplyService().save_rates([
+            (date(2023, 12, 29), {'BRL': 4.8, 'EUR': 0.9, 'JPY': 140.0}),
+            (date(2024, 1, 8), {'BRL': 5.0, 'EUR': 0.9, 'JPY': 110.0}),
+            (date(2024, 1, 9), {'BRL': 6.0, 'EUR': 0.9, 'JPY': 112.0}),
+        ])
+
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/cotacoes/resumo/?periodo=year&currencies=BRL').json()
+        self.assertEqual(data, {'periodo': 'year', 'dates': ['2023-01-01', '2024-01-01'], 'BRL': {
+            'avg': [4.8, 5.5], 'min': [4.8, 5.0], 'max': [4.8, 6.0], 'days': [1, 2],
+        }})
+        monthly = self.client.get('/api/cotacoes/resumo/?start_date=2024-01-15').json()
+        self.assertEqual(monthly['dates'], ['2024-01-01'])
+        self.assertEqual(monthly['JPY']['max'], [112.0])
+        self.assertEqual(self.client.get('/api/cotacoes/resumo/?periodo=week').status_code, 400)
+        self.assertEqual(self.client.get('/api/cotacoes/resumo/?currencies=GBP').status_code, 400)
+
+class ExportTestCase(TestCase):
+
+    def setUp(self):
+        VatComplyService().save_rates([
+            (date(2024, 1, 8), {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.5, 'GBP': 0.79}),
+            (date(2024, 1, 9), {'BRL': 5.3, 'EUR': None, 'JPY': 111.0, 'GBP': 0.8}),
+        ])
+        self.expected_csv = 'date,BRL,EUR,JPY\n2024-01-08,5.25,0.85,110.5\n2024-01-09,5.3,,111.0\n'
+
+    def test_export_csv_streaming_and_gzip(self):
+        response = self.client.get('/api/cotacoes/export/')
+        self.assertTrue(response.streaming)
+        self.assertIn('cotacoes.csv', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content).decode(), self.expected_csv)
+
+        response = self.client.get('/api/cotacoes/export/?gzip=1&start_date=2024-01-09&end_date=2024-01-31&currencies=GBP')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(), 'date,GBP\n2024-01-09,0.8\n')
+
+    def test_export_command_writes_file(self):
+        VatComplyService().save_rates([
+            (date(2020, 1, 1) + timedelta(days=i), {'BRL': 5.0, 'EUR': 0.9, 'JPY': 110.0}) for i in range(CHUNK_SIZE + 10)
+        ])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cotacoes.csv.gz')
+            out = StringIO()
+            call_command('export_cotacoes', '--output', path, '--gzip', stdout=out)
+            with gzip.open(path, 'rt') as f:
+                lines = f.read().splitlines()
+        self.assertEqual(len(lines), CHUNK_SIZE + 10 + 1) # Várias escritas em bloco + cabeçalho
+        self.assertEqual(lines[0], 'date,BRL,EUR,JPY')
+        self.assertIn(f'{CHUNK_SIZE + 10} linha(s) exportada(s)', out.getvalue())
+
+    @unittest.skipIf(HAS_PYARROW, "pyarrow instalado")
+    def test_export_parquet_requires_pyarrow(self):
+        self.assertEqual(self.client.get('/api/cotacoes/export/?format=parquet').status_code, 501)
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow não instalado")
+    def test_export_parquet(self):
+        import pyarrow.parquet as pq
+        response = self.client.get('/api/cotacoes/export/?format=parquet')
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column_names, ['date', 'BRL', 'EUR', 'JPY'])
+        self.assertEqual(table.column('EUR').to_pylist(), [0.85, None])
+
+class ImportCommandTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_import_csv_validates_and_loads_in_batches(self):
+        path = self._write('cotacoes.csv', (
+            'date,BRL,EUR,JPY,GBP\n'
+            '2024-01-08,5.25,0.85,110.5,0.79\n'
+            '2024-01-09,5.3,,111.0,0.8\n'
+            '2024-13-01,5.3,0.85,111.0,0.8\n' # Data inválida
+            '2024-01-10,abc,0.85,111.0,0.8\n' # Taxa inválida
+            '2024-01-11,,,,0.81\n' # Só GBP: não cria linha em Cotacao
+        ))
+        out, err = StringIO(), StringIO()
+        call_command('import_cotacoes', path, '--batch-size', '2', stdout=out, stderr=err)
+
+        self.assertEqual(list(Cotacao.objects.order_by('data').values_list('data', 'valor_eur')), [
+            (date(2024, 1, 8), Decimal('0.8500')), (date(2024, 1, 9), None),
+        ])
+        self.assertEqual(TaxaCambio.objects.filter(moeda='GBP').count(), 3)
+        self.assertIn('3 dia(s)', out.getvalue())
+        self.assertIn('2 registro(s) inválido(s)', out.getvalue())
+        self.assertIn('cotacoes.csv:4: data inválida', err.getvalue())
+        self.assertEqual(ResumoCotacao.objects.get(periodo='month', moeda='BRL', inicio=date(2024, 1, 1)).dias, 2)
+        self.assertTrue(IndicadorCotacao.objects.filter(moeda='BRL', data=date(2024, 1, 9)).exists())
+
+    def test_import_other_base_leaves_cotacao_untouched(self):
+        VatComplyService().save_rates([(date(2024, 1, 8), {'BRL': 5.0, 'EUR': 0.9, 'JPY': 110.0})])
+        before = list(Cotacao.objects.values_list('data', 'valor_brl', 'valor_eur', 'valor_jpy'))
+        path = self._write('eur.csv', 'date,BRL,USD,JPY\n2024-01-08,5.5,1.1,160.0\n2024-01-09,5.6,1.1,161.0\n')
+
+        call_command('import_cotacoes', path, '--base', 'eur', stdout=StringIO())
+
+        self.assertEqual(list(Cotacao.objects.values_list('data', 'valor_brl', 'valor_eur', 'valor_jpy')), before)
+        self.assertEqual(TaxaCambio.objects.filter(base='EUR').count(), 6)
+        self.assertFalse(CoberturaCotacao.objects.filter(inicio__lte=date(2024, 1, 9), fim__gte=date(2024, 1, 9)).exists())
+
+    def test_other_base_never_mixes_into_usd_reads(self):
+        VatComplyService().save_rates([(date(2024, 1, 8), {'BRL': 5.0, 'GBP': 0.8})])
+        urls = [
+            '/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-31&currencies=GBP',
+            '/api/cotacoes/db/?currencies=BRL,GBP',
+            '/api/cotacoes/cross/?from=GBP&to=BRL&start_date=2024-01-01&end_date=2024-01-31',
+            '/api/cotacoes/export/?format=csv&start_date=2024-01-01&end_date=2024-01-31&currencies=GBP',
+        ]
+        before = {url: self.client.get(url) for url in urls}
+        caches['default'].clear()
+        quote_series_cache.clear()
+
+        path = self._write('eur.csv', 'date,BRL,GBP\n2024-01-08,5.5,0.88\n2024-01-09,5.6,0.87\n')
+        call_command('import_cotacoes', path, '--base', 'EUR', stdout=StringIO())
+
+        for url, response in before.items():
+            after = self.client.get(url)
+            self.assertEqual(b''.join(after) if after.streaming else after.content,
+                             b''.join(response) if response.streaming else response.content, url)
+            if 'ETag' in response:
+                self.assertEqual(after['ETag'], response['ETag'], url)
+
+    def test_import_ndjson_conflict_policies(self):
+        VatComplyService().save_rates([(date(2024, 1, 8), {'BRL': 5.0, 'EUR': 0.9, 'JPY': 110.0})])
+        path = self._write('cotacoes.ndjson.gz', (
+            '{"date": "2024-01-08", "rates": {"BRL": 5.5}}\n'
+            '{"date": "2024-01-09", "BRL": 5.6, "EUR": 0.95}\n'
+        ))
+
+        call_command('import_cotacoes', path, '--on-conflict', 'skip', stdout=StringIO())
+        self.assertEqual(Cotacao.objects.get(data=date(2024, 1, 8)).valor_brl, Decimal('5.0'))
+        self.assertEqual(Cotacao.objects.get(data=date(2024, 1, 9)).valor_eur, Decimal('0.95'))
+
+        call_command('import_cotacoes', path, stdout=StringIO()) # update (padrão)
+        atualizada = Cotacao.objects.get(data=date(2024, 1, 8))
+        self.assertEqual((atualizada.valor_brl, atualizada.valor_eur), (Decimal('5.5'), Decimal('0.9'))) # EUR ausente no arquivo é mantido
+
+        with self.assertRaisesMessage(CommandError, 'Cotação já existente'):
+            call_command('import_cotacoes', path, '--on-conflict', 'error', stdout=StringIO())
+
+    def test_import_conflict_error_rolls_back_earlier_batches(self):
+        VatComplyService().save_rates([(date(2024, 1, 10), {'BRL': 5.0, 'EUR': 0.9, 'JPY': 110.0})])
+        before = ResumoCotacao.objects.count()
+        path = self._write('cotacoes.csv', (
+            'date,BRL,EUR,JPY\n'
+            '2024-01-08,5.25,0.85,110.5\n'
+            '2024-01-09,5.3,0.86,111.0\n'
+            '2024-01-10,5.4,0.87,112.0\n' # Já existe: o segundo lote falha
+        ))
+
+        with self.assertRaisesMessage(CommandError, 'nada foi importado'):
+            call_command('import_cotacoes', path, '--on-conflict', 'error', '--batch-size', '2', stdout=StringIO())
+
+        self.assertEqual(list(Cotacao.objects.values_list('data', flat=True)), [date(2024, 1, 10)])
+        self.assertFalse(TaxaCambio.objects.filter(data__lt=date(2024, 1, 10)).exists())
+        self.assertFalse(CoberturaCotacao.objects.filter(inicio__lte=date(2024, 1, 8), fim__gte=date(2024, 1, 8)).exists())
+        self.assertEqual(ResumoCotacao.objects.count(), before)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', "COPY só existe no PostgreSQL")
+    def test_import_copy_path_conflict_policies(self):
+        VatComplyService().save_rates([(date(2024, 1, 8), {'BRL': 5.0, 'EUR': 0.9, 'JPY': 110.0})])
+        path = self._write('cotacoes.csv', (
+            'date,BRL,EUR,JPY,GBP\n'
+            '2024-01-08,5.5,,111.0,0.79\n'
+            '2024-01-09,5.6,0.95,112.0,\n'
+            '2024-01-10,,,,0.81\n'
+        ))
+
+        out = StringIO()
+        call_command('import_cotacoes', path, '--on-conflict', 'skip', '--batch-size', '2', stdout=out)
+        self.assertIn('Carga via COPY', out.getvalue())
+        self.assertEqual(Cotacao.objects.get(data=date(2024, 1, 8)).valor_brl, Decimal('5.0'))
+        self.assertEqual(Cotacao.objects.get(data=date(2024, 1, 9)).valor_eur, Decimal('0.95'))
+        self.assertFalse(Cotacao.objects.filter(data=date(2024, 1, 10)).exists())
+        self.assertEqual(TaxaCambio.objects.filter(moeda='GBP').count(), 2)
+
+        call_command('import_cotacoes', path, '--batch-size', '2', stdout=StringIO()) # update (padrão)
+        atualizada = Cotacao.objects.get(data=date(2024, 1, 8))
+        self.assertEqual((atualizada.valor_brl, atualizada.valor_eur), (Decimal('5.5'), Decimal('0.9')))
+
+        with self.assertRaisesMessage(CommandError, 'nada foi importado'):
+            call_command('import_cotacoes', path, '--on-conflict', 'error', stdout=StringIO())
+        self.assertEqual(Cotacao.objects.count(), 2)
+
+class QuoteSeriesCacheTestCase(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        quote_series_cache.clear()
+        VatComplyService().save_rates([(date(2024, 1, 8), {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.0})])
+
+    def test_lru_eviction(self):
+        lru = LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3) # 'b' é o menos usado
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(len(lru), 2)
+
+    def test_db_api_served_from_cache_until_invalidated(self):
+        url = '/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-31'
+        first = self.client.get(url)
+
+        with self.assertNumQueries(0): # 1º nível
+            self.assertEqual(self.client.get(url).content, first.content)
+        quote_series_cache.clear()
+        with self.assertNumQueries(0): # 2º nível (outro processo veria o mesmo)
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(cached['ETag'], first['ETag'])
+
+        # Gravar uma data do período invalida a entrada
+        VatComplyService().save_rates([(date(2024, 1, 9), {'BRL': 5.30})])
+        self.assertEqual(len(self.client.get(url).json()['dates']), 2)
+
+    def test_invalidation_only_affects_covering_years(self):
+        url = '/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-31'
+        self.client.get(url)
+        VatComplyService().save_rates([(date(2023, 6, 1), {'BRL': 4.9})])
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_local_hit_skips_shared_cache(self):
+        start, end = date(2024, 1, 1), date(2024, 1, 31)
+        quote_series_cache.set(start, end, ['BRL'], {'payload': b'x'})
+        with patch.object(type(caches['default']), 'get_many') as get_many, \
+                patch.object(type(caches['default']), 'get') as get:
+            self.assertEqual(quote_series_cache.get(start, end, ['BRL']), {'payload': b'x'})
+        get_many.assert_not_called()
+        get.assert_not_called()
+
+    def test_other_process_invalidation_seen_after_ttl(self):
+        start, end = date(2024, 1, 1), date(2024, 1, 31)
+        quote_series_cache.set(start, end, ['BRL'], {'payload': b'x'})
+        other = QuoteSeriesCache() # Outro processo: mesmo 2º nível, memória própria
+        other.invalidate_dates([date(2024, 1, 9)])
+
+        self.assertIsNotNone(quote_series_cache.get(start, end, ['BRL'])) # Geração local ainda válida
+        with patch('core.cache.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertIsNone(quote_series_cache.get(start, end, ['BRL']))
+
+    def test_evicted_generation_never_revives_old_entries(self):
+        start, end = date(2024, 1, 1), date(2024, 1, 31)
+        caches['default'].clear() # Ano ainda sem geração no 2º nível
+        quote_series_cache.clear()
+        quote_series_cache.set(start, end, ['BRL'], {'payload': b'x'})
+
+        # O backend descarta a geração (cull do FileBasedCache); a entrada antiga continua lá
+        caches['default'].delete(quote_series_cache._generation_key(2024))
+        quote_series_cache.clear()
+        self.assertIsNone(quote_series_cache.get(start, end, ['BRL']))
+        # Outro processo adota a mesma geração nova
+        self.assertEqual(QuoteSeriesCache()._generations_for([2024]), quote_series_cache._generations_for([2024]))
+
+# Testes da camada HTTP (sessão, timeouts, retentativas e circuit breaker) contra um servidor local
+class VatComplyHttpTestCase(TestCase):
+
+    def test_session_reuses_connection(self):
+        with FakeVatComplyServer() as server:
+            service = VatComplyService(base_url=server.rates_url, max_workers=1)
+            rates = service.get_rates_for_period(date(2024, 1, 8), date(2024, 1, 12))
+
+            self.assertEqual(len(rates), 5)
+            self.assertEqual(server.requests, 5)
+            self.assertEqual(server.connections, 1) # Keep-alive: uma única conexão TCP
+
+    @override_settings(COTACOES_MAX_CONNECTIONS_PER_HOST=16)
+    def test_session_pool_fits_host_connection_limit(self):
+        # backfill_cotacoes --workers 16 divide a sessão entre 16 threads: nenhuma conexão descartada
+        with patch.object(VatComplyService, '_session', None):
+            adapter = VatComplyService.get_session().get_adapter('https://api.vatcomply.com/rates')
+        self.assertEqual(adapter._pool_maxsize, 16)
+
+    def test_read_timeout(self):
+        with FakeVatComplyServer(latency=0.5) as server:
+            service = VatComplyService(base_url=server.rates_url, read_timeout=0.1, max_retries=0)
+            started = time.monotonic()
+            self.assertIsNone(service.get_daily_rates(date(2024, 1, 8)))
+            self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_retries_then_circuit_fails_fast(self):
+        with FakeVatComplyServer(status=503) as server:
+            service = VatComplyService(base_url=server.rates_url, max_retries=1, backoff_factor=0.01)
+            for _ in range(VatComplyService.CIRCUIT_FAILURE_THRESHOLD):
+                self.assertIsNone(service.get_daily_rates(date(2024, 1, 8)))
+            # Cada chamada faz a tentativa original + 1 retentativa
+            self.assertEqual(server.requests, VatComplyService.CIRCUIT_FAILURE_THRESHOLD * 2)
+
+            # Circuito aberto: a chamada falha sem chegar ao servidor
+            self.assertIsNone(service.get_daily_rates(date(2024, 1, 9)))
+            self.assertEqual(server.requests, VatComplyService.CIRCUIT_FAILURE_THRESHOLD * 2)
+
+    def test_range_fetch_uses_single_call(self):
+        with FakeVatComplyServer() as server:
+            service = VatComplyService(base_url=server.rates_url, range_url=server.timeseries_url)
+            rates = service.get_rates_for_period(date(2024, 1, 1), date(2024, 1, 31))
+
+            self.assertEqual(len(rates), 22) # Dias úteis de janeiro/2024, sem o feriado de 01/01
+            self.assertEqual(server.requests, 1)
+            self.assertEqual(set(rates[0]['rates']), {'BRL', 'EUR', 'JPY'}) # Mesmo formato da busca diária
+            self.assertEqual(Cotacao.objects.count(), 22)
+
+    def test_range_fetch_falls_back_to_daily(self):
+        with FakeVatComplyServer(supports_range=False) as server:
+            service = VatComplyService(base_url=server.rates_url, range_url=server.timeseries_url)
+            rates = service.get_rates_for_period(date(2024, 1, 8), date(2024, 1, 12))
+
+            self.assertEqual([r['date'] for r in rates], ['2024-01-08', '2024-01-09', '2024-01-10', '2024-01-11', '2024-01-12'])
+            self.assertEqual(server.requests, 6) # 1 tentativa de período (404) + 5 dias
+
+    def test_circuit_breaker_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call() # Chamada de teste liberada
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+
+class BackfillCommandTestCase(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.tmpdir.name, 'checkpoint.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _backfill(self, server, **options):
+        out = StringIO()
+        call_command(
+            'backfill_cotacoes', start='2024-01-01', end='2024-01-31', workers=4, chunk_days=7,
+            checkpoint=self.checkpoint, base_url=server.rates_url, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_backfill_fetches_all_business_days(self):
+        with FakeVatComplyServer() as server:
+            output = self._backfill(server)
+
+        self.assertEqual(Cotacao.objects.count(), 22) # Dias úteis de janeiro/2024, sem o feriado de 01/01
+        self.assertEqual(server.requests, 22)
+        self.assertIn('linhas/s', output)
+
+    def test_backfill_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'start': '2024-01-01', 'end': '2024-01-31', 'chunk_days': 7,
+                       'done': ['2024-01-01', '2024-01-08']}, f)
+
+        with FakeVatComplyServer() as server:
+            self._backfill(server)
+            self.assertEqual(server.requests, 13) # Só os blocos a partir de 15/01
+            self._backfill(server)
+            self.assertEqual(server.requests, 13) # Tudo concluído: nada a buscar
+
+        with open(self.checkpoint) as f:
+            self.assertEqual(len(json.load(f)['done']), 5)
+
+    def test_backfill_retries_chunk_with_failed_day(self):
+        with FakeVatComplyServer(missing_dates=[date(2024, 1, 10)]) as server:
+            output = self._backfill(server)
+        self.assertEqual(Cotacao.objects.count(), 21)
+        self.assertIn('1 dia(s) sem cotação', output)
+        with open(self.checkpoint) as f:
+            self.assertNotIn('2024-01-08', json.load(f)['done']) # Bloco de 08 a 14/01 continua pendente
+
+        with FakeVatComplyServer() as server:
+            self._backfill(server)
+            self.assertEqual(server.requests, 1) # Só o dia que falhou
+        self.assertTrue(Cotacao.objects.filter(data=date(2024, 1, 10)).exists())
+        with open(self.checkpoint) as f:
+            self.assertEqual(len(json.load(f)['done']), 5)
+
+    def test_backfill_skips_days_already_covered(self):
+        VatComplyService().save_rates([(date(2024, 1, day), {'BRL': 1.0}) for day in (2, 3, 4, 5)])
+
+        with FakeVatComplyServer() as server:
+            self._backfill(server)
+            self.assertEqual(server.requests, 18) # Só as lacunas do índice de cobertura
+            self._backfill(server, reset=True, refetch=True)
+            self.assertEqual(server.requests, 40)
+
+        self.assertEqual(list(CoberturaCotacao.objects.values_list('inicio', 'fim')), [(date(2024, 1, 2), date(2024, 1, 31))])
+
+class IngestCommandTestCase(TestCase):
+
+    def test_ingest_once_fills_gaps_and_refreshes_latest(self):
+        VatComplyService().save_rates([(date(2024, 1, 10), {'BRL': 1.0}), (date(2024, 1, 12), {'BRL': 1.0})])
+
+        with FakeVatComplyServer() as server:
+            with patch.object(VatComplyService, 'BASE_URL', server.rates_url):
+                out = StringIO()
+                call_command('ingest_cotacoes', once=True, lookback_days=7, today='2024-01-13', stdout=out)
+
+        # Lacunas 08, 09, 11 + o último dia útil (12) mesmo já existindo
+        self.assertEqual(server.requests, 4)
+        self.assertEqual(Cotacao.objects.count(), 5)
+        self.assertNotEqual(Cotacao.objects.get(data=date(2024, 1, 12)).valor_brl, Decimal('1.0'))
+        self.assertIn('4 cotação(ões) salva(s)', out.getvalue())
+        # Indicadores marcados pelas gravações são recalculados no mesmo ciclo
+        self.assertTrue(IndicadorCotacao.objects.filter(moeda='BRL', data=date(2024, 1, 12)).exists())
+        self.assertIsNone(pending_from())
+
+    @patch('core.services.VatComplyService.sync_recent')
+    def test_ingest_rejects_invalid_today_before_running(self, mock_sync_recent):
+        with self.assertRaisesMessage(CommandError, 'Formato de data inválido: 2024-13-01'):
+            call_command('ingest_cotacoes', today='2024-13-01', stdout=StringIO())
+        mock_sync_recent.assert_not_called()
+
+    @override_settings(COTACOES_API_DB_ONLY=True)
+    @patch('core.services.VatComplyService.fetch_rates')
+    def test_db_only_mode_never_calls_upstream(self, mock_fetch_rates):
+        VatComplyService().save_rates([(date(2024, 1, 8), {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.0})])
+
+        response = Client().get('/api/cotacoes/?start_date=2024-01-08&end_date=2024-01-09')
+
+        self.assertEqual(response.json()['dates'], ['2024-01-08'])
+        mock_fetch_rates.assert_not_called()
+
+class CoverageTestCase(TestCase):
+
+    def _runs(self):
+        return list(CoberturaCotacao.objects.values_list('inicio', 'fim'))
+
+    def _save(self, *days):
+        VatComplyService().save_rates([(day, {'BRL': 5.0}) for day in days])
+
+    def test_build_runs_bridges_weekends_and_holidays(self):
+        calendar = get_calendar('target')
+        days = [date(2024, 3, 27), date(2024, 3, 28), date(2024, 4, 2), date(2024, 4, 5), date(2024, 4, 6)]
+        # 29/03 e 01/04 são feriados; 03 e 04/04 faltam; 06/04 (sábado) é ignorado
+        self.assertEqual(coverage.build_runs(days, calendar), [
+            (date(2024, 3, 27), date(2024, 4, 2)), (date(2024, 4, 5), date(2024, 4, 5)),
+        ])
+
+    def test_save_rates_merges_into_existing_runs(self):
+        self._save(date(2024, 1, 8), date(2024, 1, 9))
+        self._save(date(2024, 1, 15), date(2024, 1, 16))
+        self.assertEqual(self._runs(), [(date(2024, 1, 8), date(2024, 1, 9)), (date(2024, 1, 15), date(2024, 1, 16))])
+
+        self._save(date(2024, 1, 9)) # Já coberto: nada muda
+        self._save(date(2024, 1, 10), date(2024, 1, 11), date(2024, 1, 12))
+        self.assertEqual(self._runs(), [(date(2024, 1, 8), date(2024, 1, 16))])
+
+    def test_gaps_and_missing_days(self):
+        self._save(date(2024, 1, 2), date(2024, 1, 3), date(2024, 1, 10), date(2024, 1, 11), date(2024, 1, 12))
+
+        with self.assertNumQueries(1):
+            gaps = coverage.gaps(date(2023, 12, 30), date(2024, 1, 21))
+        self.assertEqual(gaps, [
+            (date(2024, 1, 4), date(2024, 1, 9), 4),
+            (date(2024, 1, 15), date(2024, 1, 19), 5),
+        ])
+        self.assertEqual(VatComplyService().find_missing_days(date(2024, 1, 8), date(2024, 1, 12)), [date(2024, 1, 8), date(2024, 1, 9)])
+        self.assertTrue(coverage.is_complete(date(2024, 1, 10), date(2024, 1, 14)))
+        self.assertTrue(coverage.is_complete(date(2024, 1, 6), date(2024, 1, 7))) # Só fim de semana
+
+    def test_ten_year_check_costs_one_query(self):
+        calendar = get_calendar()
+        days = calendar.trading_days(date(2014, 1, 1), date(2023, 12, 31))
+        missing = {date(2016, 6, 1), date(2021, 3, 15)}
+        self._save(*[day for day in days if day not in missing])
+        self.assertEqual(CoberturaCotacao.objects.count(), 3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(coverage.missing_days(date(2014, 1, 1), date(2023, 12, 31)), sorted(missing))
+
+    def test_rebuild_from_cotacao(self):
+        self._save(date(2024, 1, 8), date(2024, 1, 9), date(2024, 1, 11))
+        CoberturaCotacao.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_resumos', '--skip-indicators', stdout=out)
+
+        self.assertEqual(self._runs(), [(date(2024, 1, 8), date(2024, 1, 9)), (date(2024, 1, 11), date(2024, 1, 11))])
+        self.assertIn('2 intervalo(s) de cobertura', out.getvalue())
+
+    def test_import_updates_coverage(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("date,BRL,GBP\n2024-01-08,5.0,0.8\n2024-01-09,,0.8\n2024-01-10,5.1,0.8\n")
+        try:
+            call_command('import_cotacoes', f.name, stdout=StringIO())
+        finally:
+            os.unlink(f.name)
+        # 09/01 só tem GBP: não entra em Cotacao nem na cobertura
+        self.assertEqual(self._runs(), [(date(2024, 1, 8), date(2024, 1, 8)), (date(2024, 1, 10), date(2024, 1, 10))])
+
+    def test_get_gaps_api(self):
+        self._save(date(2024, 1, 8), date(2024, 1, 9))
+
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/cotacoes/gaps/?start_date=2024-01-08&end_date=2024-01-12').json()
+        self.assertEqual(data, {
+            'start': '2024-01-08', 'end': '2024-01-12', 'complete': False, 'missing_days': 3,
+            'gaps': [{'start': '2024-01-10', 'end': '2024-01-12', 'days': 3}],
+        })
+        self.assertTrue(self.client.get('/api/cotacoes/gaps/?start_date=2024-01-08&end_date=2024-01-09').json()['complete'])
+        self.assertEqual(self.client.get('/api/cotacoes/gaps/?start_date=2024-01-08').status_code, 400)
+        self.assertEqual(self.client.get('/api/cotacoes/gaps/?start_date=2024-01-12&end_date=2024-01-08').status_code, 400)
+
+class QueryPlansTestCase(TestCase):
+
+    def setUp(self):
+        VatComplyService().save_rates([
+            (date(2024, 1, 8) + timedelta(days=i), {'BRL': 5.0, 'EUR': 0.9, 'JPY': 110.0}) for i in range(10)
+        ])
+
+    def test_range_reads_are_index_only(self):
+        out = StringIO()
+        call_command('explain_cotacoes', '--strict', start='2024-01-01', end='2024-01-31', stdout=out)
+        self.assertIn('cotacao_data_covering_idx', out.getvalue())
+        self.assertIn('Todos os planos verificados estão index-only.', out.getvalue())
+
+    def test_in_range_unordered_skips_default_ordering(self):
+        queryset = Cotacao.objects.in_range(date(2024, 1, 8), date(2024, 1, 12), ordered=False)
+        self.assertNotIn('ORDER BY', str(queryset.query))
+        ordered = Cotacao.objects.in_range(date(2024, 1, 8), date(2024, 1, 12)).values_list('data', flat=True)
+        self.assertEqual(sorted(queryset.values_list('data', flat=True)), list(ordered))
+
+    def test_db_api_range_is_validators_plus_one_read(self):
+        with self.assertNumQueries(2): # Agregado do ETag + a série, sem exists()
+            data = self.client.get('/api/cotacoes/db/?start_date=2024-01-08&end_date=2024-01-10').json()
+        self.assertEqual(data['dates'], ['2024-01-08', '2024-01-09', '2024-01-10'])
+
+    def test_covering_index_deconstruct(self):
+        index = Cotacao._meta.indexes[0]
+        self.assertIsInstance(index, CoveringIndex)
+        path, args, kwargs = index.deconstruct()
+        self.assertEqual(path, 'core.models.CoveringIndex')
+        self.assertEqual(CoveringIndex(*args, **kwargs), index)
+
+    def test_check_plan_postgresql(self):
+        index_only = (
+            "Index Only Scan using cotacao_data_covering_idx on core_cotacao  (cost=0.29..8.50 rows=250 width=40)\n"
+            "  Index Cond: ((data >= '2024-01-01'::date) AND (data <= '2024-12-31'::date))"
+        )
+        self.assertEqual(check_plan('postgresql', index_only, ordered=True), [])
+        sorted_scan = "Sort  (cost=20.1..20.7 rows=250 width=40)\n  ->  Seq Scan on core_cotacao  (cost=0.00..10.1 rows=250 width=40)"
+        self.assertEqual(len(check_plan('postgresql', sorted_scan, ordered=True)), 2)
+        self.assertEqual(len(check_plan('postgresql', sorted_scan, ordered=False)), 1)
+        self.assertEqual(len(check_plan('postgresql', "Index Scan using core_cotacao_data_key on core_cotacao", ordered=True)), 1)
+        self.assertIsNone(check_plan('mysql', '', ordered=True))
+
+class SingleFlightTestCase(TestCase):
+
+    def _run_in_threads(self, func, count=8):
+        results = []
+        barrier = threading.Barrier(count)
+
+        def worker():
+            barrier.wait()
+            results.append(func())
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_daily_fetches_are_coalesced(self):
+        with FakeVatComplyServer(latency=0.2) as server:
+            service = VatComplyService(base_url=server.rates_url)
+            results = self._run_in_threads(lambda: service.get_daily_rates(date(2024, 1, 8), persist=False))
+
+            self.assertEqual(server.requests, 1)
+            self.assertEqual(len(results), 8)
+            self.assertTrue(all(result == results[0] for result in results))
+
+            # Terminada a busca, uma nova chamada vai de novo à API
+            service.get_daily_rates(date(2024, 1, 8), persist=False)
+            self.assertEqual(server.requests, 2)
+
+    def test_shared_single_flight_across_instances(self):
+        # Instâncias separadas simulam processos diferentes, coordenados só pelo cache
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'rates': {'BRL': 5.0}}
+
+        results = self._run_in_threads(lambda: SharedSingleFlight().do('2024-01-08', slow_fetch), count=4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'rates': {'BRL': 5.0}}] * 4)
+
+    def test_single_flight_propagates_errors(self):
+        def failing():
+            raise ValueError('falhou')
+        with self.assertRaises(ValueError):
+            SingleFlight().do('chave', failing)
+
+# Testes do cliente assíncrono e das views async (deploy ASGI)
+class AsyncServiceTestCase(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        quote_series_cache.clear()
+
+    async def test_fetches_missing_days_concurrently(self):
+        with FakeVatComplyServer(latency=0.2) as server:
+            service = AsyncVatComplyService(base_url=server.rates_url, max_connections_per_host=5)
+            started = time.monotonic()
+            rates = await service.aget_rates_for_period(date(2024, 1, 8), date(2024, 1, 12))
+            elapsed = time.monotonic() - started
+
+            self.assertEqual([r['date'] for r in rates], ['2024-01-08', '2024-01-09', '2024-01-10', '2024-01-11', '2024-01-12'])
+            self.assertEqual(server.requests, 5)
+            self.assertLess(elapsed, 0.2 * 5 * 0.6) # Em paralelo, não um dia após o outro
+        self.assertEqual(await Cotacao.objects.acount(), 5)
+        self.assertEqual(await TaxaCambio.objects.filter(moeda='GBP').acount(), 5)
+
+    async def test_reads_saved_days_without_requests(self):
+        with FakeVatComplyServer() as server:
+            service = AsyncVatComplyService(base_url=server.rates_url)
+            first = await service.aget_rates_for_period(date(2024, 1, 8), date(2024, 1, 10))
+            second = await service.aget_rates_for_period(date(2024, 1, 8), date(2024, 1, 10))
+            self.assertEqual(server.requests, 3)
+        self.assertEqual(first, second)
+
+    async def test_semaphore_limits_concurrency(self):
+        with FakeVatComplyServer(latency=0.1) as server:
+            service = AsyncVatComplyService(base_url=server.rates_url, max_connections_per_host=1)
+            started = time.monotonic()
+            await service.afetch_rates([date(2024, 1, 8), date(2024, 1, 9), date(2024, 1, 10)])
+            self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+    async def test_same_day_fetched_once(self):
+        with FakeVatComplyServer(latency=0.1) as server:
+            service = AsyncVatComplyService(base_url=server.rates_url)
+            results = await service.afetch_rates([date(2024, 1, 8)] * 4)
+            self.assertEqual(server.requests, 1)
+        self.assertEqual(len({r['rates']['BRL'] for r in results}), 1)
+
+    async def test_thread_fallback_without_httpx(self):
+        with patch('core.async_client.HAS_HTTPX', False), FakeVatComplyServer() as server:
+            service = AsyncVatComplyService(base_url=server.rates_url)
+            rates = await service.aget_rates_for_period(date(2024, 1, 8), date(2024, 1, 9))
+            self.assertEqual(server.requests, 2)
+        self.assertEqual(rates[0]['rates']['BRL'], fake_rates_for(date(2024, 1, 8))['BRL'])
+
+    async def test_upstream_error_returns_none(self):
+        with FakeVatComplyServer(status=404) as server:
+            service = AsyncVatComplyService(base_url=server.rates_url, max_retries=0)
+            self.assertIsNone(await service.aget_daily_rates(date(2024, 1, 8)))
+
+
+class AsyncViewsTestCase(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        quote_series_cache.clear()
+        for offset in range(10):
+            day = date(2024, 1, 1) + timedelta(days=offset)
+            Cotacao.objects.create(data=day, valor_brl=Decimal('5.0') + offset, valor_eur=Decimal('0.9'), valor_jpy=Decimal('140'))
+            TaxaCambio.objects.create(data=day, moeda='GBP', taxa=Decimal('0.75') + offset)
+        self.factory = RequestFactory()
+        self.async_factory = AsyncRequestFactory()
+
+    async def _compare(self, url):
+        sync_response = await sync_to_async(views.get_cotacoes_db_api)(self.factory.get(url))
+        quote_series_cache.clear()
+        async_response = await views.get_cotacoes_db_api_async(self.async_factory.get(url))
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response['ETag'], sync_response['ETag'])
+        self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+
+    async def test_db_api_matches_sync_view(self):
+        await self._compare('/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-10')
+        await self._compare('/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-10&currencies=BRL,GBP')
+        await self._compare('/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-10&resolution=week&ohlc=1')
+        await self._compare('/api/cotacoes/db/?currencies=GBP')
+        await self._compare('/api/cotacoes/db/')
+
+    async def test_db_api_streaming(self):
+        for currencies in ('BRL,EUR,JPY', 'GBP,BRL'):
+            url = f'/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-10&stream=1&currencies={currencies}'
+            response = await views.get_cotacoes_db_api_async(self.async_factory.get(url))
+            self.assertTrue(response.is_async)
+            payload = json.loads(b''.join([chunk async for chunk in response]))
+            expected = await sync_to_async(views.get_cotacoes_db_api)(self.factory.get(url.replace('&stream=1', '')))
+            self.assertEqual(payload, json.loads(expected.content))
+
+    async def test_db_api_not_modified(self):
+        url = '/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-10'
+        response = await views.get_cotacoes_db_api_async(self.async_factory.get(url))
+        response = await views.get_cotacoes_db_api_async(self.async_factory.get(url, headers={'If-None-Match': response['ETag']}))
+        self.assertEqual(response.status_code, 304)
+
+    async def test_cotacoes_api(self):
+        with FakeVatComplyServer() as server, patch.object(AsyncVatComplyService, 'BASE_URL', server.rates_url):
+            request = self.async_factory.get('/api/cotacoes/?start_date=2024-01-15&end_date=2024-01-19&currencies=BRL,GBP')
+            response = await views.get_cotacoes_api_async(request)
+            self.assertEqual(server.requests, 5)
+        data = json.loads(response.content)
+        self.assertEqual(len(data['dates']), 5)
+        self.assertEqual(set(data), {'dates', 'BRL', 'GBP'})
+        self.assertIn('ETag', response)
+
+    async def test_cotacoes_api_invalid_params(self):
+        response = await views.get_cotacoes_api_async(self.async_factory.get('/api/cotacoes/?start_date=2024-01-15'))
+        self.assertEqual(response.status_code, 400)
+
+
+# Testes das métricas (/metrics) e do log
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        quote_series_cache.clear()
+        metrics.registry.clear()
+
+    def test_disabled_by_default(self):
+        metrics.inc('cotacoes_cache_requests_total', result='hit')
+        with metrics.timer('cotacoes_db_upsert_seconds'):
+            pass
+        self.assertEqual(metrics.registry.render(), '\n')
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(COTACOES_METRICS_ENABLED=True)
+    def test_stage_metrics(self):
+        with FakeVatComplyServer() as server:
+            service = VatComplyService(base_url=server.rates_url, max_workers=1)
+            service.get_rates_for_period(date(2024, 1, 8), date(2024, 1, 10))
+        self.assertEqual(metrics.registry.value('cotacoes_upstream_request_seconds'), 3)
+        self.assertEqual(metrics.registry.value('cotacoes_upstream_requests_total', status=200), 3)
+        self.assertEqual(metrics.registry.value('cotacoes_db_upsert_seconds'), 1)
+        self.assertEqual(metrics.registry.value('cotacoes_db_upsert_rows_total'), 3)
+
+        url = '/api/cotacoes/db/?start_date=2024-01-08&end_date=2024-01-10'
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(metrics.registry.value('cotacoes_cache_requests_total', result='miss'), 1)
+        self.assertEqual(metrics.registry.value('cotacoes_cache_requests_total', result='hit', layer='local'), 1)
+        self.assertEqual(metrics.registry.value('cotacoes_serialization_seconds', view='db'), 1)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE cotacoes_upstream_request_seconds histogram', body)
+        self.assertIn('cotacoes_upstream_request_seconds_bucket{le="+Inf"} 3', body)
+        self.assertIn('cotacoes_upstream_request_seconds_count 3', body)
+        self.assertIn('cotacoes_upstream_requests_total{status="200"} 3', body)
+        self.assertIn('cotacoes_cache_hit_ratio 0.5', body)
+
+    def test_render_escapes_labels(self):
+        metrics.registry.inc('x_total', view='a"b')
+        self.assertIn('x_total{view="a\\"b"} 1', metrics.registry.render())
+
+    def test_debug_logging_off_by_default(self):
+        self.assertFalse(logging.getLogger('core.services').isEnabledFor(logging.DEBUG))
+        with FakeVatComplyServer(status=404) as server, self.assertLogs('core.services', 'WARNING') as logs:
+            VatComplyService(base_url=server.rates_url, max_retries=0).get_daily_rates(date(2024, 1, 8))
+        self.assertIn('date=2024-01-08 status=404', logs.output[0])
+
 
 # Testes para as Views (endpoints Django)
 class ViewsTestCase(TestCase):
 
     def setUp(self):
         self.client = Client()
+        caches['default'].clear()
+        quote_series_cache.clear()
 
     def test_index_view(self):
         response = self.client.get('/')
@@ -116,4 +1394,158 @@ class ViewsTestCase(TestCase):
         response = self.client.get('/api/cotacoes/?start_date=2024-01-01&end_date=2024-01-02')
         self.assertEqual(response.status_code, 200) # O status code é 200 se não houver erro, apenas sem dados.
         # Verifique a mensagem exata no seu views.py
-        self.assertIn('Nenhum dado de cotação encontrado para o período.', response.json()['message'])
\ No newline at end of file
+        self.assertIn('Nenhum dado de cotação encontrado para o período.', response.json()['message'])
+
+    def test_get_cotacoes_db_api_streaming(self):
+        VatComplyService().save_rates([
+            (date(2010, 1, 1) + timedelta(days=i), {'BRL': 5.0 + i / 100, 'EUR': 0.9, 'JPY': None})
+            for i in range(5000)
+        ])
+
+        response = self.client.get('/api/cotacoes/db/?start_date=2010-01-01&end_date=2023-12-31')
+        self.assertTrue(response.streaming) # Período longo: streaming automático
+        data = json.loads(b''.join(response.streaming_content))
+
+        self.assertEqual(len(data['dates']), 5000)
+        self.assertEqual(data['dates'][0], '2010-01-01')
+        self.assertEqual(data['BRL'][1], 5.01)
+        self.assertEqual(len(data['EUR']), 5000)
+        self.assertIsNone(data['JPY'][-1])
+
+    def test_get_cotacoes_db_api_stream_matches_regular_response(self):
+        VatComplyService().save_rates([(date(2024, 1, 8), {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.0})])
+        url = '/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-31'
+
+        regular = self.client.get(url).json()
+        streamed = json.loads(b''.join(self.client.get(url + '&stream=1').streaming_content))
+        self.assertEqual(streamed, regular)
+
+    def test_get_cotacoes_db_api_currencies(self):
+        VatComplyService().save_rates([
+            (date(2024, 1, 8), {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.0, 'GBP': 0.79}),
+            (date(2024, 1, 9), {'BRL': 5.3, 'EUR': 0.86, 'JPY': 111.0, 'GBP': 0.8}),
+        ])
+        url = '/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-31&currencies=gbp,BRL'
+
+        expected = {'dates': ['2024-01-08', '2024-01-09'], 'GBP': [0.79, 0.8], 'BRL': [5.25, 5.3]}
+        self.assertEqual(self.client.get(url).json(), expected)
+        self.assertEqual(json.loads(b''.join(self.client.get(url + '&stream=1').streaming_content)), expected)
+        self.assertEqual(self.client.get('/api/cotacoes/db/?currencies=GBP').json(), {'dates': ['2024-01-09', '2024-01-08'], 'GBP': [0.8, 0.79]})
+
+    def test_get_cross_rates_api(self):
+        VatComplyService().save_rates([
+            (date(2024, 1, 8), {'BRL': 5.0, 'EUR': 0.8, 'JPY': 110.0}),
+            (date(2024, 1, 9), {'BRL': 5.2, 'EUR': 0.8, 'JPY': 111.0}),
+        ])
+        url = '/api/cotacoes/cross/?from=eur&to=BRL&start_date=2024-01-01&end_date=2024-01-31'
+
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {'from': 'EUR', 'to': 'BRL', 'dates': ['2024-01-08', '2024-01-09'], 'rates': [6.25, 6.5]})
+
+        with self.assertNumQueries(0): # Par e período já em cache
+            cached = self.client.get(url)
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual((cached['ETag'], cached['Cache-Control']), (response['ETag'], response['Cache-Control']))
+        self.assertEqual(not_modified.status_code, 304)
+
+        VatComplyService().save_rates([(date(2024, 1, 9), {'BRL': 6.0, 'EUR': 0.8})])
+        self.assertEqual(self.client.get(url).json()['rates'], [6.25, 7.5]) # Cache invalidado pelo novo upsert
+
+        self.assertEqual(self.client.get('/api/cotacoes/cross/?from=BRL&to=BRL&start_date=2024-01-01&end_date=2024-01-31').status_code, 400)
+        self.assertEqual(self.client.get('/api/cotacoes/cross/?from=EUR&to=BRL').status_code, 400)
+
+    def test_get_cotacoes_db_api_resolution_and_max_points(self):
+        VatComplyService().save_rates([
+            (date(2024, 1, 1) + timedelta(days=i), {'BRL': 5.0 + i / 100, 'EUR': 0.9, 'JPY': 110.0})
+            for i in range(400)
+        ])
+        url = '/api/cotacoes/db/?start_date=2024-01-01&end_date=2025-12-31'
+
+        monthly = self.client.get(url + '&resolution=month')
+        self.assertFalse(monthly.streaming) # Resposta agregada tem tamanho limitado
+        self.assertEqual(len(monthly.json()['dates']), 14)
+        self.assertEqual(monthly.json()['dates'][1], '2024-02-01')
+
+        ohlc = self.client.get(url + '&resolution=week&ohlc=1').json()
+        self.assertEqual(ohlc['BRL']['open'][0], 5.0)
+        self.assertEqual(set(ohlc['EUR']), {'open', 'high', 'low', 'close'})
+
+        reduced = self.client.get(url + '&max_points=50').json()
+        self.assertEqual(len(reduced['dates']), 50)
+        self.assertEqual(reduced['dates'][-1], (date(2024, 1, 1) + timedelta(days=399)).isoformat())
+
+        for params in ('resolution=year', 'max_points=2', 'max_points=abc'):
+            self.assertEqual(self.client.get(f'{url}&{params}').status_code, 400)
+
+    def test_upstream_api_rejects_dates_outside_window(self):
+        for params in ('start_date=0001-01-01&end_date=0001-01-03', 'start_date=9999-12-27&end_date=9999-12-31'):
+            response = self.client.get(f'/api/cotacoes/?{params}')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Datas fora do intervalo aceito', response.json()['error'])
+        with override_settings(COTACOES_API_MIN_DATE=date(1990, 1, 1)):
+            response = self.client.get('/api/cotacoes/?start_date=1998-12-28&end_date=1998-12-29')
+        self.assertNotIn('Datas fora do intervalo aceito', response.content.decode())
+
+    def test_db_apis_read_any_date(self):
+        # Datas importadas antes de 1999 continuam legíveis; extremos não fazem o calendário crescer
+        VatComplyService().save_rates([(date(1995, 3, 1), {'BRL': 0.9, 'EUR': 0.7, 'JPY': 90.0})])
+        response = self.client.get('/api/cotacoes/db/?start_date=1995-01-01&end_date=1995-12-31')
+        self.assertEqual(response.json()['dates'], ['1995-03-01'])
+        for params in ('start_date=0001-01-01&end_date=9999-12-31', 'start_date=9999-12-27&end_date=9999-12-31'):
+            for url in ('/api/cotacoes/db/', '/api/cotacoes/gaps/', '/api/cotacoes/export/'):
+                self.assertEqual(self.client.get(f'{url}?{params}').status_code, 200, url)
+        calendar = get_calendar()
+        self.assertLessEqual(calendar._last.year - calendar._first.year, BusinessCalendar.MAX_INDEX_YEARS)
+
+    def test_get_cotacoes_api_invalid_currencies(self):
+        for currencies in ('BRLX', 'BR1', ''):
+            response = self.client.get(f'/api/cotacoes/db/?currencies={currencies}')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/cotacoes/?start_date=2024-01-08&end_date=2024-01-09&currencies=US-D')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_cotacoes_db_api_conditional_get(self):
+        VatComplyService().save_rates([(date(2024, 1, 8), {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.0})])
+        url = '/api/cotacoes/db/?start_date=2024-01-01&end_date=2024-01-31'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=60', response['Cache-Control']) # Período passado, mas com dias faltando: cache curto
+        self.assertIn('Last-Modified', response)
+
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        # Um novo registro no período muda o ETag
+        VatComplyService().save_rates([(date(2024, 1, 9), {'BRL': 5.30})])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_past_range_long_cache_only_when_complete(self):
+        VatComplyService().save_rates([
+            (date(2024, 1, 8) + timedelta(days=i), {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.0}) for i in (0, 1, 3, 4)
+        ])
+        complete = self.client.get('/api/cotacoes/db/?start_date=2024-01-06&end_date=2024-01-09')
+        self.assertIn('max-age=2592000', complete['Cache-Control'])
+
+        with override_settings(COTACOES_API_DB_ONLY=True): # 10/01 falta no banco
+            for url in ('/api/cotacoes/db/?start_date=2024-01-08&end_date=2024-01-12',
+                        '/api/cotacoes/?start_date=2024-01-08&end_date=2024-01-12'):
+                response = self.client.get(url)
+                self.assertEqual(len(response.json()['dates']), 4)
+                self.assertIn('max-age=60', response['Cache-Control'])
+
+    @patch('core.views.VatComplyService.get_rates_for_period')
+    def test_get_cotacoes_api_not_modified_skips_service(self, mock_get_rates_for_period):
+        VatComplyService().save_rates([
+            (date(2024, 1, 8) + timedelta(days=i), {'BRL': 5.25, 'EUR': 0.85, 'JPY': 110.0}) for i in range(5)
+        ])
+        mock_get_rates_for_period.return_value = [{'date': '2024-01-08', 'rates': {'BRL': 5.25}}]
+        url = '/api/cotacoes/?start_date=2024-01-08&end_date=2024-01-12'
+
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(mock_get_rates_for_period.call_count, 1) # Só a primeira requisição chamou o serviço
@@ -1,8 +1,21 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# No deploy ASGI as duas APIs de séries usam as views assíncronas
+if settings.COTACOES_ASYNC_VIEWS:
+    cotacoes_api, cotacoes_db_api = views.get_cotacoes_api_async, views.get_cotacoes_db_api_async
+else:
+    cotacoes_api, cotacoes_db_api = views.get_cotacoes_api, views.get_cotacoes_db_api
+
 urlpatterns = [
     path('', views.index, name='index'),
-    path('api/cotacoes/', views.get_cotacoes_api, name='get_cotacoes_api'),
-    path('api/cotacoes/db/', views.get_cotacoes_db_api, name='get_cotacoes_db_api'), # API para ler do DB
+    path('api/cotacoes/', cotacoes_api, name='get_cotacoes_api'),
+    path('api/cotacoes/db/', cotacoes_db_api, name='get_cotacoes_db_api'), # API para ler do DB
+    path('api/cotacoes/analytics/', views.get_analytics_api, name='get_analytics_api'), # Indicadores móveis
+    path('api/cotacoes/resumo/', views.get_resumo_api, name='get_resumo_api'), # Resumos mensais/anuais
+    path('api/cotacoes/export/', views.get_export_api, name='get_export_api'), # Exportação CSV/Parquet
+    path('api/cotacoes/cross/', views.get_cross_rates_api, name='get_cross_rates_api'), # Taxas cruzadas (ex.: EUR -> BRL)
+    path('api/cotacoes/gaps/', views.get_gaps_api, name='get_gaps_api'), # Lacunas do índice de cobertura
+    path('metrics', views.metrics_view, name='metrics'), # Métricas no formato do Prometheus
 ]
@@ -1,9 +1,42 @@
 # cotacao_moedas/core/views.py
+import logging
+import tempfile
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import CharField
+from django.db.models.functions import Cast
 from django.shortcuts import render
-from django.http import JsonResponse
-from datetime import datetime, timedelta
+from django.utils.cache import patch_cache_control
+from django.utils import timezone
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from datetime import date, datetime, timedelta
+from . import coverage, metrics
+from .analytics import get_windows, pending_from
+from .async_client import AsyncVatComplyService
+from .business_days import get_calendar
+from .cache import quote_series_cache
+from .columnar import transpose
+from .downsampling import RESOLUTIONS, downsample, resample
+from .export import HAS_PYARROW, export_rows, iter_csv_bytes, write_parquet
+from .http_cache import RangeValidators
 from .services import VatComplyService
-from .models import Cotacao 
+from .summaries import GRANULARITIES, bucket_start
+from .models import Cotacao, IndicadorCotacao, ResumoCotacao, TaxaCambio, aiterate
+
+# Moedas padrão da resposta colunar (as colunas de Cotacao)
+DEFAULT_CURRENCIES = list(Cotacao.CURRENCY_FIELDS)
+# Máximo de moedas aceitas no parâmetro currencies=
+MAX_CURRENCIES = 40
+# Períodos maiores que isso (em dias corridos) são sempre enviados em streaming
+STREAMING_THRESHOLD_DAYS = 366
+# Linhas lidas do banco por vez no streaming
+STREAM_CHUNK_SIZE = 2000
+# Até esse tamanho as colunas de moedas ficam em memória; acima disso vão para disco
+STREAM_SPOOL_MAX_SIZE = 1024 * 1024
+# Menor valor aceito em max_points= (o LTTB sempre mantém o primeiro e o último ponto)
+MIN_MAX_POINTS = 3
+
+logger = logging.getLogger(__name__)
 
 def index(request):
     """
@@ -11,89 +44,733 @@ def index(request):
     """
     return render(request, 'index.html')
 
-def get_cotacoes_api(request):
+def _parse_currencies(request):
     """
-    Endpoint para obter as cotações de moedas da API externa.
-    Essas cotações também serão persistidas no banco de dados.
+    Lê o parâmetro currencies= (códigos ISO 4217 separados por vírgula, ex.: BRL,GBP).
+    Retorna a lista de moedas, sem repetições e na ordem pedida, ou None se for inválido.
+    Sem o parâmetro, retorna as moedas padrão.
+    """
+    raw = request.GET.get('currencies')
+    if raw is None:
+        return list(DEFAULT_CURRENCIES)
+    currencies = []
+    for code in raw.split(','):
+        code = code.strip().upper()
+        if len(code) != 3 or not code.isalpha():
+            return None
+        if code not in currencies:
+            currencies.append(code)
+    if not currencies or len(currencies) > MAX_CURRENCIES:
+        return None
+    return currencies
+
+
+def _parse_resampling(request):
+    """
+    Lê resolution= (day/week/month), ohlc=1 e max_points=.
+    Retorna (resolution, ohlc, max_points) ou None se algum for inválido.
+    """
+    resolution = request.GET.get('resolution', 'day').lower()
+    ohlc = request.GET.get('ohlc', '').lower() in ('1', 'true')
+    max_points = request.GET.get('max_points')
+    if resolution not in RESOLUTIONS:
+        return None
+    if max_points is not None:
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            return None
+        if max_points < MIN_MAX_POINTS:
+            return None
+    return resolution, ohlc, max_points
+
+
+def _upstream_window_error(start_date, end_date):
+    """
+    Resposta 400 se o período sai das datas que a API externa pode ter
+    (settings.COTACOES_API_MIN_DATE até 31/12 do ano que vem), senão None.
+    """
+    min_date = getattr(settings, 'COTACOES_API_MIN_DATE', date(1999, 1, 1))
+    max_date = date(timezone.localdate().year + 1, 12, 31)
+    if start_date < min_date or end_date > max_date:
+        return JsonResponse({'error': f'Datas fora do intervalo aceito: use datas entre {min_date} e {max_date}.'}, status=400)
+    return None
+
+
+def _normalized_currencies(currencies):
+    """
+    None para as moedas padrão (lidas de Cotacao); senão a própria lista (lida de TaxaCambio).
+    """
+    return None if currencies == DEFAULT_CURRENCIES else currencies
+
+
+def _parse_api_request(request):
+    """
+    Valida os parâmetros de get_cotacoes_api. Retorna (resposta de erro, None) ou
+    (None, (start_date, end_date, currencies)).
     """
     start_date_str = request.GET.get('start_date')
     end_date_str = request.GET.get('end_date')
 
     if not start_date_str or not end_date_str:
-        return JsonResponse({'error': 'Datas de início e fim são obrigatórios.'}, status=400)
+        return JsonResponse({'error': 'Datas de início e fim são obrigatórios.'}, status=400), None
+
+    currencies = _parse_currencies(request)
+    if currencies is None:
+        return JsonResponse({'error': 'Parâmetro currencies inválido. Use códigos de 3 letras separados por vírgula (ex.: BRL,GBP).'}, status=400), None
 
     try:
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
     except ValueError:
-        return JsonResponse({'error': 'Formato de data inválido. Use %Y-%m-%d.'}, status=400)
+        return JsonResponse({'error': 'Formato de data inválido. Use %Y-%m-%d.'}, status=400), None
 
     if (end_date - start_date).days < 0:
-        return JsonResponse({'error': 'A data de início deve ser anterior à data de fim.'}, status=400)
+        return JsonResponse({'error': 'A data de início deve ser anterior à data de fim.'}, status=400), None
+    error = _upstream_window_error(start_date, end_date)
+    if error is not None:
+        return error, None
 
-    if (end_date - start_date).days > 6: # Limite de 7 dias corridos para 5 dias úteis
-        return JsonResponse({'error': 'O período máximo permitido é de 5 dias úteis (máximo 7 dias corridos).'}, status=400)
+    # Limite de 5 dias úteis (contados no calendário de feriados), nunca mais de 7 dias corridos
+    if (end_date - start_date).days > 6 or get_calendar().count(start_date, end_date) > 5:
+        return JsonResponse({'error': 'O período máximo permitido é de 5 dias úteis (máximo 7 dias corridos).'}, status=400), None
 
-    service = VatComplyService()
-    cotacoes = service.get_rates_for_period(start_date, end_date) # Isso vai buscar da API externa E salvar no DB
+    return None, (start_date, end_date, currencies)
+
+
+def _cotacoes_response(cotacoes, currencies, validators, request):
+    """
+    Resposta colunar de get_cotacoes_api (ou 304, se o cliente já tem esta versão).
+    """
+    not_modified = validators.not_modified_response(request)
+    if not_modified is not None:
+        return not_modified
+
+    with metrics.timer('cotacoes_serialization_seconds', view='cotacoes'):
+        formatted_data = {'dates': [c['date'] for c in cotacoes]}
+        for currency in currencies:
+            formatted_data[currency] = [c['rates'].get(currency, None) for c in cotacoes]
+        response = JsonResponse(formatted_data, status=200)
+    return validators.apply(response)
+
+
+def get_cotacoes_api(request):
+    """
+    Endpoint para obter as cotações de moedas da API externa.
+    Essas cotações também serão persistidas no banco de dados.
+    Com settings.COTACOES_API_DB_ONLY as cotações vêm apenas do banco, mantido pelo worker
+    de ingestão.
+    Responde com ETag/Last-Modified/Cache-Control e devolve 304 em GETs condicionais.
+    O parâmetro currencies= escolhe as moedas (padrão: BRL,EUR,JPY).
+    """
+    error, params = _parse_api_request(request)
+    if error is not None:
+        return error
+    start_date, end_date, currencies = params
+
+    validators = RangeValidators.for_range(start_date, end_date, _normalized_currencies(currencies))
+    # Período passado e completo: dá para responder 304 sem nem consultar o serviço
+    if validators.is_final:
+        not_modified = validators.not_modified_response(request)
+        if not_modified is not None:
+            return not_modified
+
+    service = VatComplyService(currencies=currencies)
+    # Isso vai buscar da API externa E salvar no DB (exceto no modo somente banco)
+    cotacoes = service.get_rates_for_period(start_date, end_date, fetch_missing=not settings.COTACOES_API_DB_ONLY)
 
     if not cotacoes:
         return JsonResponse({'message': 'Nenhum dado de cotação encontrado da API externa para o período.'}, status=200)
 
-    formatted_data = {
-        'dates': [c['date'] for c in cotacoes],
-        'BRL': [c['rates'].get('BRL', None) for c in cotacoes],
-        'EUR': [c['rates'].get('EUR', None) for c in cotacoes],
-        'JPY': [c['rates'].get('JPY', None) for c in cotacoes],
+    # Validadores recalculados depois do serviço, que pode ter acabado de salvar novos dias
+    validators = RangeValidators.for_range(start_date, end_date, _normalized_currencies(currencies))
+    return _cotacoes_response(cotacoes, currencies, validators, request)
+
+
+async def get_cotacoes_api_async(request):
+    """
+    Versão assíncrona de get_cotacoes_api, para o deploy ASGI (settings.COTACOES_ASYNC_VIEWS):
+    as datas ausentes são buscadas em paralelo por AsyncVatComplyService e o banco é lido
+    com o ORM assíncrono, sem ocupar uma thread enquanto espera a API externa.
+    """
+    error, params = _parse_api_request(request)
+    if error is not None:
+        return error
+    start_date, end_date, currencies = params
+
+    validators = await RangeValidators.afor_range(start_date, end_date, _normalized_currencies(currencies))
+    # Período passado e completo: dá para responder 304 sem nem consultar o serviço
+    if validators.is_final:
+        not_modified = validators.not_modified_response(request)
+        if not_modified is not None:
+            return not_modified
+
+    service = AsyncVatComplyService(currencies=currencies)
+    cotacoes = await service.aget_rates_for_period(start_date, end_date, fetch_missing=not settings.COTACOES_API_DB_ONLY)
+
+    if not cotacoes:
+        return JsonResponse({'message': 'Nenhum dado de cotação encontrado da API externa para o período.'}, status=200)
+
+    validators = await RangeValidators.afor_range(start_date, end_date, _normalized_currencies(currencies))
+    return _cotacoes_response(cotacoes, currencies, validators, request)
+
+
+def _json_number(value):
+    return 'null' if value is None else repr(value)
+
+
+def _stream_cotacoes_json(rows, currencies):
+    """
+    Gera, em pedaços, o JSON colunar {"dates": [...], "BRL": [...], "EUR": [...], "JPY": [...]}.
+    `rows` são tuplas (data, taxa de cada moeda de `currencies`) lidas do banco uma única vez,
+    já convertidas pelo banco (Cotacao.objects.rows() ou TaxaCambio.objects.pivot_rows()),
+    com .iterator(chunk_size=...): as datas saem
+    direto na resposta e os valores de cada moeda vão para arquivos temporários (em memória
+    até STREAM_SPOOL_MAX_SIZE, depois em disco), reenviados ao final. A memória do worker
+    fica constante qualquer que seja o tamanho do período.
+    """
+    spools = _open_spools(currencies)
+    try:
+        yield '{"dates": ['
+        separator = ''
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= STREAM_CHUNK_SIZE:
+                yield _flush_stream_batch(batch, spools, separator)
+                separator = ', '
+                batch = []
+        if batch:
+            yield _flush_stream_batch(batch, spools, separator)
+        yield from _stream_spools(currencies, spools)
+    finally:
+        for spool in spools:
+            spool.close()
+
+
+async def _astream_cotacoes_json(rows, currencies):
+    """
+    Versão assíncrona de _stream_cotacoes_json, para `rows` lidas com async for
+    (models.aiterate() ou apivot_rows()).
+    """
+    spools = _open_spools(currencies)
+    try:
+        yield '{"dates": ['
+        separator = ''
+        batch = []
+        async for row in rows:
+            batch.append(row)
+            if len(batch) >= STREAM_CHUNK_SIZE:
+                yield _flush_stream_batch(batch, spools, separator)
+                separator = ', '
+                batch = []
+        if batch:
+            yield _flush_stream_batch(batch, spools, separator)
+        for chunk in _stream_spools(currencies, spools):
+            yield chunk
+    finally:
+        for spool in spools:
+            spool.close()
+
+
+def _open_spools(currencies):
+    return [tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MAX_SIZE, mode='w+') for _ in currencies]
+
+
+def _stream_spools(currencies, spools):
+    """
+    Reenvia as colunas de cada moeda guardadas nos arquivos temporários e fecha o JSON.
+    """
+    for currency, spool in zip(currencies, spools):
+        yield f'], "{currency}": ['
+        spool.seek(0)
+        while True:
+            chunk = spool.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+    yield ']}'
+
+
+def _flush_stream_batch(batch, spools, separator):
+    """
+    Grava os valores de um lote nas colunas temporárias e retorna o trecho de datas do lote.
+    """
+    for column, spool in enumerate(spools, start=1):
+        spool.write(separator + ', '.join(_json_number(row[column]) for row in batch))
+    return separator + ', '.join(f'"{row[0]}"' for row in batch)
+
+
+class _DbQuery:
+    """
+    Parâmetros validados de get_cotacoes_db_api.
+    """
+
+    def __init__(self, start_date, end_date, currencies, resolution, ohlc, max_points, stream):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.currencies = currencies
+        self.normalized = _normalized_currencies(currencies)
+        self.resolution = resolution
+        self.ohlc = ohlc
+        self.max_points = max_points
+        self.resampled = resolution != 'day' or ohlc or max_points is not None
+        self.variant = f'{resolution}|{int(ohlc)}|{max_points}' if self.resampled else ''
+        self.has_range = start_date is not None
+        # Para dados do banco, não aplicamos o limite de 5 dias úteis,
+        # pois são dados históricos que já foram coletados.
+        self.streaming = self.has_range and not self.resampled and (
+            stream or (end_date - start_date).days > STREAMING_THRESHOLD_DAYS
+        )
+
+    def range_queryset(self):
+        if self.normalized is None:
+            return Cotacao.objects.in_range(self.start_date, self.end_date)
+        return TaxaCambio.objects.for_base(VatComplyService.BASE_CURRENCY).filter(data__range=(self.start_date, self.end_date))
+
+    def recent_days(self):
+        """
+        Query das 30 datas mais recentes com alguma das moedas (tabela normalizada).
+        """
+        return (
+            TaxaCambio.objects.for_base(VatComplyService.BASE_CURRENCY).filter(moeda__in=self.currencies).order_by('-data')
+            .values_list('data', flat=True).distinct()[:30]
+        )
+
+    def recent_queryset(self, recent_days=None):
+        if self.normalized is None:
+            return Cotacao.objects.all().order_by('-data')[:30] # Ordena decrescente e pega as 30 últimas
+        return TaxaCambio.objects.for_base(VatComplyService.BASE_CURRENCY).filter(
+            data__gte=min(recent_days, default=datetime.max.date())
+        )
+
+
+def _parse_db_request(request):
+    """
+    Valida os parâmetros de get_cotacoes_db_api. Retorna (resposta de erro, None) ou (None, _DbQuery).
+    """
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+    stream = request.GET.get('stream', '').lower() in ('1', 'true')
+    currencies = _parse_currencies(request)
+    if currencies is None:
+        return JsonResponse({'error': 'Parâmetro currencies inválido. Use códigos de 3 letras separados por vírgula (ex.: BRL,GBP).'}, status=400), None
+    resampling = _parse_resampling(request)
+    if resampling is None:
+        return JsonResponse({'error': f'Parâmetros de agregação inválidos. Use resolution={"|".join(RESOLUTIONS)}, ohlc=1 e max_points >= {MIN_MAX_POINTS}.'}, status=400), None
+
+    start_date = end_date = None
+    if start_date_str and end_date_str:
+        try:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return JsonResponse({'error': 'Formato de data inválido. Use %Y-%m-%d.'}, status=400), None
+
+        if (end_date - start_date).days < 0:
+            return JsonResponse({'error': 'A data de início deve ser anterior à data de fim.'}, status=400), None
+    return None, _DbQuery(start_date, end_date, currencies, *resampling, stream)
+
+
+def _cached_series_response(request, cached, start_date, end_date):
+    """
+    Resposta (ou 304) a partir de uma entrada do cache de séries, com os mesmos validadores
+    e Cache-Control da resposta que a gerou. Compartilhada por todas as views que usam o cache.
+    """
+    validators = RangeValidators(start_date, end_date, cached['etag'], cached['last_modified'], cached['count'])
+    not_modified = validators.not_modified_response(request)
+    if not_modified is not None:
+        return not_modified
+    return validators.apply(HttpResponse(cached['payload'], content_type='application/json'))
+
+
+def _series_cache_entry(response, validators):
+    """
+    Entrada do cache de séries para uma resposta montada com os validadores do período.
+    """
+    return {
+        'payload': response.content,
+        'etag': validators.etag,
+        'last_modified': validators.last_modified,
+        'count': validators.count,
     }
 
-    return JsonResponse(formatted_data, status=200)
+
+def _db_response(query, formatted_data, validators):
+    """
+    Aplica agregação/LTTB à série colunar e monta a resposta. Retorna (resposta, entrada
+    para o cache de séries ou None).
+    """
+    if not formatted_data['dates']:
+        return JsonResponse({'message': 'Nenhum dado de cotação encontrado no banco de dados para o período especificado.'}, status=200), None
+
+    if query.resampled:
+        formatted_data = resample(formatted_data, query.currencies, query.resolution, query.ohlc)
+        if query.max_points is not None:
+            formatted_data = downsample(formatted_data, query.currencies, query.max_points)
+
+    with metrics.timer('cotacoes_serialization_seconds', view='db'):
+        response = validators.apply(JsonResponse(formatted_data, status=200))
+    if not query.has_range:
+        return response, None
+    return response, _series_cache_entry(response, validators)
 
 
 def get_cotacoes_db_api(request):
     """
     NOVA API: Endpoint para obter as cotações de moedas diretamente do banco de dados.
     Permite filtrar por data de início e fim.
+    Com stream=1 (ou períodos maiores que STREAMING_THRESHOLD_DAYS) a resposta é enviada
+    em streaming, com memória constante.
+    Responde com ETag/Last-Modified/Cache-Control e devolve 304 em GETs condicionais.
+    Respostas de períodos (não streaming) ficam no cache de dois níveis e são servidas sem
+    tocar no banco até novas cotações serem gravadas no período.
+    O parâmetro currencies= escolhe as moedas (padrão: BRL,EUR,JPY); fora do padrão, as
+    séries vêm da tabela normalizada TaxaCambio.
+    resolution=week|month agrega pela média do período, ohlc=1 devolve abertura/máxima/
+    mínima/fechamento de cada período e max_points= reduz a série com LTTB. Essas respostas
+    têm tamanho limitado e nunca são enviadas em streaming.
+    """
+    error, query = _parse_db_request(request)
+    if error is not None:
+        return error
+
+    if query.has_range:
+        if not query.streaming:
+            cached = quote_series_cache.get(query.start_date, query.end_date, query.currencies, query.variant)
+            if cached is not None:
+                return _cached_series_response(request, cached, query.start_date, query.end_date)
+
+        validators = RangeValidators.for_range(query.start_date, query.end_date, query.normalized)
+        not_modified = validators.not_modified_response(request)
+        if not_modified is not None:
+            return not_modified
+
+        cotacoes_db = query.range_queryset()
+        if query.streaming:
+            if query.normalized is None:
+                rows = cotacoes_db.rows().iterator(chunk_size=STREAM_CHUNK_SIZE)
+            else:
+                rows = cotacoes_db.pivot_rows(query.currencies, chunk_size=STREAM_CHUNK_SIZE)
+            response = StreamingHttpResponse(_stream_cotacoes_json(rows, query.currencies), content_type='application/json')
+            return validators.apply(response)
+    else:
+        # Se não houver datas no parâmetro, retorna as últimas 30 cotações do banco, por exemplo.
+        logger.debug("Nenhuma data especificada, retornando as 30 últimas cotações do banco.")
+        validators = RangeValidators.for_range(currencies=query.normalized)
+        not_modified = validators.not_modified_response(request)
+        if not_modified is not None:
+            return not_modified
+        recent_days = list(query.recent_days()) if query.normalized is not None else None
+        cotacoes_db = query.recent_queryset(recent_days)
+
+    # Uma única query já no formato colunar esperado pelo frontend
+    if query.normalized is None:
+        formatted_data = cotacoes_db.columns()
+    else:
+        formatted_data = cotacoes_db.series(query.currencies, descending=not query.has_range)
+
+    response, entry = _db_response(query, formatted_data, validators)
+    if entry is not None:
+        quote_series_cache.set(query.start_date, query.end_date, query.currencies, entry, query.variant)
+    return response
+
+
+async def get_cotacoes_db_api_async(request):
+    """
+    Versão assíncrona de get_cotacoes_db_api (mesmos parâmetros e respostas), com o ORM
+    assíncrono. O streaming lê o cursor com async for; o cache de séries, que pode estar
+    num backend síncrono, é consultado numa thread.
+    """
+    error, query = _parse_db_request(request)
+    if error is not None:
+        return error
+
+    if query.has_range:
+        if not query.streaming:
+            cached = await sync_to_async(quote_series_cache.get)(query.start_date, query.end_date, query.currencies, query.variant)
+            if cached is not None:
+                return _cached_series_response(request, cached, query.start_date, query.end_date)
+
+        validators = await RangeValidators.afor_range(query.start_date, query.end_date, query.normalized)
+        not_modified = validators.not_modified_response(request)
+        if not_modified is not None:
+            return not_modified
+
+        cotacoes_db = query.range_queryset()
+        if query.streaming:
+            if query.normalized is None:
+                rows = aiterate(cotacoes_db.rows(), STREAM_CHUNK_SIZE)
+            else:
+                rows = cotacoes_db.apivot_rows(query.currencies, chunk_size=STREAM_CHUNK_SIZE)
+            response = StreamingHttpResponse(_astream_cotacoes_json(rows, query.currencies), content_type='application/json')
+            return validators.apply(response)
+    else:
+        validators = await RangeValidators.afor_range(currencies=query.normalized)
+        not_modified = validators.not_modified_response(request)
+        if not_modified is not None:
+            return not_modified
+        recent_days = [day async for day in query.recent_days()] if query.normalized is not None else None
+        cotacoes_db = query.recent_queryset(recent_days)
+
+    if query.normalized is None:
+        formatted_data = await cotacoes_db.acolumns()
+    else:
+        formatted_data = await cotacoes_db.aseries(query.currencies, descending=not query.has_range)
+
+    response, entry = _db_response(query, formatted_data, validators)
+    if entry is not None:
+        await sync_to_async(quote_series_cache.set)(query.start_date, query.end_date, query.currencies, entry, query.variant)
+    return response
+
+def get_cross_rates_api(request):
+    """
+    Taxas cruzadas de um par qualquer (ex.: from=EUR&to=BRL) num período, derivadas das
+    cotações em USD salvas no banco (TaxaCambio), sem chamadas à API externa.
+    Responde {'from': ..., 'to': ..., 'dates': [...], 'rates': [...]}; cada par e período
+    fica no cache de dois níveis até novas cotações serem gravadas no período.
+    """
+    from_currency = request.GET.get('from', '').strip().upper()
+    to_currency = request.GET.get('to', '').strip().upper()
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+
+    if not start_date_str or not end_date_str:
+        return JsonResponse({'error': 'Datas de início e fim são obrigatórios.'}, status=400)
+
+    for code in (from_currency, to_currency):
+        if len(code) != 3 or not code.isalpha():
+            return JsonResponse({'error': 'Parâmetros from e to devem ser códigos de moeda de 3 letras (ex.: EUR, BRL).'}, status=400)
+    if from_currency == to_currency:
+        return JsonResponse({'error': 'As moedas from e to devem ser diferentes.'}, status=400)
+
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Formato de data inválido. Use %Y-%m-%d.'}, status=400)
+
+    if (end_date - start_date).days < 0:
+        return JsonResponse({'error': 'A data de início deve ser anterior à data de fim.'}, status=400)
+
+    pair = [f'{from_currency}/{to_currency}']
+    cached = quote_series_cache.get(start_date, end_date, pair)
+    if cached is not None:
+        return _cached_series_response(request, cached, start_date, end_date)
+
+    base = VatComplyService.BASE_CURRENCY
+    validators = RangeValidators.for_range(
+        start_date, end_date, [currency for currency in (from_currency, to_currency) if currency != base]
+    )
+    not_modified = validators.not_modified_response(request)
+    if not_modified is not None:
+        return not_modified
+
+    series = TaxaCambio.objects.filter(data__range=(start_date, end_date)).cross_rates(from_currency, to_currency, base)
+    if not series['dates']:
+        return JsonResponse({'message': 'Nenhum dado de cotação encontrado no banco de dados para o período especificado.'}, status=200)
+
+    response = validators.apply(JsonResponse({'from': from_currency, 'to': to_currency, **series}, status=200))
+    quote_series_cache.set(start_date, end_date, pair, _series_cache_entry(response, validators))
+    return response
+
+
+def get_analytics_api(request):
+    """
+    Indicadores móveis (SMA, EMA, desvio padrão da janela e retorno diário) de uma moeda num
+    período, lidos de IndicadorCotacao, que é mantido incrementalmente pelo worker de ingestão.
+    Parâmetros: currency (padrão BRL), window (uma das janelas de
+    settings.COTACOES_ANALYTICS_WINDOWS; padrão a menor), start_date e end_date.
     """
+    currency = request.GET.get('currency', 'BRL').strip().upper()
     start_date_str = request.GET.get('start_date')
     end_date_str = request.GET.get('end_date')
+    windows = get_windows()
 
-    query_params_present = bool(start_date_str and end_date_str)
+    if not start_date_str or not end_date_str:
+        return JsonResponse({'error': 'Datas de início e fim são obrigatórios.'}, status=400)
+    if currency not in Cotacao.CURRENCY_FIELDS:
+        return JsonResponse({'error': f'Moeda inválida. Use uma de: {", ".join(Cotacao.CURRENCY_FIELDS)}.'}, status=400)
+    try:
+        window = int(request.GET.get('window', windows[0] if windows else 0))
+    except ValueError:
+        window = None
+    if window not in windows:
+        return JsonResponse({'error': f'Janela inválida. Use uma de: {", ".join(str(w) for w in windows)}.'}, status=400)
 
-    if query_params_present:
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Formato de data inválido. Use %Y-%m-%d.'}, status=400)
+
+    if (end_date - start_date).days < 0:
+        return JsonResponse({'error': 'A data de início deve ser anterior à data de fim.'}, status=400)
+
+    # Os indicadores derivam de Cotacao: os validadores do período valem para eles também,
+    # exceto enquanto o worker não recalculou o período (o ETag já seria o das cotações novas)
+    pending = pending_from()
+    stale = pending is not None and pending <= end_date
+    validators = RangeValidators.for_range(start_date, end_date)
+    if not stale:
+        not_modified = validators.not_modified_response(request)
+        if not_modified is not None:
+            return not_modified
+
+    rows = (
+        IndicadorCotacao.objects
+        .filter(moeda=currency, janela=window, data__range=(start_date, end_date))
+        .annotate(data_str=Cast('data', CharField()))
+        .order_by('data')
+        .values_list('data_str', 'sma', 'ema', 'desvio_padrao', 'retorno')
+    )
+    dates, sma, ema, std, returns = transpose(list(rows), 5)
+    if not dates:
+        return JsonResponse({'message': 'Nenhum indicador encontrado no banco de dados para o período especificado.'}, status=200)
+
+    response = JsonResponse({
+        'currency': currency,
+        'window': window,
+        'dates': dates,
+        'sma': sma,
+        'ema': ema,
+        'std': std,
+        'returns': returns,
+    }, status=200)
+    if stale:
+        patch_cache_control(response, no_cache=True)
+        return response
+    return validators.apply(response)
+
+
+def get_resumo_api(request):
+    """
+    Resumos mensais (periodo=month, padrão) ou anuais (periodo=year) das cotações: média,
+    mínima, máxima e dias com cotação de cada moeda, lidos de ResumoCotacao (um registro por
+    período e moeda, mantido a cada ingestão). start_date/end_date são opcionais e limitam
+    os períodos devolvidos.
+    """
+    periodo = request.GET.get('periodo', 'month').lower()
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+    currencies = _parse_currencies(request)
+
+    if periodo not in GRANULARITIES:
+        return JsonResponse({'error': f'Período inválido. Use {" ou ".join(GRANULARITIES)}.'}, status=400)
+    if currencies is None or not set(currencies) <= set(Cotacao.CURRENCY_FIELDS):
+        return JsonResponse({'error': f'Parâmetro currencies inválido. Use moedas entre: {", ".join(Cotacao.CURRENCY_FIELDS)}.'}, status=400)
+
+    resumos = ResumoCotacao.objects.filter(periodo=periodo, moeda__in=currencies)
+    if start_date_str or end_date_str:
         try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            if start_date_str:
+                resumos = resumos.filter(inicio__gte=bucket_start(datetime.strptime(start_date_str, '%Y-%m-%d').date(), periodo))
+            if end_date_str:
+                resumos = resumos.filter(inicio__lte=datetime.strptime(end_date_str, '%Y-%m-%d').date())
         except ValueError:
             return JsonResponse({'error': 'Formato de data inválido. Use %Y-%m-%d.'}, status=400)
 
+    formatted_data = {'periodo': periodo, 'dates': []}
+    for currency in currencies:
+        formatted_data[currency] = {'avg': [], 'min': [], 'max': [], 'days': []}
+    rows = resumos.order_by('inicio', 'moeda').values_list('inicio', 'moeda', 'media', 'minimo', 'maximo', 'dias')
+    for inicio, moeda, media, minimo, maximo, dias in rows:
+        label = inicio.isoformat()
+        if not formatted_data['dates'] or formatted_data['dates'][-1] != label:
+            formatted_data['dates'].append(label)
+        column = formatted_data[moeda]
+        column['avg'].append(media)
+        column['min'].append(minimo)
+        column['max'].append(maximo)
+        column['days'].append(dias)
+
+    if not formatted_data['dates']:
+        return JsonResponse({'message': 'Nenhum resumo encontrado no banco de dados para o período especificado.'}, status=200)
+    return JsonResponse(formatted_data, status=200)
+
+
+def get_export_api(request):
+    """
+    Exportação em massa das cotações do banco, para análises fora da aplicação.
+    format=csv (padrão; com gzip=1 comprimido durante o envio) ou format=parquet (requer
+    pyarrow). start_date/end_date são opcionais (sem eles, todo o histórico) e currencies=
+    escolhe as moedas. As linhas são lidas com um cursor do lado do servidor e escritas em
+    blocos, com memória constante.
+    """
+    export_format = request.GET.get('format', 'csv').lower()
+    compress = request.GET.get('gzip', '').lower() in ('1', 'true')
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+    currencies = _parse_currencies(request)
+
+    if export_format not in ('csv', 'parquet'):
+        return JsonResponse({'error': 'Formato inválido. Use csv ou parquet.'}, status=400)
+    if export_format == 'parquet' and not HAS_PYARROW:
+        return JsonResponse({'error': 'Exportação em Parquet indisponível: o pacote pyarrow não está instalado.'}, status=501)
+    if currencies is None:
+        return JsonResponse({'error': 'Parâmetro currencies inválido. Use códigos de 3 letras separados por vírgula (ex.: BRL,GBP).'}, status=400)
+
+    start_date = end_date = None
+    if start_date_str or end_date_str:
+        try:
+            start_date = datetime.strptime(start_date_str or '', '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date_str or '', '%Y-%m-%d').date()
+        except ValueError:
+            return JsonResponse({'error': 'Formato de data inválido. Use %Y-%m-%d (start_date e end_date juntos).'}, status=400)
         if (end_date - start_date).days < 0:
             return JsonResponse({'error': 'A data de início deve ser anterior à data de fim.'}, status=400)
 
-        # Para dados do banco, não aplicamos o limite de 5 dias úteis,
-        # pois são dados históricos que já foram coletados.
-        cotacoes_db = Cotacao.objects.filter(data__range=(start_date, end_date)).order_by('data')
-    else:
-        # Se não houver datas no parâmetro, retorna as últimas 30 cotações do banco, por exemplo.
-        print("DEBUG: Nenhuma data especificada, retornando as 30 últimas cotações do banco.")
-        cotacoes_db = Cotacao.objects.all().order_by('-data')[:30] # Ordena decrescente e pega as 30 últimas
+    currencies, rows = export_rows(start_date, end_date, currencies)
+    if export_format == 'parquet':
+        # O rodapé do Parquet só é escrito no final: o arquivo é montado num temporário
+        # (em disco acima de STREAM_SPOOL_MAX_SIZE) e enviado em seguida
+        spool = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MAX_SIZE)
+        write_parquet(rows, currencies, spool)
+        spool.seek(0)
+        return FileResponse(spool, as_attachment=True, filename='cotacoes.parquet', content_type='application/vnd.apache.parquet')
 
-    if not cotacoes_db.exists():
-        return JsonResponse({'message': 'Nenhum dado de cotação encontrado no banco de dados para o período especificado.'}, status=200)
+    filename = 'cotacoes.csv.gz' if compress else 'cotacoes.csv'
+    response = StreamingHttpResponse(
+        iter_csv_bytes(rows, currencies, compress),
+        content_type='application/gzip' if compress else 'text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
-    # Formata os dados do QuerySet para o formato JSON esperado pelo frontend
-    formatted_data = {
-        'dates': [],
-        'BRL': [],
-        'EUR': [],
-        'JPY': [],
-    }
 
-    for cotacao in cotacoes_db:
-        formatted_data['dates'].append(cotacao.data.strftime('%Y-%m-%d'))
-        # Converte Decimal para float antes de adicionar ao JSON
-        formatted_data['BRL'].append(float(cotacao.valor_brl) if cotacao.valor_brl is not None else None)
-        formatted_data['EUR'].append(float(cotacao.valor_eur) if cotacao.valor_eur is not None else None)
-        formatted_data['JPY'].append(float(cotacao.valor_jpy) if cotacao.valor_jpy is not None else None)
+def get_gaps_api(request):
+    """
+    Lacunas do período no índice de cobertura (CoberturaCotacao): os intervalos de dias
+    úteis ainda sem cotação no banco, com a quantidade de dias de cada um. Não consulta a
+    API externa; para preencher as lacunas use backfill_cotacoes ou ingest_cotacoes.
+    """
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+    if not start_date_str or not end_date_str:
+        return JsonResponse({'error': 'Parâmetros start_date e end_date são obrigatórios.'}, status=400)
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Formato de data inválido. Use %Y-%m-%d.'}, status=400)
+    if (end_date - start_date).days < 0:
+        return JsonResponse({'error': 'A data de início deve ser anterior à data de fim.'}, status=400)
+
+    gaps = coverage.gaps(start_date, end_date)
+    return JsonResponse({
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'complete': not gaps,
+        'missing_days': sum(days for _, _, days in gaps),
+        'gaps': [{'start': first.isoformat(), 'end': last.isoformat(), 'days': days} for first, last, days in gaps],
+    }, status=200)
 
-    return JsonResponse(formatted_data, status=200)
\ No newline at end of file
+
+def metrics_view(request):
+    """
+    Contadores e timers do processo no formato texto do Prometheus. Responde 404 com as
+    métricas desligadas (settings.COTACOES_METRICS_ENABLED).
+    """
+    if not metrics.enabled():
+        raise Http404("Métricas desligadas.")
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
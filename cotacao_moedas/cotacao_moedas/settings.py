@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import os
+from datetime import date
 from pathlib import Path
 import dj_database_url
 
@@ -98,6 +99,100 @@ else:
     }
 
 
+# Integração com a API de cotações
+# Endpoint opcional de série temporal ({'rates': {'YYYY-MM-DD': {...}}}) usado para buscar
+# um período inteiro em uma única chamada. Sem ele, cada dia útil é buscado em /rates.
+VATCOMPLY_RANGE_URL = os.environ.get('VATCOMPLY_RANGE_URL')
+
+# Com o worker de ingestão (manage.py ingest_cotacoes) rodando, /api/cotacoes/ pode ler só
+# do banco e nunca esperar pela API externa
+COTACOES_API_DB_ONLY = os.environ.get('COTACOES_API_DB_ONLY', 'False') == 'True'
+
+# Segundos em que a cotação de hoje, que pode mudar ao longo do dia, é reaproveitada do banco
+# por /api/cotacoes/; sem valor ela é sempre buscada de novo na API externa
+COTACOES_TODAY_TTL = int(os.environ['COTACOES_TODAY_TTL']) if os.environ.get('COTACOES_TODAY_TTL') else None
+
+# Primeira data que /api/cotacoes/ busca na API externa (início das cotações do BCE, fonte
+# da VatComply). As APIs que só leem do banco não têm limite de datas
+COTACOES_API_MIN_DATE = date.fromisoformat(os.environ.get('COTACOES_API_MIN_DATE', '1999-01-01'))
+
+# Teto de requisições simultâneas à API externa por host, somando todas as buscas do processo
+# (views, backfill, worker); cada busca pode pedir um limite menor
+COTACOES_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('COTACOES_MAX_CONNECTIONS_PER_HOST', '8'))
+
+# Calendário de dias úteis: 'target' (feriados do BCE, fonte da VatComply), 'br', 'none'
+# ou o caminho de um arquivo com uma data YYYY-MM-DD por linha
+COTACOES_HOLIDAY_CALENDAR = os.environ.get('COTACOES_HOLIDAY_CALENDAR', 'target')
+
+
+# Cache
+# O 2º nível do cache de séries de cotações (core/cache.py) precisa ser compartilhado entre
+# os workers: Redis se REDIS_URL estiver definido, senão um diretório local.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', str(BASE_DIR / '.django_cache')),
+        }
+    }
+# Alias do cache compartilhado e tamanho do LRU em memória de cada processo
+COTACOES_CACHE_ALIAS = 'default'
+COTACOES_LOCAL_CACHE_SIZE = 256
+# Segundos em que cada processo reaproveita as gerações lidas do cache compartilhado (um
+# acerto no LRU local não vai ao Redis); invalidações de outros processos aparecem nesse prazo
+COTACOES_GENERATION_TTL = int(os.environ.get('COTACOES_GENERATION_TTL', '5'))
+# Buscas simultâneas da mesma data em processos diferentes são coordenadas por um lock no
+# cache. Ligado por padrão só com o Redis, onde o add() é atômico; no cache em arquivo o lock
+# não é confiável e cada busca pagaria as escritas e leituras dele em disco
+COTACOES_SINGLE_FLIGHT_SHARED = os.environ.get('COTACOES_SINGLE_FLIGHT_SHARED', str(bool(REDIS_URL))) == 'True'
+
+# Com o deploy ASGI (uvicorn/daphne), /api/cotacoes/ e /api/cotacoes/db/ usam as views
+# assíncronas (core.async_client); com gunicorn/WSGI mantenha as síncronas
+COTACOES_ASYNC_VIEWS = os.environ.get('COTACOES_ASYNC_VIEWS', 'False') == 'True'
+
+# Janelas (em dias com cotação) dos indicadores móveis mantidos a cada ingestão (core.analytics)
+COTACOES_ANALYTICS_WINDOWS = [int(window) for window in os.environ.get('COTACOES_ANALYTICS_WINDOWS', '5,21').split(',') if window.strip()]
+
+
+# Observabilidade
+# Nível do log do app core (DEBUG, INFO, WARNING...). O padrão WARNING deixa desligadas as
+# mensagens de cada dia buscado; as linhas saem em stderr no formato chave=valor
+COTACOES_LOG_LEVEL = os.environ.get('COTACOES_LOG_LEVEL', 'WARNING').upper()
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'keyvalue': {
+            'format': 'time=%(asctime)s level=%(levelname)s logger=%(name)s msg="%(message)s"',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'keyvalue',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': COTACOES_LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+# Contadores e timers por etapa (API externa, upsert, serialização, cache) expostos em
+# /metrics no formato do Prometheus (core.metrics). Desligados, o custo é desprezível
+COTACOES_METRICS_ENABLED = os.environ.get('COTACOES_METRICS_ENABLED', 'False') == 'True'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 